@@ -0,0 +1,72 @@
+"""Mide líneas/s del filtro de salida de la terminal, antes y después del motor compilado.
+
+Uso: python benchmarks/bench_filter.py [LOG_DE_EGGS_PRODUCE]
+
+Sin argumento se usa un log sintético con la mezcla típica de `eggs produce`
+(rsync, mksquashfs con colores, mensajes de pacman y git).
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import logtools  # noqa: E402
+
+# Filtro original de EggsMakerApp: recompila la regex y recorre cada patrón por línea
+_OLD_PATTERNS = list(logtools.INSTALLER_NOISE) + ['\x1b[']
+
+
+def old_filter(line):
+    import re
+    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+    line = ansi_escape.sub('', line).strip()
+    if not line or not line.strip():
+        return None
+    if any(pattern in line for pattern in _OLD_PATTERNS):
+        return None
+    return line
+
+
+def synthetic_log(count=200000):
+    rnd = random.Random(1)
+    lines = []
+    for i in range(count):
+        r = rnd.random()
+        if r < 0.05:
+            lines.append(rnd.choice(logtools.INSTALLER_NOISE) + ' 42')
+        elif r < 0.25:
+            lines.append('\x1b[1;32m[ 23%]\x1b[0m Parallel mksquashfs: Using 8 processors')
+        elif r < 0.30:
+            lines.append('')
+        else:
+            lines.append(f'usr/share/icons/hicolor/48x48/apps/application-{i}.png')
+    return lines
+
+
+def bench(name, func, lines, rounds=3):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        shown = sum(1 for line in lines if func(line) is not None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:>10}: {len(lines) / best:12,.0f} líneas/s  ({shown} visibles)")
+    return best
+
+
+def main(argv):
+    if len(argv) > 1:
+        with open(argv[1], encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    else:
+        lines = synthetic_log()
+    print(f"{len(lines)} líneas")
+    before = bench('antes', old_filter, lines)
+    after = bench('después', logtools.INSTALLER.filter, lines)
+    print(f"{'mejora':>10}: x{before / after:.1f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
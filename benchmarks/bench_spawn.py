@@ -0,0 +1,65 @@
+"""Mide la latencia de lanzar un comando corto, con shell de login y con argv directo.
+
+Uso: python benchmarks/bench_spawn.py [--sudo] [VECES]
+
+Cada variante ejecuta `eggs --version` (o `true` si eggs no está instalado)
+VECES veces a través del supervisor y muestra la mediana. Con --sudo se pide
+la contraseña y se comparan además las variantes como root: sudo por comando
+con bash -lc, sudo por comando con argv y el ayudante privilegiado.
+"""
+import asyncio
+import getpass
+import os
+import shutil
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import supervisor  # noqa: E402
+
+
+async def bench(name, sup, cmd, times, **kwargs):
+    samples = []
+    for _ in range(times):
+        start = time.perf_counter()
+        await sup.capture(cmd, **kwargs)
+        samples.append(time.perf_counter() - start)
+    median = statistics.median(samples)
+    print(f"{name:>28}: {median * 1000:8.1f} ms  (mín {min(samples) * 1000:.1f} ms)")
+    return median
+
+
+async def run(times, use_sudo):
+    argv = ['eggs', '--version'] if shutil.which('eggs') else ['true']
+    line = supervisor.command_line(argv)
+    print(f"{line}, {times} veces")
+    sup = supervisor.Supervisor()
+    before = await bench('bash -lc (antes)', sup, ['bash', '-lc', line], times)
+    await bench('/bin/bash -c', sup, line, times)
+    after = await bench('argv (después)', sup, argv, times, clean_env=True)
+    print(f"{'mejora':>28}: x{before / after:.1f}")
+    if not use_sudo:
+        return
+    if not await sup.authenticate(getpass.getpass('Contraseña de sudo: ')):
+        print('Contraseña incorrecta')
+        return
+    before = await bench('sudo bash -lc (antes)', sup, line, times, sudo=True, clean_env=True)
+    await bench('sudo argv', sup, argv, times, sudo=True, clean_env=True)
+    if await sup.start_helper():
+        after = await bench('ayudante argv (después)', sup, argv, times, sudo=True, clean_env=True)
+        print(f"{'mejora':>28}: x{before / after:.1f}")
+    else:
+        print('El ayudante privilegiado no arrancó')
+    await sup.shutdown()
+
+
+def main(argv):
+    use_sudo = '--sudo' in argv
+    args = [arg for arg in argv[1:] if arg != '--sudo']
+    asyncio.run(run(int(args[0]) if args else 50, use_sudo))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
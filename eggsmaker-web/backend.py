@@ -1,12 +1,19 @@
 import asyncio
+import json
 import os
-import shlex
+import re
+import shutil
 import socket
 import sys
+import tempfile
 import gettext
 import locale
 from typing import Tuple
 
+import logtools
+import privhelper
+import supervisor
+
 # Import version info
 try:
     from version import __version__, __app__
@@ -14,12 +21,60 @@ except ImportError:
     __version__ = "0.0.0"
     __app__ = "Eggsmaker"
 
+# dd status=progress: "123456789 bytes (123 MB, 118 MiB) copied, 2 s, 61.7 MB/s"
+# The words are localized and comma-decimal locales put commas inside the
+# parentheses ("(1,2 GB, 1,1 GiB) copiados, 20,0023 s"), so the seconds are
+# looked for after the closing parenthesis (absent below 1 kB)
+DD_PROGRESS_RE = re.compile(r'^(\d+) bytes\b(?:[^()]*\([^)]*\))?[^,]*,\s*(\d+(?:[.,]\d+)?)\s*s\b')
+
+
+def parse_dd_progress(line: str) -> Tuple[int, float] | None:
+    """Return (bytes copied, elapsed seconds) for a dd progress line"""
+    m = DD_PROGRESS_RE.match(line.strip())
+    if not m:
+        return None
+    try:
+        return int(m.group(1)), float(m.group(2).replace(',', '.'))
+    except ValueError:
+        return None
+
+
 class EggsmakerBackend:
     def __init__(self):
-        self.sudo_password: str | None = None
+        self.supervisor = supervisor.Supervisor()
+        # After login a resident root helper serves file operations and
+        # launches root commands without a sudo per command
+        self.supervisor.use_helper = True
+        # Result dict of the last run_stream (status tells a cancel from a failure)
+        self.last_result: dict | None = None
+        # Called when a run_stream ends, so batched log output is written out
+        self.on_job_end = None
         self.base_path = self.get_base_path()
         self._setup_i18n()
 
+    @property
+    def sudo_password(self) -> str | None:
+        return self.supervisor.sudo_password
+
+    @sudo_password.setter
+    def sudo_password(self, value: str | None) -> None:
+        self.supervisor.sudo_password = value
+
+    async def login(self, password: str) -> bool:
+        """Validate the sudo password once; later commands reuse the cached credential"""
+        return await self.supervisor.authenticate(password)
+
+    @property
+    def current_job(self) -> str | None:
+        """Id of the on-disk log of the last command started by run_stream"""
+        job = self.supervisor.last_job
+        return job.id if job else None
+
+    @property
+    def running_jobs(self) -> dict:
+        """Jobs whose process is still running (their log may still grow)"""
+        return self.supervisor.jobs
+
     def get_base_path(self) -> str:
         """Obtiene la ruta base de la aplicación, funciona tanto en desarrollo como compilado"""
         try:
@@ -70,97 +125,186 @@ class EggsmakerBackend:
             IP = '127.0.0.1'
         return IP
 
-    async def run_stream(self, cmd: str, log_callback) -> int:
-        wrapped = cmd
-        if self.sudo_password:
-            cmd_no_sudo = cmd.lstrip()
-            if cmd_no_sudo.startswith('sudo '):
-                cmd_no_sudo = cmd_no_sudo[len('sudo '):]
-            safe_path = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
-            # Sanitize environment variables to prevent AppImage interference
-            env_vars = "LD_PRELOAD= LD_LIBRARY_PATH= APPIMAGE= APPDIR= PYTHONPATH="
-            wrapped = (
-                f"printf '%s\\n' {shlex.quote(self.sudo_password)} | "
-                f"sudo -SE env {env_vars} PATH={safe_path} bash -lc {shlex.quote(cmd_no_sudo)}"
-            )
-        
+    def _emit_line(self, text: str, log_callback, progress_callback, line_filter) -> None:
+        # Strips ANSI codes and drops blank/noise lines in a single pass
+        line = line_filter.filter(text)
+        if line is None:
+            return
+        if progress_callback:
+            parsed = parse_dd_progress(line)
+            if parsed:
+                # Progress meters update the bar instead of flooding the log
+                progress_callback(*parsed)
+                return
         if log_callback:
-            log_callback(f"$ {wrapped}")
-            
-        process = await asyncio.create_subprocess_shell(
-            wrapped,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
-            executable="/bin/bash",
-        )
-        
-        # Read stdout line by line
-        if process.stdout:
-            while True:
-                line = await process.stdout.readline()
-                if not line:
-                    break
-                try:
-                    decoded_line = line.decode(errors='ignore').rstrip()
-                except:
-                    decoded_line = line.decode('utf-8', errors='ignore').rstrip()
-                
-                if log_callback:
-                    log_callback(decoded_line)
-                
-                # Yield control to allow UI updates
-                await asyncio.sleep(0)
-                    
-        rc = await process.wait()
-        return rc
-
-    async def run_capture(self, cmd: str) -> Tuple[int, str]:
-        wrapped = cmd
-        if self.sudo_password:
-            cmd_no_sudo = cmd.lstrip()
-            if cmd_no_sudo.startswith('sudo '):
-                cmd_no_sudo = cmd_no_sudo[len('sudo '):]
-            safe_path = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
-            # Sanitize environment variables to prevent AppImage interference
-            env_vars = "LD_PRELOAD= LD_LIBRARY_PATH= APPIMAGE= APPDIR= PYTHONPATH="
-            wrapped = (
-                f"printf '%s\\n' {shlex.quote(self.sudo_password)} | "
-                f"sudo -SE env {env_vars} PATH={safe_path} bash -lc {shlex.quote(cmd_no_sudo)}"
-            )
+            log_callback(line)
+
+    async def run_stream(self, cmd: str | list[str], log_callback, progress_callback=None,
+                         line_filter: logtools.LineFilter = logtools.PLAIN,
+                         cleanup: str | list[str] | None = None) -> int:
+        # A list is an argv and runs without bash or a login shell
+        if log_callback:
+            log_callback(f"$ {supervisor.command_line(cmd)}")
+        # The supervisor owns the process group, the on-disk job log and the
+        # chunked reader; with a password every command runs through sudo
         try:
-            process = await asyncio.create_subprocess_shell(
-                wrapped,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                executable="/bin/bash",
+            result = await self.supervisor.run(
+                cmd,
+                lambda line: self._emit_line(line, log_callback, progress_callback, line_filter),
+                sudo=True,
+                clean_env=True,
+                cleanup=cleanup,
             )
-            stdout, stderr = await process.communicate()
-            
-            try:
-                out_str = stdout.decode(errors='ignore')
-            except:
-                out_str = stdout.decode('utf-8', errors='ignore')
-            
-            # print(f"DEBUG: run_capture cmd={cmd} rc={process.returncode}") 
-            return process.returncode, out_str
+            self.last_result = result
+            if result['status'] == 'cancelled' and log_callback:
+                log_callback(f"[cancelado] {supervisor.command_line(cmd)}")
+        finally:
+            if self.on_job_end:
+                self.on_job_end()
+        return result['rc']
+
+    @property
+    def cancelled(self) -> bool:
+        """True if the last run_stream was stopped by cancel_jobs()"""
+        return bool(self.last_result and self.last_result['status'] == 'cancelled')
+
+    def cancel_jobs(self) -> int:
+        """Stop every running command (SIGTERM, then SIGKILL, to the whole tree)"""
+        count = len(self.supervisor.jobs)
+        self.supervisor.cancel_all()
+        return count
+
+    async def run_capture(self, cmd: str | list[str]) -> Tuple[int, str]:
+        try:
+            return await self.supervisor.capture(cmd, sudo=True, clean_env=True)
         except Exception as e:
             print(f"DEBUG: run_capture exception: {e}")
             return -1, str(e)
 
+    async def path_size(self, path: str) -> int | None:
+        """Disk usage of path in bytes, like du -sx (None if it does not exist)"""
+        helper = self.supervisor.root_helper
+        if helper:
+            try:
+                result = await helper.call('du', path=path)
+                return result['bytes'] if result else None
+            except (ConnectionError, RuntimeError):
+                # The helper died or the op crashed in it: measure with sudo du
+                pass
+            except OSError as e:
+                print(f"DEBUG: path_size {path}: {e}")
+                return None
+        rc, out = await self.run_capture(['du', '-sx', '-B1', path])
+        if rc != 0 or not out.strip():
+            return None
+        try:
+            return int(out.split()[0])
+        except ValueError:
+            return None
+
+    async def read_root_file(self, path: str) -> str | None:
+        """Contents of a root-owned file, or None if it cannot be read"""
+        helper = self.supervisor.root_helper
+        if helper:
+            try:
+                return await helper.call('read', path=path)
+            except (ConnectionError, RuntimeError):
+                pass
+            except OSError as e:
+                print(f"DEBUG: read_root_file {path}: {e}")
+                return None
+        rc, out = await self.run_capture(['cat', path])
+        return out if rc == 0 else None
+
+    async def write_root_file(self, path: str, text: str, log_callback=None) -> bool:
+        """Replace a root-owned file atomically, keeping its mode and owner"""
+        helper = self.supervisor.root_helper
+        if helper:
+            try:
+                await helper.call('write', path=path, data=text)
+                return True
+            except (ConnectionError, RuntimeError):
+                pass
+            except OSError as e:
+                if log_callback:
+                    log_callback(f"Error al guardar {path}: {e}")
+                return False
+        # install sets mode and owner explicitly: copy them from the current file
+        install = ['install', '-m', '644']
+        rc, out = await self.run_capture(['stat', '-c', '%a %u %g', path])
+        if rc == 0 and len(out.split()) == 3:
+            mode, uid, gid = out.split()
+            install = ['install', '-m', mode, '-o', uid, '-g', gid]
+        fd, temp_path = tempfile.mkstemp(prefix='eggsmaker-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            rc = await self.run_stream([*install, temp_path, path], log_callback)
+        finally:
+            os.remove(temp_path)
+        return rc == 0
+
+    async def remove_tree(self, path: str, log_callback=None) -> int:
+        """Delete path as root without crossing into file systems mounted below it"""
+        helper = self.supervisor.root_helper
+        if helper:
+            try:
+                await helper.call('rmtree', path=path)
+                return 0
+            except (ConnectionError, RuntimeError):
+                pass
+            except OSError as e:
+                # EBUSY: something (a previous produce) is still mounted inside
+                if log_callback:
+                    log_callback(f"No se pudo eliminar {path}: {e}")
+                return 1
+        return await self.run_stream(['rm', '-rf', '--one-file-system', path], log_callback)
+
     async def get_cmd_eggs(self) -> str:
+        # A PATH lookup in-process; spawning `which` cost a fork per call
+        return shutil.which('eggs') or shutil.which('eggs', path=supervisor.SAFE_PATH) or 'eggs'
+
+    async def list_usb_devices(self) -> list[dict]:
+        """Removable/USB whole disks that an ISO can be written to"""
         try:
-            # Try to find eggs in path first without sudo
             process = await asyncio.create_subprocess_exec(
-                'which', 'eggs',
+                'lsblk', '-J', '-b', '-d', '-o', 'NAME,PATH,SIZE,MODEL,TRAN,RM,TYPE',
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
             stdout, _ = await process.communicate()
-            if process.returncode == 0:
-                return stdout.decode().strip()
-            return 'eggs'
+            if process.returncode != 0:
+                return []
+            devices = []
+            for dev in json.loads(stdout.decode(errors='ignore')).get('blockdevices', []):
+                removable = dev.get('rm') in (True, 1, '1')
+                if dev.get('type') == 'disk' and (removable or dev.get('tran') == 'usb'):
+                    devices.append({
+                        'path': dev.get('path') or f"/dev/{dev['name']}",
+                        'size': int(dev.get('size') or 0),
+                        'model': (dev.get('model') or '').strip(),
+                    })
+            return devices
         except Exception:
-            return 'eggs'
+            return []
+
+    async def write_iso_to_device(self, iso_path: str, device: str, log_callback, progress_callback) -> int:
+        """Write the ISO straight to a block device through the O_DIRECT helper in copy_engine"""
+        engine = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'copy_engine.py')
+        # In a frozen build sys.executable is the app itself, not an interpreter
+        cmd = [privhelper.helper_python() or 'python3', engine, 'write-device', iso_path, device]
+
+        def on_line(line: str) -> None:
+            if line.startswith('PROGRESS '):
+                try:
+                    _, written, total = line.split()
+                    progress_callback(int(written), int(total))
+                except ValueError:
+                    pass
+            elif log_callback:
+                log_callback(line)
+
+        return await self.run_stream(cmd, on_line)
 
     def format_size(self, size_bytes: int) -> str:
         if size_bytes < 1024:
@@ -0,0 +1,852 @@
+"""Motor de copia de ISOs compartido por eggsmaker (Tk) y eggsmaker-web.
+
+Este archivo existe idéntico en src/ y en eggsmaker-web/: cualquier cambio
+debe aplicarse en ambas copias.
+"""
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import queue
+import stat
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB por llamada al kernel
+FICLONE = 0x40049409  # _IOW(0x94, 9, int), linux/fs.h
+SLOW_RATE_MB = 40  # Límite por defecto de la copia lenta (MB/s)
+CHECKPOINT_CHUNK = 64 * 1024 * 1024  # Tamaño de cada región con digest en el checkpoint
+DEVICE_BLOCK = 4 * 1024 * 1024  # Bloque de escritura directa a dispositivo
+BLKGETSIZE64 = 0x80081272  # _IOR(0x12, 114, size_t), linux/fs.h
+BLKSSZGET = 0x1268  # Tamaño de sector lógico
+VERIFY_WINDOW = 32 * 1024 * 1024  # Ventana de comparación de la verificación
+CACHE_WINDOW = 64 * 1024 * 1024  # Ventana de caché que se libera detrás del escritor
+FALLOC_FL_KEEP_SIZE = 0x01  # Reservar sin cambiar el tamaño visible del archivo
+
+# Extensión del archivo de suma para cada algoritmo (formato sha256sum/b2sum)
+CHECKSUM_EXTENSIONS = {'sha256': '.sha256', 'blake2b': '.b2'}
+
+# Clases de ionice(1)
+IO_CLASSES = {'none': 0, 'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+# Errores que indican que el método no está soportado para este par de archivos
+_UNSUPPORTED = {
+    errno.ENOSYS, errno.EINVAL, errno.EXDEV, errno.EOPNOTSUPP,
+    errno.ENOTSUP, errno.EBADF, errno.ETXTBSY, errno.EPERM,
+}
+
+
+class RateLimiter:
+    """Token bucket: limita el caudal medio a `rate` bytes/s.
+
+    Permite ráfagas de hasta `burst` bytes cuando el disco estuvo libre, así
+    que el límite no desperdicia ancho de banda como una pausa fija.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(self.rate / 4, 64 * 1024))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def consume(self, n):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= n
+        if self.tokens < 0:
+            # Los tokens que se generan durante la espera saldan la deuda
+            time.sleep(-self.tokens / self.rate)
+
+
+def set_io_priority(io_class, level=None):
+    """Aplica ionice al hilo actual (la prioridad de E/S es por hilo en Linux)"""
+    cmd = ['ionice', '-c', str(IO_CLASSES.get(io_class, io_class))]
+    if level is not None and io_class in ('realtime', 'best-effort', 1, 2):
+        cmd += ['-n', str(level)]
+    cmd += ['-p', str(threading.get_native_id())]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=5).returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+def _fadvise(fd, offset, length, advice):
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+class _CacheTrimmer:
+    """Libera la caché de páginas ya copiada con un desfase de una ventana.
+
+    Sin esto una ISO de varios GB desaloja toda la caché del sistema. La
+    ventana anterior a la actual se conserva porque el checkpoint de resume
+    vuelve a leerla; las páginas sucias que aún no llegaron al disco se
+    quedan hasta que termine su escritura.
+    """
+
+    def __init__(self, *fds, window=CACHE_WINDOW):
+        self.fds = fds
+        self.window = window
+        self.dropped = 0
+
+    def advance(self, offset):
+        while offset - self.dropped >= 2 * self.window:
+            for fd in self.fds:
+                _fadvise(fd, self.dropped, self.window, getattr(os, 'POSIX_FADV_DONTNEED', 4))
+            self.dropped += self.window
+
+
+def _no_space_error(path, needed, available):
+    return OSError(errno.ENOSPC,
+                   f"No hay espacio suficiente en {os.path.dirname(os.path.abspath(path))}: "
+                   f"se necesitan {needed / 1024 ** 2:.0f} MB y quedan {available / 1024 ** 2:.0f} MB",
+                   path)
+
+
+def check_free_space(path, needed):
+    """Lanza OSError(ENOSPC) si el sistema de archivos de path no tiene `needed` bytes libres.
+
+    path puede ser un directorio o un archivo (existente o no); si el archivo
+    existe, su tamaño actual cuenta como disponible porque se va a reemplazar.
+    """
+    directory = path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))
+    st = os.statvfs(directory)
+    available = st.f_bavail * st.f_frsize
+    if not os.path.isdir(path):
+        try:
+            available += os.stat(path).st_blocks * 512
+        except OSError:
+            pass
+    if needed > available:
+        raise _no_space_error(path, needed, available)
+
+
+_fallocate_fn = None  # None: sin resolver todavía; False: no disponible
+
+
+def _fallocate(fd, length):
+    """Reserva [0, length) con fallocate(2). True si el sistema de archivos lo soporta.
+
+    No se usa os.posix_fallocate porque glibc lo emula escribiendo un byte
+    por bloque cuando el kernel no lo soporta (exFAT, vfat): en un pendrive
+    eso duplica la escritura. Aquí simplemente se omite la reserva.
+    """
+    global _fallocate_fn
+    if _fallocate_fn is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fn = getattr(libc, 'fallocate64', None) or libc.fallocate
+            fn.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+            _fallocate_fn = fn
+        except (OSError, AttributeError):
+            _fallocate_fn = False
+    if not _fallocate_fn or length <= 0:
+        return False
+    # KEEP_SIZE: una copia interrumpida no aparenta estar completa (y es el
+    # único modo que acepta vfat)
+    if _fallocate_fn(fd, FALLOC_FL_KEEP_SIZE, 0, length) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSPC, errno.EFBIG, errno.EDQUOT):
+        raise OSError(err, os.strerror(err))
+    return False
+
+
+def _preallocate(fd, path, length):
+    """Comprueba el espacio libre y reserva el destino completo antes de escribir.
+
+    Así la copia falla al instante con un error claro en vez de morir con
+    ENOSPC al 97 %, y el archivo queda contiguo en vez de crecer bloque a
+    bloque (fragmentado en ext4/exFAT).
+    """
+    st = os.fstatvfs(fd)
+    # Bloques que el destino ya ocupa (p. ej. al reanudar) no cuentan como faltantes
+    available = st.f_bavail * st.f_frsize + os.fstat(fd).st_blocks * 512
+    if length > available:
+        raise _no_space_error(path, length, available)
+    try:
+        return _fallocate(fd, length)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise _no_space_error(path, length, available) from e
+        raise
+
+
+class _Unsupported(Exception):
+    """El método de copia no sirve para este par de archivos"""
+
+
+class CopyCancelled(Exception):
+    """La copia se canceló; el destino parcial ya se eliminó"""
+
+
+def _check_cancel(cancel, path):
+    if cancel is not None and cancel.is_set():
+        raise CopyCancelled(f"Copia cancelada: {path}")
+
+
+def _step_copy_file_range(src_fd, dst_fd, offset, count, buf):
+    if not hasattr(os, 'copy_file_range'):
+        raise _Unsupported()
+    try:
+        return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+    except OSError as e:
+        if e.errno in _UNSUPPORTED:
+            raise _Unsupported() from e
+        raise
+
+
+def _step_sendfile(src_fd, dst_fd, offset, count, buf):
+    if not hasattr(os, 'sendfile'):
+        raise _Unsupported()
+    try:
+        # sendfile escribe en la posición actual del destino
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        return os.sendfile(dst_fd, src_fd, offset, count)
+    except OSError as e:
+        if e.errno in _UNSUPPORTED:
+            raise _Unsupported() from e
+        raise
+
+
+def _step_readinto(src_fd, dst_fd, offset, count, buf):
+    view = memoryview(buf)[:count]
+    n = os.preadv(src_fd, [view], offset)
+    written = 0
+    while written < n:
+        written += os.pwrite(dst_fd, view[written:n], offset + written)
+    return n
+
+
+def _try_reflink(src_fd, dst_fd):
+    """Clona los extents de src en dst (btrfs, XFS, bcachefs...). True si funcionó"""
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        # EXDEV/EOPNOTSUPP/EINVAL/ENOTTY: otro sistema de archivos o sin CoW
+        return False
+
+
+class _Hasher(threading.Thread):
+    """Calcula el hash en otro hilo mientras el copiador sigue leyendo.
+
+    Los buffers circulan entre `free` y `todo`, así que no se reserva memoria
+    por bloque; hashlib libera el GIL y el hash corre en paralelo a la E/S.
+    """
+
+    def __init__(self, algorithm, chunk_size, depth=3):
+        super().__init__(daemon=True)
+        self.algorithm = algorithm
+        self.hash = hashlib.new(algorithm)
+        self.free = queue.Queue()
+        self.todo = queue.Queue()
+        for _ in range(depth):
+            self.free.put(bytearray(chunk_size))
+        self.start()
+
+    def run(self):
+        while True:
+            item = self.todo.get()
+            if item is None:
+                break
+            buf, n = item
+            self.hash.update(memoryview(buf)[:n])
+            self.free.put(buf)
+
+    def finish(self):
+        self.todo.put(None)
+        self.join()
+        return self.hash.hexdigest()
+
+
+def _hash_fd(fd, algorithm, chunk_size):
+    h = hashlib.new(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    offset = 0
+    while n := os.preadv(fd, [view], offset):
+        h.update(view[:n])
+        offset += n
+    return h.hexdigest()
+
+
+def write_checksum_file(path, algorithm, digest):
+    """Escribe la suma junto al archivo en el formato de sha256sum/b2sum"""
+    sidecar = path + CHECKSUM_EXTENSIONS.get(algorithm, '.' + algorithm)
+    with open(sidecar, 'w') as f:
+        f.write(f"{digest}  {os.path.basename(path)}\n")
+    return sidecar
+
+
+def checkpoint_path(dst):
+    return dst + '.checkpoint'
+
+
+def _load_checkpoint(dst, src_stat):
+    """Devuelve el checkpoint de dst si corresponde a la misma fuente"""
+    try:
+        with open(checkpoint_path(dst)) as f:
+            data = json.load(f)
+        if (data.get('size') == src_stat.st_size and data.get('mtime') == src_stat.st_mtime_ns
+                and data.get('chunk') == CHECKPOINT_CHUNK and os.path.exists(dst)):
+            return data
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+
+def _save_checkpoint(dst, src, src_stat, digests):
+    path = checkpoint_path(dst)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({
+            'source': src,
+            'size': src_stat.st_size,
+            'mtime': src_stat.st_mtime_ns,
+            'chunk': CHECKPOINT_CHUNK,
+            'offset': len(digests) * CHECKPOINT_CHUNK,
+            'digests': digests,
+        }, f)
+    # Reemplazo atómico: nunca queda un checkpoint a medio escribir
+    os.replace(tmp, path)
+
+
+def _remove_checkpoint(dst):
+    try:
+        os.remove(checkpoint_path(dst))
+    except FileNotFoundError:
+        pass
+
+
+def _discard(dst):
+    """Elimina un destino a medio escribir junto con su checkpoint"""
+    try:
+        os.remove(dst)
+    except FileNotFoundError:
+        pass
+    _remove_checkpoint(dst)
+
+
+def _region_digest(fd, start, end, buf, hasher=None):
+    """blake2b de fd[start:end]; si hay hasher, le pasa también los datos leídos"""
+    h = hashlib.blake2b(digest_size=16)
+    offset = start
+    while offset < end:
+        piece = hasher.free.get() if hasher else buf
+        n = os.preadv(fd, [memoryview(piece)[:min(len(piece), end - offset)]], offset)
+        if n == 0:
+            if hasher:
+                hasher.free.put(piece)
+            return None
+        h.update(memoryview(piece)[:n])
+        if hasher:
+            hasher.todo.put((piece, n))
+        offset += n
+    return h.hexdigest()
+
+
+_METHODS = (
+    ('copy_file_range', _step_copy_file_range),
+    ('sendfile', _step_sendfile),
+    ('readinto', _step_readinto),
+)
+
+
+def copy_file(src, dst, progress=None, chunk_size=CHUNK_SIZE, rate_limit=None, ionice=None,
+              checksum=None, resume=False, cancel=None):
+    """Copia src en dst y devuelve {'bytes': total, 'method': método usado}.
+
+    Si el destino está en el mismo sistema de archivos con copy-on-write se
+    clona con FICLONE ('reflink') sin copiar datos. Si no, se intenta
+    copy_file_range, luego sendfile y por último un buffer reutilizable con
+    readinto. progress(copiados, total) se llama tras cada bloque desde el
+    hilo que ejecuta la copia.
+
+    rate_limit (bytes/s) activa un token bucket y ionice=(clase, nivel), por
+    ejemplo ('best-effort', 7) o ('idle', None), baja la prioridad de E/S.
+
+    Con checksum='sha256' o 'blake2b' los datos pasan por userspace para
+    calcular el hash en la misma pasada; el resultado incluye 'digest' y
+    'checksum_file' (la suma escrita junto al destino).
+
+    Con resume=True se guarda junto al destino un checkpoint (offset y digest
+    de cada región de 64 MB ya escrita). Si la copia se interrumpe, el
+    siguiente intento verifica el archivo parcial contra esos digests y sigue
+    desde la primera región que no coincide ('resumed_from' en el resultado).
+
+    Antes de escribir se comprueba el espacio libre y se reserva el destino
+    completo: si no cabe, falla enseguida con OSError(ENOSPC) y un mensaje
+    claro. La caché de páginas ya copiada se libera detrás del escritor.
+
+    cancel es un threading.Event opcional: si se activa, la copia se detiene
+    tras el bloque en curso, el destino parcial y su checkpoint se eliminan
+    (no tiene sentido reanudar algo que se abortó a propósito) y se lanza
+    CopyCancelled.
+    """
+    src_stat = os.stat(src)
+    limiter = None
+    if rate_limit:
+        limiter = RateLimiter(rate_limit)
+        # Bloques pequeños para que el ritmo sea uniforme
+        chunk_size = max(64 * 1024, min(chunk_size, int(limiter.capacity)))
+    if ionice:
+        set_io_priority(*ionice)
+    try:
+        result = _copy(src, dst, src_stat, progress, chunk_size, limiter, checksum, resume, cancel)
+    except CopyCancelled:
+        _discard(dst)
+        raise
+    finally:
+        if ionice:
+            # Los hilos de los pools se reutilizan: devolver la prioridad normal
+            set_io_priority('none')
+    if checksum:
+        result['algorithm'] = checksum
+        result['checksum_file'] = write_checksum_file(dst, checksum, result['digest'])
+    return result
+
+
+def _copy(src, dst, src_stat, progress, chunk_size, limiter, checksum, resume, cancel):
+    total = src_stat.st_size
+    buf = None
+    copied = 0
+    resumed_from = 0
+    digests = []
+    checkpoint = _load_checkpoint(dst, src_stat) if resume else None
+
+    with open(src, 'rb') as fsrc, open(dst, 'r+b' if checkpoint else 'wb') as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        # El ioctl falla al instante con EXDEV si no es el mismo sistema de
+        # archivos, así que se prueba siempre (cubre también subvolúmenes btrfs)
+        if total and _try_reflink(src_fd, dst_fd):
+            if resume:
+                _remove_checkpoint(dst)
+            if progress:
+                progress(total, total)
+            result = {'bytes': total, 'method': 'reflink'}
+            if checksum:
+                # No hubo lectura para copiar: esta es la única pasada
+                result['digest'] = _hash_fd(src_fd, checksum, chunk_size)
+            return result
+
+        try:
+            # Reservar el destino completo antes de escribir el primer byte
+            _preallocate(dst_fd, dst, total)
+        except OSError:
+            if not checkpoint:
+                os.remove(dst)
+            raise
+        _fadvise(src_fd, 0, 0, getattr(os, 'POSIX_FADV_SEQUENTIAL', 2))
+        trimmer = _CacheTrimmer(src_fd, dst_fd)
+        hasher = _Hasher(checksum, chunk_size) if checksum else None
+        # Para calcular el hash los datos tienen que pasar por userspace
+        methods = [_METHODS[-1]] if hasher else list(_METHODS)
+        scratch = bytearray(chunk_size) if resume else None
+        try:
+            if checkpoint:
+                # Verificar lo ya escrito; el hasher recibe el prefijo válido
+                for expected in checkpoint['digests']:
+                    end = min(copied + CHECKPOINT_CHUNK, total)
+                    if _region_digest(dst_fd, copied, end, scratch, hasher) != expected:
+                        break
+                    digests.append(expected)
+                    copied = end
+                if hasher and copied < len(checkpoint['digests']) * CHECKPOINT_CHUNK:
+                    # La región que no coincidió ya entró al hash: recalcular el prefijo
+                    hasher.finish()
+                    hasher = _Hasher(checksum, chunk_size)
+                    for start in range(0, copied, CHECKPOINT_CHUNK):
+                        _region_digest(src_fd, start, min(start + CHECKPOINT_CHUNK, total), scratch, hasher)
+                resumed_from = copied
+                if progress and copied:
+                    progress(copied, total)
+            while copied < total:
+                _check_cancel(cancel, dst)
+                name, step = methods[0]
+                if hasher:
+                    buf = hasher.free.get()
+                elif step is _step_readinto and buf is None:
+                    buf = bytearray(chunk_size)
+                count = min(chunk_size, total - copied)
+                if resume:
+                    # No cruzar el límite de la región del checkpoint
+                    count = min(count, CHECKPOINT_CHUNK - copied % CHECKPOINT_CHUNK)
+                try:
+                    n = step(src_fd, dst_fd, copied, count, buf)
+                except _Unsupported:
+                    n = 0
+                if hasher:
+                    if n:
+                        hasher.todo.put((buf, n))
+                    else:
+                        hasher.free.put(buf)
+                if n == 0:
+                    # Algunos sistemas de archivos devuelven 0 en vez de fallar:
+                    # pasar al siguiente método y continuar desde el mismo offset
+                    if len(methods) == 1:
+                        raise OSError(errno.EIO, f"Lectura truncada en {src}", src)
+                    methods.pop(0)
+                    continue
+                copied += n
+                if resume and copied % CHECKPOINT_CHUNK == 0 and copied < total:
+                    # La región recién copiada sigue en la caché de páginas
+                    digests.append(_region_digest(src_fd, copied - CHECKPOINT_CHUNK, copied, scratch))
+                    _save_checkpoint(dst, src, src_stat, digests)
+                trimmer.advance(copied)
+                if progress:
+                    progress(copied, total)
+                if limiter:
+                    limiter.consume(n)
+            if checkpoint:
+                # El destino anterior podía ser más largo
+                os.ftruncate(dst_fd, total)
+        finally:
+            digest = hasher.finish() if hasher else None
+
+    if resume:
+        _remove_checkpoint(dst)
+    if progress and total == 0:
+        progress(0, 0)
+    result = {'bytes': total, 'method': methods[0][0], 'resumed_from': resumed_from}
+    if hasher:
+        result['digest'] = digest
+    return result
+
+
+class _Block:
+    """Bloque leído una vez y compartido por varios consumidores"""
+
+    def __init__(self, buf, n, offset, users, free):
+        self.buf, self.n, self.offset = buf, n, offset
+        self._users = users
+        self._free = free
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            done = self._users == 0
+        if done:
+            self._free.put(self.buf)
+
+
+def _fanout_writer(index, dst, blocks, total, progress, ionice, errors):
+    written = 0
+    if ionice:
+        set_io_priority(*ionice)
+    try:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    except OSError as e:
+        errors[index] = e
+        fd = None
+    if fd is not None:
+        try:
+            _preallocate(fd, dst, total)
+        except OSError as e:
+            # Sin espacio: este destino se descarta antes de escribir nada
+            errors[index] = e
+            os.close(fd)
+            fd = None
+            os.remove(dst)
+    trimmer = _CacheTrimmer(fd) if fd is not None else None
+    try:
+        while (block := blocks.get()) is not None:
+            try:
+                if fd is not None:
+                    view = memoryview(block.buf)[:block.n]
+                    done = 0
+                    while done < block.n:
+                        done += os.pwrite(fd, view[done:], block.offset + done)
+                    written += block.n
+                    trimmer.advance(written)
+                    if progress:
+                        progress(index, written, total)
+            except OSError as e:
+                # Un pendrive desconectado no detiene al resto de destinos
+                errors[index] = e
+                os.close(fd)
+                fd = None
+            finally:
+                block.release()
+    finally:
+        if fd is not None:
+            os.close(fd)
+        if ionice:
+            set_io_priority('none')
+    return written
+
+
+def _fanout_hasher(algorithm, blocks):
+    h = hashlib.new(algorithm)
+    while (block := blocks.get()) is not None:
+        h.update(memoryview(block.buf)[:block.n])
+        block.release()
+    return h.hexdigest()
+
+
+def copy_file_multi(src, dsts, progress=None, chunk_size=CHUNK_SIZE, rate_limit=None, ionice=None,
+                    checksum=None, depth=4, cancel=None):
+    """Lee src una sola vez y lo escribe en todos los destinos en paralelo.
+
+    Cada destino tiene su escritor en un pool de hilos; como solo circulan
+    `depth` buffers, el lector avanza al ritmo del escritor más lento.
+    progress(índice, escritos, total) informa cada destino por separado.
+    Devuelve una lista de resultados con 'path', 'bytes' y 'error' (None si
+    la copia terminó bien), más 'digest'/'checksum_file' si hay checksum.
+    Si se activa cancel (threading.Event) se eliminan todos los destinos y se
+    lanza CopyCancelled.
+    """
+    dsts = list(dsts)
+    total = os.path.getsize(src)
+    limiter = None
+    if rate_limit:
+        limiter = RateLimiter(rate_limit)
+        chunk_size = max(64 * 1024, min(chunk_size, int(limiter.capacity)))
+    free = queue.Queue()
+    for _ in range(depth):
+        free.put(bytearray(chunk_size))
+    queues = [queue.Queue() for _ in dsts]
+    hash_queue = queue.Queue() if checksum else None
+    consumers = len(dsts) + (1 if checksum else 0)
+    errors = [None] * len(dsts)
+
+    with ThreadPoolExecutor(max_workers=consumers, thread_name_prefix='fanout') as pool:
+        writers = [pool.submit(_fanout_writer, i, dst, queues[i], total, progress, ionice, errors)
+                   for i, dst in enumerate(dsts)]
+        hasher = pool.submit(_fanout_hasher, checksum, hash_queue) if checksum else None
+        if ionice:
+            set_io_priority(*ionice)
+        try:
+            with open(src, 'rb') as fsrc:
+                src_fd = fsrc.fileno()
+                _fadvise(src_fd, 0, 0, getattr(os, 'POSIX_FADV_SEQUENTIAL', 2))
+                trimmer = _CacheTrimmer(src_fd)
+                offset = 0
+                while offset < total and not all(errors):
+                    if cancel is not None and cancel.is_set():
+                        break
+                    buf = free.get()
+                    n = os.preadv(src_fd, [memoryview(buf)[:min(chunk_size, total - offset)]], offset)
+                    if n == 0:
+                        raise OSError(errno.EIO, f"Lectura truncada en {src}", src)
+                    block = _Block(buf, n, offset, consumers, free)
+                    for q in queues:
+                        q.put(block)
+                    if hash_queue:
+                        hash_queue.put(block)
+                    offset += n
+                    trimmer.advance(offset)
+                    if limiter:
+                        limiter.consume(n)
+        finally:
+            for q in queues:
+                q.put(None)
+            if hash_queue:
+                hash_queue.put(None)
+            if ionice:
+                set_io_priority('none')
+        written = [w.result() for w in writers]
+        digest = hasher.result() if hasher else None
+
+    if cancel is not None and cancel.is_set() and offset < total:
+        # Los escritores ya terminaron: ningún archivo sigue abierto
+        for dst in dsts:
+            _discard(dst)
+        raise CopyCancelled(f"Copia cancelada: {src}")
+
+    results = []
+    for dst, n, error in zip(dsts, written, errors):
+        result = {'path': dst, 'bytes': n, 'method': 'fan-out', 'error': error}
+        if digest and error is None:
+            result['digest'] = digest
+            result['algorithm'] = checksum
+            result['checksum_file'] = write_checksum_file(dst, checksum, digest)
+        results.append(result)
+    return results
+
+
+def _first_difference(a, b):
+    """Offset del primer byte distinto entre dos bloques de igual longitud"""
+    for start in range(0, len(a), 4096):
+        if a[start:start + 4096] != b[start:start + 4096]:
+            return next(i for i in range(start, min(start + 4096, len(a))) if a[i] != b[i])
+    return None
+
+
+def verify_copy(src, dst, progress=None, window=VERIFY_WINDOW, cancel=None):
+    """Compara dst con src byte a byte y devuelve {'ok', 'bytes', 'mismatch'}.
+
+    Antes se vacía la caché de páginas del destino (fsync + DONTNEED) para
+    que la comparación lea realmente el medio y no lo que quedó en memoria
+    de la copia. Ambos archivos se mapean con mmap y se comparan en ventanas
+    de `window` bytes; 'mismatch' es el offset del primer byte distinto (o
+    el tamaño menor si difieren en longitud). Es bloqueante: llamar desde un
+    hilo de trabajo. progress(verificados, total). Si se activa cancel
+    (threading.Event) lanza CopyCancelled sin tocar el destino.
+    """
+    total = os.path.getsize(src)
+    with open(src, 'rb') as fsrc, open(dst, 'rb') as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        # Las páginas sucias no se pueden descartar: primero llevarlas al disco
+        os.fsync(dst_fd)
+        _fadvise(dst_fd, 0, 0, getattr(os, 'POSIX_FADV_DONTNEED', 4))
+        dst_size = os.fstat(dst_fd).st_size
+        size = min(total, dst_size)
+        mismatch = None if dst_size == total else size
+        if size == 0:
+            if progress:
+                progress(total, total)
+            return {'ok': mismatch is None, 'bytes': 0, 'mismatch': mismatch}
+        _fadvise(src_fd, 0, 0, getattr(os, 'POSIX_FADV_SEQUENTIAL', 2))
+        _fadvise(dst_fd, 0, 0, getattr(os, 'POSIX_FADV_SEQUENTIAL', 2))
+        src_map = mmap.mmap(src_fd, size, access=mmap.ACCESS_READ)
+        dst_map = mmap.mmap(dst_fd, size, access=mmap.ACCESS_READ)
+        trimmer = _CacheTrimmer(src_fd, dst_fd, window=window)
+        checked = 0
+        try:
+            while checked < size:
+                _check_cancel(cancel, dst)
+                end = min(checked + window, size)
+                a, b = src_map[checked:end], dst_map[checked:end]
+                if a != b:
+                    mismatch = checked + _first_difference(a, b)
+                    break
+                checked = end
+                trimmer.advance(checked)
+                if progress:
+                    progress(checked, total)
+        finally:
+            src_map.close()
+            dst_map.close()
+    return {'ok': mismatch is None, 'bytes': checked, 'mismatch': mismatch}
+
+
+def _device_size(fd):
+    buf = bytearray(8)
+    fcntl.ioctl(fd, BLKGETSIZE64, buf)
+    return int.from_bytes(buf, sys.byteorder)
+
+
+def _sector_size(fd):
+    buf = bytearray(4)
+    try:
+        fcntl.ioctl(fd, BLKSSZGET, buf)
+        return int.from_bytes(buf, sys.byteorder) or 512
+    except OSError:
+        return 512
+
+
+def _device_reader(src_fd, total, free, full):
+    """Lee la ISO al buffer libre mientras el otro se escribe en el dispositivo"""
+    offset = 0
+    try:
+        while offset < total:
+            buf = free.get()
+            if buf is None:
+                return
+            n = os.preadv(src_fd, [memoryview(buf)[:min(len(buf), total - offset)]], offset)
+            if n == 0:
+                raise OSError(errno.EIO, "Lectura truncada de la ISO")
+            full.put((buf, offset, n))
+            offset += n
+        full.put(None)
+    except Exception as e:
+        full.put(e)
+
+
+def write_device(src, device, progress=None, block_size=DEVICE_BLOCK, depth=2):
+    """Graba la ISO en un dispositivo de bloques (pendrive) con O_DIRECT.
+
+    Los buffers son mmap anónimos (alineados a página) y se reutilizan: un
+    hilo lee el siguiente bloque mientras se escribe el actual. Al terminar
+    se hace fsync. progress(escritos, total) informa bytes exactos. Devuelve
+    {'bytes': total, 'method': 'o_direct'}.
+    """
+    total = os.path.getsize(src)
+    if not stat.S_ISBLK(os.stat(device).st_mode):
+        raise ValueError(f"{device} no es un dispositivo de bloques")
+    # O_EXCL en un dispositivo de bloques falla si está montado
+    dev_fd = os.open(device, os.O_WRONLY | os.O_DIRECT | os.O_EXCL | os.O_CLOEXEC)
+    try:
+        if _device_size(dev_fd) < total:
+            raise OSError(errno.ENOSPC, f"El dispositivo {device} es más chico que la ISO")
+        sector = _sector_size(dev_fd)
+        block_size -= block_size % mmap.PAGESIZE
+        free, full = queue.Queue(), queue.Queue()
+        buffers = [mmap.mmap(-1, block_size) for _ in range(depth)]
+        for buf in buffers:
+            free.put(buf)
+        with open(src, 'rb') as fsrc:
+            reader = threading.Thread(target=_device_reader, args=(fsrc.fileno(), total, free, full), daemon=True)
+            reader.start()
+            written = 0
+            try:
+                while (item := full.get()) is not None:
+                    if isinstance(item, Exception):
+                        raise item
+                    buf, offset, n = item
+                    # O_DIRECT exige múltiplos del sector: rellenar el último bloque
+                    aligned = -(-n // sector) * sector
+                    if aligned != n:
+                        buf[n:aligned] = bytes(aligned - n)
+                    # Liberar la vista también si pwrite falla: si no, buf.close() lanza
+                    # BufferError y tapa el error de E/S real
+                    with memoryview(buf) as view:
+                        done = 0
+                        while done < aligned:
+                            done += os.pwrite(dev_fd, view[done:aligned], offset + done)
+                    free.put(buf)
+                    written += n
+                    if progress:
+                        progress(written, total)
+            finally:
+                free.put(None)
+                reader.join()
+                for buf in buffers:
+                    buf.close()
+        os.fsync(dev_fd)
+    finally:
+        os.close(dev_fd)
+    return {'bytes': total, 'method': 'o_direct'}
+
+
+def _main(argv):
+    """Uso: copy_engine.py write-device ISO DISPOSITIVO
+
+    Se ejecuta con sudo desde eggsmaker-web; el avance se informa en líneas
+    'PROGRESS escritos total' que el frontend interpreta.
+    """
+    if len(argv) != 3 or argv[0] != 'write-device':
+        print(_main.__doc__, file=sys.stderr)
+        return 2
+    last = [0.0]
+
+    def report(written, total):
+        now = time.monotonic()
+        if written == total or now - last[0] >= 0.25:
+            last[0] = now
+            print(f"PROGRESS {written} {total}", flush=True)
+
+    try:
+        write_device(argv[1], argv[2], progress=report)
+    except (OSError, ValueError) as e:
+        print(f"ERROR {e}", flush=True)
+        return 1
+    print("DONE", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
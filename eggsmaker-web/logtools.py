@@ -0,0 +1,632 @@
+"""Utilidades de registro compartidas por eggsmaker (Tk) y eggsmaker-web.
+
+Este archivo existe idéntico en src/ y en eggsmaker-web/: cualquier cambio
+debe aplicarse en ambas copias.
+"""
+import array
+import bisect
+import itertools
+import mmap
+import os
+import re
+import threading
+import time
+from collections import deque
+
+SCROLLBACK_LINES = 5000  # Líneas que conservan en memoria la terminal y la consola web
+BUILD_LOG_MAX_BYTES = 64 * 1024 * 1024  # Tamaño de un log de trabajo antes de rotarlo
+BUILD_LOG_BACKUPS = 3  # Archivos rotados que se conservan por trabajo
+BUILD_LOG_JOBS = 50  # Trabajos que se conservan en disco
+INDEX_STRIDE = 1024  # Cada cuántas líneas se guarda un offset en el índice
+SEARCH_MAX_LINES = 100000  # Líneas que conserva el índice de búsqueda en vivo
+
+ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+# Ruido del instalador y de git que no aporta nada en la terminal
+INSTALLER_NOISE = (
+    'remote: Enumerating objects:', 'remote: Total', 'Receiving objects:',
+    'Resolving deltas:', '=====================================', 'UNIVERSAL INSTALLER',
+    'Distro detected:', 'remote: Compressing objects:',
+    'remote: Counting objects:', 'from 2)', 'Looking for conflicting packages',
+    'checking keyring', 'checking package integrity', 'loading package files',
+    'checking for file conflicts', ':: Processing package changes',
+    ':: Running pre-transaction hooks', ':: Running post-transaction hooks',
+    ':: Waiting for running package', ':: Synchronizing package databases',
+)
+
+
+def strip_ansi(text):
+    """Quita las secuencias de escape ANSI (colores, movimientos del cursor)"""
+    return ANSI_RE.sub('', text) if '\x1b' in text else text
+
+
+# Colores SGR de eggs -> etiquetas de severidad de la terminal
+SGR_TAGS = {
+    31: 'error', 91: 'error',
+    32: 'success', 92: 'success',
+    33: 'warning', 93: 'warning',
+    34: 'info', 94: 'info', 36: 'info', 96: 'info',
+}
+
+
+class AnsiTagger:
+    """Convierte texto con colores ANSI en tramos (texto, etiqueta).
+
+    Solo se reconocen los colores de primer plano, que se asignan a las pocas
+    etiquetas de severidad de SGR_TAGS; el resto de secuencias se descarta.
+    El color activo se conserva entre llamadas, como en una terminal real;
+    una etiqueta explícita (`default`) tiene prioridad sobre él.
+    """
+
+    def __init__(self):
+        self.tag = None
+
+    def split(self, text, default=None):
+        if '\x1b' not in text:
+            return [(text, default or self.tag)]
+        segments = []
+        pos = 0
+        for match in ANSI_RE.finditer(text):
+            if match.start() > pos:
+                segments.append((text[pos:match.start()], default or self.tag))
+            pos = match.end()
+            code = match.group()
+            if code.endswith('m') and code.startswith('\x1b['):
+                for param in (code[2:-1] or '0').split(';'):
+                    value = int(param) if param.isdigit() else -1
+                    if value in (0, 39):
+                        self.tag = None
+                    elif value in SGR_TAGS:
+                        self.tag = SGR_TAGS[value]
+        if pos < len(text):
+            segments.append((text[pos:], default or self.tag))
+        return segments
+
+
+class LineFilter:
+    """Filtro de salida compilado una sola vez.
+
+    Los patrones (texto literal) se unen en una sola alternativa regex, así
+    que cada línea se recorre una vez en C en lugar de una búsqueda por
+    patrón. filter(line) devuelve la línea sin códigos ANSI ni espacios
+    finales, o None si hay que ocultarla (vacía o con algún patrón).
+    """
+
+    def __init__(self, patterns=(), strip=True):
+        self.patterns = tuple(patterns)
+        self.strip = strip
+        # Los más largos primero: la alternativa se detiene en la primera coincidencia
+        ordered = sorted(set(self.patterns), key=len, reverse=True)
+        self._search = re.compile('|'.join(map(re.escape, ordered))).search if ordered else None
+
+    def filter(self, line):
+        if self.strip and '\x1b' in line:
+            line = ANSI_RE.sub('', line)
+        line = line.rstrip()
+        if not line.strip():
+            return None
+        if self._search and self._search(line):
+            return None
+        return line
+
+    def shows(self, line):
+        return self.filter(line) is not None
+
+
+# Filtros por comando; PLAIN solo limpia los códigos ANSI
+PLAIN = LineFilter()
+INSTALLER = LineFilter(INSTALLER_NOISE)
+
+
+# Etapas de `eggs produce` en orden, con su peso aproximado en el tiempo total
+PRODUCE_STAGES = (
+    ('prepare', 0.05),
+    ('rsync', 0.15),
+    ('initrd', 0.05),
+    ('mksquashfs', 0.60),
+    ('xorriso', 0.15),
+)
+
+# Una sola búsqueda por línea; el grupo externo que coincide (lastgroup) decide la etapa.
+# Todo va anclado al comienzo de la línea: un banner es el comando que eggs
+# anuncia (con o sin "eggs >>> ") o la cabecera que imprime la herramienta, y
+# un nombre suelto en medio del texto (la lista de archivos de rsync incluye
+# /usr/bin/mksquashfs y la documentación de xorriso) no debe adelantar la
+# barra, que ya no retrocede. Las alternativas con porcentaje van primero.
+_PRODUCE_RE = re.compile(
+    r'\s*(?:'
+    r'(?P<mksquashfs_pct>\[[^\]]*\]\s+\d+/\d+\s+(\d{1,3})%)'
+    r'|(?P<xorriso_pct>xorriso : UPDATE :\s*(\d{1,3}(?:\.\d+)?)% done)'
+    r'|(?P<rsync_pct>[\d.,]+\s+(\d{1,3})%\s+\d+(?:[.,]\d+)?[kMG]B/s)'
+    r'|(?:eggs\s*>>>\s*)?(?:'
+    r'(?P<initrd>(?:mkinitramfs|update-initramfs|dracut|mkinitcpio)\b)'
+    r'|(?P<mksquashfs>mksquashfs\s|Parallel mksquashfs:|Creating \d+\.\d+ filesystem on )'
+    r'|(?P<xorriso>xorriso\s)'
+    r'|(?P<rsync>rsync\s)'
+    r'))'
+)
+
+
+class ProduceProgress:
+    """Convierte la salida de `eggs produce` en eventos de progreso.
+
+    feed(línea) devuelve None o un dict con 'stage', 'stage_percent',
+    'fraction' (avance total ponderado entre 0 y 1), 'eta' (segundos o None)
+    'meter' (True si la línea es un indicador de avance que no hace falta
+    mostrar en la terminal) y 'changed' (False si el avance no se movió). Las etapas solo avanzan: una mención tardía a
+    rsync no hace retroceder la barra.
+    """
+
+    def __init__(self):
+        self.names = [name for name, _weight in PRODUCE_STAGES]
+        self.starts = {}
+        done = 0.0
+        for name, weight in PRODUCE_STAGES:
+            self.starts[name] = (done, weight)
+            done += weight
+        self.stage = 0
+        self.percent = 0.0
+        self.fraction = 0.0
+        self.started = time.monotonic()
+
+    def feed(self, line):
+        match = _PRODUCE_RE.match(strip_ansi(line))
+        if not match:
+            return None
+        kind = match.lastgroup
+        meter = kind.endswith('_pct')
+        name = kind[:-4] if meter else kind
+        index = self.names.index(name)
+        if index < self.stage:
+            return None
+        percent = float(match.group(match.lastindex + 1)) if meter else 0.0
+        if index == self.stage and percent <= self.percent:
+            # Nada nuevo, pero la línea de avance igual se oculta
+            return {'stage': name, 'stage_percent': self.percent, 'fraction': self.fraction,
+                    'eta': self.eta(), 'meter': True, 'changed': False} if meter else None
+        self.stage = index
+        self.percent = min(percent, 100.0)
+        start, weight = self.starts[name]
+        self.fraction = start + weight * self.percent / 100
+        return {'stage': name, 'stage_percent': self.percent, 'fraction': self.fraction,
+                'eta': self.eta(), 'meter': meter, 'changed': True}
+
+    def eta(self):
+        """Segundos restantes estimados a partir del avance ponderado"""
+        if self.fraction < 0.02:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed * (1 - self.fraction) / self.fraction
+
+
+SEVERITY_RE = re.compile(
+    r'(?P<error>\b(?:error|errors|failed|failure|fatal|fallo|falló|fallido)\b)'
+    r'|(?P<warning>\b(?:warn|warning|warnings|advertencia|aviso)\b)',
+    re.IGNORECASE)
+TOKEN_RE = re.compile(r'\w{2,}')
+
+
+class LogIndex:
+    """Índice en memoria de la salida para buscar mientras el proceso escribe.
+
+    Cada línea completa se clasifica por severidad (listas de números de
+    línea de 'error' y 'warning') y sus palabras se agregan a un mapa
+    palabra -> números de línea. Buscar consulta el mapa en lugar de
+    recorrer todo el texto. Al pasar `max_lines` se descarta la línea más
+    vieja por cada línea nueva: sus números son siempre los primeros de cada
+    lista, así que quitarlos es O(1) y escribir nunca se detiene a reindexar.
+    """
+
+    def __init__(self, max_lines=SEARCH_MAX_LINES):
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.first = 0  # Número de la línea más vieja que se conserva
+        self.lines = deque()
+        self.severity = {'error': deque(), 'warning': deque()}
+        self.tokens = {}
+        self._partial = ''
+        self.version = 0  # Cambia con cada línea nueva (para refrescar resultados)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def _add(self, line):
+        number = self.first + len(self.lines)
+        self.lines.append(line)
+        match = SEVERITY_RE.search(line)
+        if match:
+            self.severity[match.lastgroup].append(number)
+        for token in set(TOKEN_RE.findall(line.lower())):
+            numbers = self.tokens.get(token)
+            if numbers is None:
+                numbers = self.tokens[token] = deque()
+            numbers.append(number)
+
+    def _evict(self):
+        """Quita la línea más vieja de las listas en las que aparece"""
+        number = self.first
+        line = self.lines.popleft()
+        self.first += 1
+        for numbers in self.severity.values():
+            if numbers and numbers[0] == number:
+                numbers.popleft()
+        for token in set(TOKEN_RE.findall(line.lower())):
+            numbers = self.tokens[token]
+            numbers.popleft()
+            if not numbers:
+                del self.tokens[token]
+
+    def write(self, text):
+        """Agrega texto; las líneas incompletas se indexan cuando llega su final"""
+        if not text:
+            return
+        with self._lock:
+            parts = (self._partial + text).split('\n')
+            self._partial = parts.pop()
+            for line in parts:
+                self._add(line)
+            while len(self.lines) > self.max_lines:
+                self._evict()
+            if parts:
+                self.version += 1
+
+    def _candidates(self, token):
+        """Líneas con una palabra que empieza por `token` (buscar 'err' encuentra 'error')"""
+        exact = self.tokens.get(token)
+        if exact is not None and len(token) > 3:
+            return set(exact)
+        found = set()
+        for word, numbers in self.tokens.items():
+            if word.startswith(token):
+                found.update(numbers)
+        return found
+
+    def search(self, query='', severity=None, limit=200):
+        """Últimas `limit` líneas que contienen `query` (sin distinguir mayúsculas).
+
+        severity ('error' o 'warning') restringe a esas líneas. Devuelve
+        [(número de línea, texto)] en orden.
+        """
+        needle = query.strip().lower()
+        with self._lock:
+            candidates = None
+            if severity:
+                candidates = set(self.severity.get(severity, ()))
+            for token in TOKEN_RE.findall(needle):
+                found = self._candidates(token)
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    return []
+            results = []
+            if candidates is None:
+                if not needle:
+                    return []
+                # Consulta sin palabras indexables (p. ej. '%'): recorrer las líneas
+                number = self.first + len(self.lines)
+                for line in reversed(self.lines):
+                    number -= 1
+                    if needle in line.lower():
+                        results.append((number, line))
+                        if len(results) >= limit:
+                            break
+            else:
+                for number in sorted(candidates, reverse=True):
+                    # Los candidatos recientes están cerca del final del deque
+                    line = self.lines[number - self.first]
+                    if needle in line.lower():
+                        results.append((number, line))
+                        if len(results) >= limit:
+                            break
+        results.reverse()
+        return results
+
+
+def log_dir():
+    """Directorio de los logs (~/.cache/eggsmaker o $XDG_CACHE_HOME/eggsmaker)"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'eggsmaker')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class Scrollback:
+    """Últimas `max_lines` líneas en memoria y el log completo en disco.
+
+    Las líneas se guardan como bytes UTF-8 en un deque con maxlen, así que el
+    costo en memoria no depende de lo que dure la sesión. Todo lo escrito se
+    vuelca además a `spill_path` (se reescribe en cada sesión) para no perder
+    nada de lo que la terminal descarta.
+
+    Con in_memory=False solo se escribe el log en disco: es para quien ya
+    guarda las líneas en otro sitio (el widget de la terminal de Tk) y solo
+    usa max_lines para recortarlo.
+    """
+
+    def __init__(self, spill_name, max_lines=SCROLLBACK_LINES, in_memory=True):
+        self.lines = deque(maxlen=max_lines if in_memory else 0)
+        self.max_lines = max_lines
+        self.spill_name = spill_name
+        self.spill_path = None
+        self._spill = None
+        self._partial = ''
+        self._lock = threading.Lock()
+
+    def _open_spill(self):
+        try:
+            self.spill_path = os.path.join(log_dir(), self.spill_name)
+            self._spill = open(self.spill_path, 'w', encoding='utf-8', errors='replace')
+        except OSError:
+            self._spill = False
+
+    def write(self, text):
+        """Agrega texto; las líneas incompletas se completan en la próxima escritura"""
+        if not text:
+            return
+        with self._lock:
+            if self._spill is None:
+                self._open_spill()
+            if self._spill:
+                self._spill.write(text)
+                self._spill.flush()
+            if not self.lines.maxlen:
+                return
+            parts = (self._partial + text).split('\n')
+            self._partial = parts.pop()
+            self.lines.extend(line.encode('utf-8', 'replace') for line in parts)
+
+    def clear(self):
+        """Vacía la memoria; el log en disco conserva todo"""
+        with self._lock:
+            self.lines.clear()
+            self._partial = ''
+
+    def text(self):
+        with self._lock:
+            lines = [line.decode('utf-8', 'replace') for line in self.lines]
+            if self._partial:
+                lines.append(self._partial)
+        return '\n'.join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._spill:
+                self._spill.close()
+            self._spill = None
+
+
+def jobs_dir():
+    path = os.path.join(log_dir(), 'jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def job_log_path(job_id):
+    return os.path.join(jobs_dir(), f"{job_id}.log")
+
+
+def list_jobs():
+    """Ids de los trabajos con log en disco, del más viejo al más nuevo"""
+    try:
+        names = os.listdir(jobs_dir())
+    except OSError:
+        return []
+    return sorted(name[:-4] for name in names if name.endswith('.log'))
+
+
+def command_label(cmd):
+    """Nombre corto del comando para cada línea del log: 'eggs produce', 'fresh-eggs.sh'..."""
+    words = [w for w in cmd.replace('&&', ' ').split()
+             if w not in ('sudo', 'env', '-S', '-E', '-SE') and '=' not in w]
+    if not words:
+        return cmd.strip()
+    # En 'cd repo && ./script' lo interesante es lo último
+    if words[0] == 'cd' and len(words) > 2:
+        words = words[2:]
+    label = os.path.basename(words[0])
+    if len(words) > 1 and re.fullmatch(r'[\w.][\w.-]*', words[1]):
+        label += ' ' + words[1]
+    return label
+
+
+_job_counter = itertools.count(1)
+_NEWLINE = re.compile(b'\n')
+
+
+class BuildLog:
+    """Log en disco de un trabajo (produce, dad, tools skel, fresh-eggs.sh...).
+
+    Cada línea lleva la hora y el comando que la produjo. El archivo rota
+    al pasar `max_bytes` (job.log.1, job.log.2...) y junto a él se mantiene
+    un índice disperso (job.log.idx) con el offset de cada INDEX_STRIDE
+    líneas, para abrir logs enormes con LogReader sin recorrerlos enteros.
+    Se usa desde un solo hilo (el que lee la salida del proceso).
+    """
+
+    def __init__(self, command, job_id=None, max_bytes=BUILD_LOG_MAX_BYTES, backups=BUILD_LOG_BACKUPS):
+        self.command = command
+        self.label = command_label(command)
+        self.job_id = job_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_job_counter)}"
+        self.path = job_log_path(self.job_id)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._stamp_second = None
+        self._stamp = ''
+        self._open()
+        self._prune()
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._index = open(self.path + '.idx', 'ab')
+        self.offset = self._file.tell()
+        self.lines = 0
+
+    def _prune(self):
+        for old in list_jobs()[:-BUILD_LOG_JOBS]:
+            base = job_log_path(old)
+            for suffix in ['', '.idx'] + [f'.{n}' for n in range(1, self.backups + 1)]:
+                try:
+                    os.remove(base + suffix)
+                except OSError:
+                    pass
+
+    def _rotate(self):
+        self._file.close()
+        self._index.close()
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        # El índice describe solo el archivo activo
+        os.remove(self.path + '.idx')
+        self._open()
+
+    def write(self, line):
+        """Agrega una línea (sin salto final) con hora y comando"""
+        now = int(time.time())
+        if now != self._stamp_second:
+            self._stamp_second = now
+            self._stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+        data = f"{self._stamp} [{self.label}] {line}\n".encode('utf-8', 'replace')
+        if self.offset + len(data) > self.max_bytes and self.offset:
+            self._rotate()
+        self._file.write(data)
+        self.offset += len(data)
+        self.lines += 1
+        if self.lines % INDEX_STRIDE == 0:
+            array.array('Q', [self.offset]).tofile(self._index)
+
+    def write_text(self, text):
+        for line in text.splitlines():
+            self.write(line)
+
+    def flush(self):
+        self._file.flush()
+        self._index.flush()
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_build_log(command):
+    """BuildLog para `command`, o None si no se puede escribir en el directorio de logs"""
+    try:
+        return BuildLog(command)
+    except OSError:
+        return None
+
+
+class LogReader:
+    """Lectura aleatoria de un log de BuildLog mediante mmap.
+
+    Abrir un log de cientos de MB no lo carga en memoria: el índice disperso
+    da el offset de cada INDEX_STRIDE líneas y solo se recorre el tramo que
+    falta. Si no hay índice (o está incompleto) se completa contando saltos
+    de línea por bloques.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        # offsets[k] = inicio de la línea k * INDEX_STRIDE
+        self.offsets = array.array('Q', [0])
+        try:
+            with open(path + '.idx', 'rb') as f:
+                stored = array.array('Q')
+                stored.frombytes(f.read())
+            self.offsets.extend(o for o in stored if o <= self.size)
+        except (OSError, ValueError):
+            pass
+        self._index_tail()
+
+    def _index_tail(self, block=16 * 1024 * 1024):
+        """Completa el índice desde el último offset conocido hasta el final"""
+        pos = self.offsets[-1]
+        # Posición (entre los saltos de línea que faltan) del que cierra el próximo tramo
+        skip = INDEX_STRIDE - 1
+        while pos < self.size:
+            end = min(pos + block, self.size)
+            chunk = self._map[pos:end]
+            # islice salta los saltos intermedios sin volver a Python por cada línea
+            for match in itertools.islice(_NEWLINE.finditer(chunk), skip, None, INDEX_STRIDE):
+                if pos + match.end() < self.size:
+                    self.offsets.append(pos + match.end())
+            skip = (skip - chunk.count(b'\n')) % INDEX_STRIDE
+            pos = end
+        # Líneas totales: entradas completas más las del último tramo
+        last = self.offsets[-1]
+        tail = self._map[last:self.size]
+        self.line_count = (len(self.offsets) - 1) * INDEX_STRIDE + tail.count(b'\n') + (
+            1 if tail and not tail.endswith(b'\n') else 0)
+
+    def line_offset(self, number):
+        """Offset del inicio de la línea `number` (desde 0)"""
+        block, rest = divmod(number, INDEX_STRIDE)
+        if block >= len(self.offsets):
+            return self.size
+        pos = self.offsets[block]
+        for _n in range(rest):
+            nl = self._map.find(b'\n', pos)
+            if nl < 0:
+                return self.size
+            pos = nl + 1
+        return pos
+
+    def line_at(self, offset):
+        """Número de la línea que contiene el byte `offset`"""
+        block = bisect.bisect_right(self.offsets, offset) - 1
+        start = self.offsets[block]
+        return block * INDEX_STRIDE + self._map[start:offset].count(b'\n')
+
+    def lines(self, start, count):
+        """Hasta `count` líneas desde la número `start`, decodificadas"""
+        begin = self.line_offset(start)
+        end = begin
+        for _n in range(count):
+            nl = self._map.find(b'\n', end)
+            if nl < 0:
+                end = self.size
+                break
+            end = nl + 1
+        return self._map[begin:end].decode('utf-8', 'replace').splitlines()
+
+    def search(self, pattern, start=0, limit=100, ignore_case=True):
+        """Busca `pattern` (texto literal) y devuelve [(número de línea, línea)]"""
+        regex = re.compile(re.escape(pattern.encode('utf-8')), re.IGNORECASE if ignore_case else 0)
+        results = []
+        pos = self.line_offset(start)
+        while len(results) < limit and self.size:
+            match = regex.search(self._map, pos)
+            if not match:
+                break
+            line_start = self._map.rfind(b'\n', 0, match.start()) + 1
+            line_end = self._map.find(b'\n', match.end())
+            if line_end < 0:
+                line_end = self.size
+            results.append((self.line_at(line_start),
+                            self._map[line_start:line_end].decode('utf-8', 'replace')))
+            pos = line_end + 1
+        return results
+
+    def close(self):
+        if self.size:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
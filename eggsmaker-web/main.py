@@ -2,10 +2,15 @@ import asyncio
 import os
 import time
 import shlex
-from nicegui import ui
+import threading
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from nicegui import app, ui
 
 from version import __app__, __version__
 from backend import EggsmakerBackend
+import copy_engine
+import logtools
 
 # Initialize backend
 backend = EggsmakerBackend()
@@ -295,8 +300,34 @@ copy_elapsed = 0
 iso_elapsed = 0
 auto_elapsed = 0
 
+# Phase 3 progress parsed from the produce output
+iso_state = {'stage': None, 'percent': 0, 'eta': None}
+
 # Copy progress state (shared between thread and UI)
-copy_state = {'progress': 0.0, 'percent': 0}
+copy_state = {'progress': 0.0, 'percent': 0, 'targets': {}, 'rate': 0, 'eta': None}
+# Set by the cancel button; the copy engine checks it between blocks
+copy_cancel = threading.Event()
+
+# Bounded console history; the complete log is spilled to disk
+scrollback = logtools.Scrollback('web-console.log')
+# Pending console lines are written out as soon as a command ends
+backend.on_job_end = lambda: flush_log()
+
+# Live search over the console output
+log_index = logtools.LogIndex()
+SEARCH_RESULTS = 200
+SEARCH_SEVERITIES = {'all': 'Todo', 'error': 'Errores', 'warning': 'Advertencias'}
+search_input = None
+search_severity = None
+search_results = None
+search_version = None
+
+# Log pump: lines are pushed to the console in batches, not one message per line
+LOG_FLUSH_INTERVAL = 0.1  # seconds a line may wait before it is sent
+LOG_FLUSH_BYTES = 64 * 1024  # send right away once this much text is pending
+log_pending: list = []
+log_pending_bytes = 0
+log_flush_handle = None
 
 # UI Elements
 console = None
@@ -304,6 +335,7 @@ progress = None
 phase_status = None
 iso_size_label = None
 copy_percent = None
+copy_targets_label = None
 copy_counter_label = None
 copy_time_label = None
 iso_time_label = None
@@ -314,6 +346,7 @@ btn_phase1 = None
 btn_phase2 = None
 btn_phase3 = None
 btn_copy_iso = None
+btn_write_usb = None
 btn_auto = None
 btn_clean = None
 
@@ -325,14 +358,60 @@ edit_config_switch = None
 iso_include_data = None
 iso_max_compression = None
 copy_speed_switch = None
+copy_rate_input = None
+copy_checksum_switch = None
+copy_verify_switch = None
 dest_dir_input = None
+extra_dest_input = None
 fase2_btn = None
 versions_eggs = None
 versions_calamares = None
 
 def append_log(text: str) -> None:
-    if console:
-        console.push(text)
+    global log_pending_bytes, log_flush_handle
+    log_pending.append(text)
+    log_pending_bytes += len(text)
+    if log_pending_bytes >= LOG_FLUSH_BYTES:
+        flush_log()
+    elif log_flush_handle is None:
+        try:
+            log_flush_handle = asyncio.get_running_loop().call_later(LOG_FLUSH_INTERVAL, flush_log)
+        except RuntimeError:
+            # Not on the event loop (e.g. at startup): nothing to batch with
+            flush_log()
+
+def run_search() -> None:
+    """Show the console lines matching the search box, newest at the bottom"""
+    global search_version
+    if search_results is None:
+        return
+    query = search_input.value or ''
+    severity = None if search_severity.value == 'all' else search_severity.value
+    if not query.strip() and not severity:
+        search_version = None
+        search_results.set_visibility(False)
+        return
+    search_version = log_index.version
+    results = log_index.search(query, severity, limit=SEARCH_RESULTS)
+    search_results.clear()
+    search_results.push('\n'.join(f"{number + 1}: {line}" for number, line in results) or 'Sin resultados')
+    search_results.set_visibility(True)
+
+def flush_log() -> None:
+    """Send every pending line to the console as a single push"""
+    global log_pending_bytes, log_flush_handle
+    if log_flush_handle is not None:
+        log_flush_handle.cancel()
+        log_flush_handle = None
+    if log_pending:
+        text = '\n'.join(log_pending)
+        # History, spill file and index take one write per batch, not per line
+        scrollback.write(text + '\n')
+        log_index.write(text + '\n')
+        if console:
+            console.push(text)
+    log_pending.clear()
+    log_pending_bytes = 0
 
 def set_progress(value: float | None, spinning: bool = False) -> None:
     if progress is None:
@@ -348,7 +427,7 @@ def set_progress(value: float | None, spinning: bool = False) -> None:
 async def update_versions() -> None:
     eggs_ver = 'No disponible'
     try:
-        rc, out = await backend.run_capture('eggs --version')
+        rc, out = await backend.run_capture(['eggs', '--version'])
         if rc == 0 and out:
             import re
             m = re.search(r"v?(\d+\.\d+(?:\.\d+)?)", out)
@@ -361,7 +440,7 @@ async def update_versions() -> None:
 
     calamares_ver = 'No disponible'
     try:
-        for cmd in ['calamares --version', 'calamares -v']:
+        for cmd in (['calamares', '--version'], ['calamares', '-v']):
             rc, out = await backend.run_capture(cmd)
             if rc == 0 and out:
                 import re
@@ -414,7 +493,6 @@ def check_sudo() -> bool:
 
 async def do_update_eggs_and_calamares() -> int:
     if not check_sudo(): return -1
-    import shlex  # Import at function level for all code paths
     try:
         home = os.path.expanduser('~')
         repo_dir = os.path.join(home, 'fresh-eggs')
@@ -425,7 +503,8 @@ async def do_update_eggs_and_calamares() -> int:
             if rc != 0: return rc
         
         append_log('Clonando repositorio de Eggs...')
-        rc = await backend.run_stream(f"git clone --quiet https://github.com/pieroproietti/fresh-eggs {shlex.quote(repo_dir)}", append_log)
+        rc = await backend.run_stream(f"git clone --quiet https://github.com/pieroproietti/fresh-eggs {shlex.quote(repo_dir)}", append_log,
+                                     line_filter=logtools.INSTALLER)
         if rc != 0: return rc
         
         script_path = os.path.join(repo_dir, 'fresh-eggs.sh')
@@ -436,7 +515,7 @@ async def do_update_eggs_and_calamares() -> int:
         # This is important because fresh-eggs.sh may have relative path dependencies
         append_log('Ejecutando instalador...')
         cd_and_exec = f"cd {shlex.quote(repo_dir)} && sudo ./fresh-eggs.sh"
-        rc = await backend.run_stream(cd_and_exec, append_log)
+        rc = await backend.run_stream(cd_and_exec, append_log, line_filter=logtools.INSTALLER)
         if rc != 0: return rc
         
         append_log('¡Actualización completada exitosamente!')
@@ -505,14 +584,14 @@ async def do_preparation() -> None:
     
     eggs = await backend.get_cmd_eggs()
     cmds = [
-        f"{eggs} kill -n",
-        f"{eggs} tools clean -n",
-        f"{eggs} dad -d",
+        [eggs, 'kill', '-n'],
+        [eggs, 'tools', 'clean', '-n'],
+        [eggs, 'dad', '-d'],
     ]
     
     try:
         if calamares_update and calamares_update.value:
-            cmds.append(f"{eggs} calamares --install")
+            cmds.append([eggs, 'calamares', '--install'])
     except Exception:
         pass
 
@@ -526,7 +605,10 @@ async def do_preparation() -> None:
                 phase_status.text = ''
                 phase_status.classes(remove='status-executing')
                 phase_status.update()
-            ui.notify('Error durante la preparación', type='negative')
+            if backend.cancelled:
+                ui.notify('Preparación cancelada', type='warning')
+            else:
+                ui.notify('Error durante la preparación', type='negative')
             # Error state
             if btn_phase1:
                 btn_phase1.props(remove='color disable')
@@ -559,12 +641,11 @@ async def edit_config_dialog() -> None:
     append_log("DEBUG: edit_config_dialog called")
     try:
         config_file = "/etc/penguins-eggs.d/eggs.yaml"
-        # import shlex # Already imported globally
-        # Use sudo to read the file
+        # Root-owned: read through the root helper (or sudo cat without it)
         append_log(f"DEBUG: Reading {config_file}")
-        rc, content = await backend.run_capture(f"sudo cat {shlex.quote(config_file)}")
-        append_log(f"DEBUG: read rc={rc}, content_len={len(content) if content else 0}")
-        if rc != 0 or not content:
+        content = await backend.read_root_file(config_file)
+        append_log(f"DEBUG: content_len={len(content) if content else 0}")
+        if not content:
             ui.notify('No se pudo leer eggs.yaml (verifique permisos/sudo)', type='warning')
             return
     except Exception as e:
@@ -613,12 +694,8 @@ async def edit_config_dialog() -> None:
                                     break
                             if not replaced:
                                 new_lines.append(line)
-                        temp_path = "/tmp/eggs_yaml_tmp"
-                        with open(temp_path, 'w') as f:
-                            f.writelines(new_lines)
-                        # Use sudo to install the file back
-                        rc = await backend.run_stream(f"sudo install -m 644 {shlex.quote(temp_path)} {shlex.quote(config_file)}", append_log)
-                        if rc == 0:
+                        # Atomic replace as root, keeping mode and owner
+                        if await backend.write_root_file(config_file, ''.join(new_lines), append_log):
                             ui.notify('Configuración guardada', type='positive')
                             d.close()
                         else:
@@ -660,7 +737,7 @@ async def do_phase2() -> None:
     if replica_switch and replica_switch.value:
         any_action = True
         # Use sudo for skel
-        rc = await backend.run_stream(f"sudo {eggs} tools skel", append_log)
+        rc = await backend.run_stream([eggs, 'tools', 'skel'], append_log)
         if rc != 0:
             ui.notify('Error al clonar escritorio', type='negative')
             # Error state
@@ -721,17 +798,33 @@ async def do_generate_iso() -> None:
         phase_status.style(f"color: {COLORS['success']}")
         phase_status.update()
     set_progress(None, spinning=True)
+    iso_state.update(stage=None, percent=0, eta=None)
     
     eggs = await backend.get_cmd_eggs()
     if iso_max_compression.value:
-        cmd = f"sudo {eggs} produce --pendrive -n"
+        cmd = [eggs, 'produce', '--pendrive', '-n']
     elif iso_include_data.value:
-        cmd = f"sudo {eggs} produce --clone -n"
+        cmd = [eggs, 'produce', '--clone', '-n']
     else:
-        cmd = f"sudo {eggs} produce --noicon -n"
-        
-    rc = await backend.run_stream(cmd, append_log)
+        cmd = [eggs, 'produce', '--noicon', '-n']
+
+    produce = logtools.ProduceProgress()
+
+    def on_produce_line(line: str) -> None:
+        event = produce.feed(line)
+        if event:
+            if event['changed']:
+                # Stage banners and meters turn the spinner into a real bar
+                set_progress(event['fraction'])
+                iso_state.update(stage=event['stage'], percent=int(event['stage_percent']), eta=event['eta'])
+            if event['meter']:
+                return
+        append_log(line)
+
+    # A cancelled build leaves a half-made nest behind: eggs kill unmounts and removes it
+    rc = await backend.run_stream(cmd, on_produce_line, cleanup=[eggs, 'kill', '-n'])
     iso_generating = False
+    iso_state.update(stage=None, percent=0, eta=None)
     set_progress(0)
     
     if rc == 0:
@@ -757,9 +850,12 @@ async def do_generate_iso() -> None:
         if phase_status:
             phase_status.classes(remove='status-executing')
             phase_status.update()
-        ui.notify('Error al generar ISO', type='negative')
+        if backend.cancelled:
+            ui.notify('Generación de ISO cancelada', type='warning')
+        else:
+            ui.notify('Error al generar ISO', type='negative')
 
-async def open_dir_picker(target_input=None) -> None:
+async def open_dir_picker(target_input=None, append: bool = False) -> None:
     append_log("DEBUG: open_dir_picker called")
     try:
         current_path = backend.get_home_dir()
@@ -797,7 +893,12 @@ async def open_dir_picker(target_input=None) -> None:
                 with ui.row().classes('w-full justify-end mt-4'):
                     ui.button('Cancelar', on_click=d.close).classes('mr-2 bg-red-600 hover:bg-red-700')
                     def select():
-                        if target_input:
+                        if target_input and append:
+                            paths = [p for p in (target_input.value or '').split(';') if p.strip()]
+                            if current_path not in paths:
+                                paths.append(current_path)
+                            target_input.value = ';'.join(paths)
+                        elif target_input:
                             target_input.value = current_path
                         elif dest_dir_input:
                             dest_dir_input.value = current_path
@@ -845,6 +946,59 @@ async def ask_copy_options_auto() -> bool:
     d.open()
     return await future
 
+ISO_SOURCE_DIRS = ["/home/eggs/", "/home/eggs/.mnt/"]  # Prioritize /home/eggs/
+
+def find_source_iso() -> str | None:
+    for p in ISO_SOURCE_DIRS:
+        if os.path.exists(p):
+            try:
+                files = [f for f in os.listdir(p) if f.endswith('.iso')]
+                if files:
+                    return os.path.join(p, files[0])
+            except PermissionError:
+                continue
+    return None
+
+def copy_limits() -> dict:
+    """Rate limit and I/O priority for the copy engine ('Rápida' disables both)"""
+    if copy_speed_switch and copy_speed_switch.value:
+        return {}
+    try:
+        rate_mb = float(copy_rate_input.value) if copy_rate_input and copy_rate_input.value else copy_engine.SLOW_RATE_MB
+    except (TypeError, ValueError):
+        rate_mb = copy_engine.SLOW_RATE_MB
+    return {'rate_limit': rate_mb * 1024 * 1024, 'ionice': ('best-effort', 7)}
+
+async def verify_copies(src: str, dsts: list) -> list:
+    """Re-read each copy from the media and compare it with the source ISO.
+
+    Returns the destinations that failed the check.
+    """
+    failed = []
+    for dst in dsts:
+        append_log(f"Verificando {dst}...")
+        copy_state['progress'] = 0.0
+        copy_state['percent'] = 0
+        copy_state['rate'] = 0
+        copy_state['eta'] = None
+
+        def on_verify(checked, total):
+            copy_state['progress'] = checked / total if total else 1.0
+            copy_state['percent'] = int(copy_state['progress'] * 100)
+
+        try:
+            result = await asyncio.to_thread(copy_engine.verify_copy, src, dst, on_verify, cancel=copy_cancel)
+        except OSError as e:
+            append_log(f"No se pudo verificar {dst}: {e}")
+            failed.append(dst)
+            continue
+        if result['ok']:
+            append_log(f"Verificación correcta: {dst}")
+        else:
+            append_log(f"La copia {dst} difiere del original a partir del byte {result['mismatch']}")
+            failed.append(dst)
+    return failed
+
 async def do_copy_iso() -> None:
     append_log("DEBUG: do_copy_iso called")
     global copying, copy_elapsed, copy_count, copy_state, btn_copy_iso
@@ -860,9 +1014,13 @@ async def do_copy_iso() -> None:
     
     copying = True
     copy_elapsed = 0
+    copy_cancel.clear()
     # Reset copy state
     copy_state['progress'] = 0.0
     copy_state['percent'] = 0
+    copy_state['targets'] = {}
+    copy_state['rate'] = 0
+    copy_state['eta'] = None
     if phase_status:
         phase_status.text = 'Ejecutando: Copiar ISO'
         phase_status.classes(add='status-executing')
@@ -874,67 +1032,54 @@ async def do_copy_iso() -> None:
         progress.update()
     set_progress(0)  # Start with 0% instead of spinning
     
-    # Determine destination directory
+    # Determine destination directories (main one plus optional fan-out targets)
     dest_dir = dest_dir_input.value if (dest_dir_input and dest_dir_input.value) else os.path.expanduser('~')
-    if not os.path.isdir(dest_dir):
-        ui.notify('Directorio destino no existe', type='warning')
-        append_log(f'Directorio destino no existe: {dest_dir}')
-        copying = False
-        set_progress(0)
-        if phase_status: phase_status.text = ''; phase_status.update()
-        return
+    dest_dirs = [dest_dir]
+    if extra_dest_input and extra_dest_input.value:
+        for extra in extra_dest_input.value.split(';'):
+            extra = extra.strip()
+            if extra and extra not in dest_dirs:
+                dest_dirs.append(extra)
+    for d in dest_dirs:
+        if not os.path.isdir(d):
+            ui.notify('Directorio destino no existe', type='warning')
+            append_log(f'Directorio destino no existe: {d}')
+            copying = False
+            set_progress(0)
+            if phase_status: phase_status.text = ''; phase_status.update()
+            return
         
     # Find ISO file
-    src_iso_path = None
-    possible_src_dirs = ["/home/eggs/", "/home/eggs/.mnt/"] # Prioritize /home/eggs/
-    
-    for p in possible_src_dirs:
-        if os.path.exists(p):
-            try:
-                files = [f for f in os.listdir(p) if f.endswith('.iso')]
-                if files:
-                    src_iso_path = os.path.join(p, files[0])
-                    break
-            except PermissionError:
-                continue
-                
+    src_iso_path = find_source_iso()
     if not src_iso_path:
         append_log('No se encontraron archivos ISO para copiar')
-        append_log(f"DEBUG: Checked paths: {possible_src_dirs}")
+        append_log(f"DEBUG: Checked paths: {ISO_SOURCE_DIRS}")
         ui.notify('No se encontró ISO para copiar', type='warning')
         copying = False
         set_progress(0)
         if phase_status: phase_status.text = ''; phase_status.update()
         return
             
+    # Single-destination copy result (stays None for fan-out and the dd fallback)
+    result = None
     try:
         append_log(f"DEBUG: Found ISO: {src_iso_path}")
         dst = os.path.join(dest_dir, os.path.basename(src_iso_path))
         
+        limits = copy_limits()
+        checksum = 'sha256' if (copy_checksum_switch and copy_checksum_switch.value) else None
+        verify = bool(copy_verify_switch and copy_verify_switch.value)
+
         # Define blocking copy function to run in thread
         def blocking_copy():
             """Blocking file copy that runs in thread pool"""
-            total = os.path.getsize(src_iso_path)
-            copied = 0
-            chunk = 1024 * 1024  # 1MB chunks
-            
-            with open(src_iso_path, 'rb') as s, open(dst, 'wb') as d:
-                while True:
-                    data = s.read(chunk)
-                    if not data:
-                        break
-                    d.write(data)
-                    copied += len(data)
-                    
-                    # Update shared state
-                    copy_state['progress'] = copied / total
-                    copy_state['percent'] = int((copied / total) * 100)
-                    
-                    # Add delay for slow copy if not rapid mode
-                    if not (copy_speed_switch and copy_speed_switch.value):
-                        time.sleep(0.01)
-            
-            return total
+            def on_progress(copied, total):
+                # Update shared state
+                copy_state['progress'] = copied / total if total else 1.0
+                copy_state['percent'] = int(copy_state['progress'] * 100)
+
+            return copy_engine.copy_file(src_iso_path, dst, progress=on_progress, checksum=checksum,
+                                         resume=True, cancel=copy_cancel, **limits)
         
         # Start progress updater - only update shared state, not UI directly
         async def update_copy_progress():
@@ -947,9 +1092,61 @@ async def do_copy_iso() -> None:
         # Run copy and progress updater concurrently
         progress_task = asyncio.create_task(update_copy_progress())
         
+        if len(dest_dirs) > 1:
+            # Fan-out: read the ISO once and write every destination in parallel
+            dsts = [os.path.join(d, os.path.basename(src_iso_path)) for d in dest_dirs]
+            copy_state['targets'] = {d: 0 for d in dsts}
+
+            def blocking_fanout():
+                def on_target_progress(index, written, total):
+                    copy_state['targets'][dsts[index]] = int(written / total * 100) if total else 100
+                    # The job only moves as fast as its slowest writer
+                    slowest = min(copy_state['targets'].values())
+                    copy_state['progress'] = slowest / 100
+                    copy_state['percent'] = slowest
+
+                return copy_engine.copy_file_multi(src_iso_path, dsts, progress=on_target_progress,
+                                                   checksum=checksum, cancel=copy_cancel, **limits)
+
+            results = await asyncio.to_thread(blocking_fanout)
+            ok = [r for r in results if r['error'] is None]
+            for r in results:
+                if r['error'] is None:
+                    append_log(f"ISO copiada a: {r['path']}")
+                else:
+                    append_log(f"Error al copiar a {r['path']}: {r['error']}")
+            if ok and ok[0].get('digest'):
+                append_log(f"{ok[0]['algorithm'].upper()}: {ok[0]['digest']}")
+            if verify and ok:
+                bad = await verify_copies(src_iso_path, [r['path'] for r in ok])
+                ok = [r for r in ok if r['path'] not in bad]
+            copy_count += len(ok)
+            if copy_counter_label:
+                copy_counter_label.text = f"Copias realizadas: {copy_count}"; copy_counter_label.update()
+            if not ok:
+                raise Exception("Fallaron todos los destinos")
+            if btn_copy_iso:
+                btn_copy_iso.props(remove='color disable')
+                btn_copy_iso.classes(remove='btn-executing', add='btn-success')
+                btn_copy_iso.text = '✓ Copiada'
+                btn_copy_iso.update()
+            if phase_status:
+                phase_status.classes(remove='status-executing', add='status-success')
+                phase_status.update()
+            failed = len(results) - len(ok)
+            ui.notify(f"ISO copiada a {len(ok)} destino(s)" + (f", {failed} con error" if failed else ''),
+                      type='warning' if failed else 'positive')
+            return
+
         # Try direct copy first (run in thread to not block event loop)
         try:
-            total = await asyncio.to_thread(blocking_copy)
+            result = await asyncio.to_thread(blocking_copy)
+            append_log(f"Método de copia: {result['method']}")
+            if result.get('resumed_from'):
+                append_log(f"Copia reanudada desde {backend.format_size(result['resumed_from'])}")
+            if result.get('digest'):
+                append_log(f"{result['algorithm'].upper()}: {result['digest']}")
+                append_log(f"Suma guardada en: {result['checksum_file']}")
         except PermissionError:
             # Fallback to sudo copy if direct copy fails due to permissions
             if not check_sudo(): 
@@ -960,12 +1157,32 @@ async def do_copy_iso() -> None:
                 
             append_log('Permiso denegado. Intentando copia con sudo...')
             # Use dd with sudo for robust copying
-            cmd = f"sudo dd if={shlex.quote(src_iso_path)} of={shlex.quote(dst)} bs=4M status=progress"
-            # We can't easily track progress with dd in run_stream without parsing, 
-            # so we'll just run it. Progress bar will remain spinning.
-            rc = await backend.run_stream(cmd, append_log)
+            cmd = ['dd', f"if={src_iso_path}", f"of={dst}", 'bs=4M', 'status=progress']
+            try:
+                total = os.path.getsize(src_iso_path)
+            except OSError:
+                total = 0
+            # dd would only notice a full disk at the very end
+            copy_engine.check_free_space(dst, total)
+
+            def on_dd_progress(copied: int, elapsed: float) -> None:
+                # dd's \r progress lines are parsed by run_stream
+                if total:
+                    copy_state['progress'] = min(1.0, copied / total)
+                    copy_state['percent'] = int(copy_state['progress'] * 100)
+                rate = copied / elapsed if elapsed > 0 else 0
+                copy_state['rate'] = rate
+                copy_state['eta'] = (total - copied) / rate if (rate and total) else None
+
+            rc = await backend.run_stream(cmd, append_log, progress_callback=on_dd_progress,
+                                          cleanup=['rm', '-f', dst])
+            if backend.cancelled:
+                raise copy_engine.CopyCancelled(f"Copia cancelada: {dst}")
             if rc != 0:
                 raise Exception("Fallo la copia con sudo")
+
+        if verify and await verify_copies(src_iso_path, [dst]):
+            raise Exception("La copia no coincide con la ISO original")
                     
         copy_count += 1
         if copy_counter_label:
@@ -983,7 +1200,10 @@ async def do_copy_iso() -> None:
             phase_status.classes(remove='status-executing', add='status-success')
             phase_status.update()
         
-        ui.notify('ISO copiada exitosamente', type='positive')
+        if result and result.get('digest'):
+            ui.notify(f"ISO copiada exitosamente\n{result['algorithm'].upper()}: {result['digest']}", type='positive', multi_line=True, timeout=0, close_button='OK')
+        else:
+            ui.notify('ISO copiada exitosamente', type='positive')
     except Exception as e:
         append_log(f"Error al copiar la ISO: {e}")
         
@@ -999,7 +1219,8 @@ async def do_copy_iso() -> None:
             phase_status.classes(remove='status-executing')
             phase_status.update()
         
-        ui.notify(f'Error al copiar la ISO: {e}', type='negative')
+        ui.notify(f'Error al copiar la ISO: {e}',
+                  type='warning' if isinstance(e, copy_engine.CopyCancelled) else 'negative')
     finally:
         copying = False
         # Cancel progress updater task if it exists
@@ -1019,25 +1240,190 @@ async def do_copy_iso() -> None:
             copy_percent.style('color: white; font-size: 18px; font-weight: bold;')
             copy_percent.classes(remove='status-executing status-success')
             copy_percent.update()
+        if copy_targets_label:
+            copy_targets_label.text = ''
+            copy_targets_label.update()
         if phase_status: 
             phase_status.text = ''
             phase_status.classes(remove='status-executing status-success')
             phase_status.update()
 
+async def do_write_usb(device: str) -> None:
+    global copying, copy_elapsed, copy_count
+    if not check_sudo(): return
+    src_iso_path = find_source_iso()
+    if not src_iso_path:
+        ui.notify('No se encontró ISO para grabar', type='warning')
+        return
+
+    copying = True
+    copy_elapsed = 0
+    copy_state['progress'] = 0.0
+    copy_state['percent'] = 0
+    copy_state['targets'] = {}
+    copy_state['rate'] = 0
+    copy_state['eta'] = None
+    if btn_write_usb:
+        btn_write_usb.props('color=red disable')
+        btn_write_usb.update()
+    if phase_status:
+        phase_status.text = f'Ejecutando: Grabar ISO en {device}'
+        phase_status.classes(add='status-executing')
+        phase_status.style(f"color: {COLORS['success']}")
+        phase_status.update()
+    if progress:
+        progress.props('color=deep-orange')
+        progress.update()
+    set_progress(0)
+
+    def on_progress(written: int, total: int) -> None:
+        copy_state['progress'] = written / total if total else 1.0
+        copy_state['percent'] = int(copy_state['progress'] * 100)
+
+    try:
+        append_log(f"Grabando {src_iso_path} en {device} (O_DIRECT)")
+        rc = await backend.write_iso_to_device(src_iso_path, device, append_log, on_progress)
+        if rc != 0:
+            raise Exception(f"código de salida {rc}")
+        copy_count += 1
+        if copy_counter_label:
+            copy_counter_label.text = f"Copias realizadas: {copy_count}"; copy_counter_label.update()
+        append_log(f"ISO grabada en: {device}")
+        if phase_status:
+            phase_status.classes(remove='status-executing', add='status-success')
+            phase_status.update()
+        ui.notify(f'ISO grabada en {device}', type='positive')
+    except Exception as e:
+        append_log(f"Error al grabar la ISO: {e}")
+        ui.notify(f'Error al grabar la ISO: {e}', type='negative')
+    finally:
+        copying = False
+        set_progress(0)
+        if progress:
+            progress.props('color=light-blue')
+            progress.update()
+        if btn_write_usb:
+            btn_write_usb.props(remove='color disable')
+            btn_write_usb.update()
+        if copy_percent:
+            copy_percent.text = "0%"
+            copy_percent.style('color: white; font-size: 18px; font-weight: bold;')
+            copy_percent.update()
+        if phase_status:
+            phase_status.text = ''
+            phase_status.classes(remove='status-executing status-success')
+            phase_status.update()
+
+async def open_usb_dialog() -> None:
+    devices = await backend.list_usb_devices()
+    if not devices:
+        ui.notify('No se encontraron dispositivos USB', type='warning')
+        return
+    options = {d['path']: f"{d['path']} - {d['model'] or 'USB'} ({backend.format_size(d['size'])})" for d in devices}
+    with ui.dialog() as d, ui.card().classes('w-[500px] egg-panel'):
+        ui.label('Grabar ISO en USB').classes('text-xl font-bold mb-2 text-white')
+        select = ui.select(options, value=devices[0]['path']).props('dark').classes('w-full mb-2')
+        ui.label('Se borrarán TODOS los datos del dispositivo seleccionado.').classes('text-red-500 font-bold')
+
+        def confirm():
+            d.close()
+            asyncio.create_task(do_write_usb(select.value))
+
+        with ui.row().classes('w-full justify-end mt-4'):
+            ui.button('Cancelar', on_click=d.close).classes('mr-2 bg-red-600 hover:bg-red-700')
+            ui.button('Grabar', on_click=confirm).classes('egg-button')
+    d.open()
+
+JOB_LOG_PAGE = 200  # lines shown at a time in the job log viewer
+
+def open_job_logs_dialog() -> None:
+    """Browse the on-disk job logs; LogReader mmaps them, so even huge logs open instantly"""
+    jobs = logtools.list_jobs()
+    if not jobs:
+        ui.notify('Todavía no hay logs de trabajos', type='info')
+        return
+    state = {'reader': None}
+    with ui.dialog() as d, ui.card().classes('w-[900px] max-w-full egg-panel'):
+        ui.label('Logs de trabajos').classes('text-xl font-bold mb-2 text-white')
+        with ui.row().classes('w-full items-center'):
+            job_select = ui.select(list(reversed(jobs)), value=jobs[-1]).props('dark dense').classes('flex-grow')
+            line_input = ui.number('Línea', value=1, min=1, format='%.0f').props('dark dense').classes('w-28')
+            search_input = ui.input(placeholder='Buscar').props('dark dense').classes('w-48')
+        info = ui.label('').classes('text-gray-400')
+        view = ui.log(max_lines=JOB_LOG_PAGE).classes('w-full h-[400px] egg-terminal p-2')
+
+        def show(start: int) -> None:
+            reader = state['reader']
+            lines = reader.lines(start, JOB_LOG_PAGE)
+            view.clear()
+            if lines:
+                view.push('\n'.join(lines))
+            info.text = f"Líneas {start + 1}-{start + len(lines)} de {reader.line_count}"
+
+        def load() -> None:
+            if state['reader']:
+                state['reader'].close()
+            state['reader'] = logtools.LogReader(logtools.job_log_path(job_select.value))
+            # Open at the end, like a terminal
+            show(max(0, state['reader'].line_count - JOB_LOG_PAGE))
+
+        def search() -> None:
+            if not search_input.value:
+                return
+            results = state['reader'].search(search_input.value, limit=JOB_LOG_PAGE)
+            view.clear()
+            if results:
+                view.push('\n'.join(f"{number + 1}: {line}" for number, line in results))
+            info.text = f"{len(results)} coincidencias" + (' (mostrando las primeras)' if len(results) == JOB_LOG_PAGE else '')
+
+        def close() -> None:
+            if state['reader']:
+                state['reader'].close()
+            d.close()
+
+        job_select.on_value_change(lambda e: load())
+        line_input.on('keydown.enter', lambda: show(max(0, int(line_input.value or 1) - 1)))
+        search_input.on('keydown.enter', search)
+        with ui.row().classes('w-full justify-end mt-2'):
+            ui.button('Cerrar', on_click=close).classes('egg-button')
+        load()
+    d.open()
+
+def cancel_jobs() -> None:
+    """Stop whatever is running: commands get SIGTERM and then SIGKILL, copies drop their partial file"""
+    copy_cancel.set()
+    if backend.cancel_jobs() or copying:
+        append_log('Cancelando...')
+        ui.notify('Cancelando...', type='warning')
+    else:
+        ui.notify('No hay ningún trabajo en ejecución', type='info')
+
+def confirm_cancel_jobs() -> None:
+    with ui.dialog() as dlg, ui.card().classes('egg-panel'):
+        ui.label('¿Cancelar el trabajo en curso?').classes('text-bold text-white')
+        ui.label('Se detendrán los procesos y se eliminarán los archivos a medio generar.').classes('text-white')
+        with ui.row().classes('w-full justify-end'):
+            ui.button('No', on_click=dlg.close).classes('egg-button')
+            ui.button('Cancelar trabajo', on_click=lambda: (dlg.close(), cancel_jobs())).props('color=red')
+    dlg.open()
+
 async def do_clean_session() -> None:
     append_log("DEBUG: do_clean_session called")
     if not check_sudo(): 
         append_log("DEBUG: check_sudo failed in do_clean_session")
         return
     target = '/home/eggs'
+    if backend.running_jobs:
+        # Removing the nest under a running produce would pull files from under it
+        ui.notify('Hay trabajos en ejecución: cancélalos antes de limpiar la sesión', type='warning')
+        return
     
     async def _get_size() -> str:
         try:
-            # Use sudo to check size as /home/eggs might be root owned
-            append_log("DEBUG: Running du -sh")
-            rc, out = await backend.run_capture(f"sudo du -sh {shlex.quote(target)} || true")
-            append_log(f"DEBUG: du rc={rc}, out={out}")
-            if out: return out.strip().split()[0]
+            # /home/eggs is root owned: measured by the root helper (or sudo du)
+            size = await backend.path_size(target)
+            append_log(f"DEBUG: du size={size}")
+            if size: return backend.format_size(size)
             return 'No existe/Vacío'
         except Exception as e:
             append_log(f"DEBUG: du error: {e}")
@@ -1059,15 +1445,17 @@ async def do_clean_session() -> None:
                     phase_status.update()
                 set_progress(None, spinning=True)
                 append_log(f"Eliminando {target} ...")
-                import shlex
-                # Ensure sudo is used for deletion
-                rc = await backend.run_stream(f"sudo rm -rf {shlex.quote(target)}", append_log)
+                # Never recurses into the system a failed produce left mounted
+                rc = await backend.remove_tree(target, append_log)
                 set_progress(0)
                 if phase_status:
                     phase_status.text = ''
                     phase_status.update()
                 if rc == 0:
                     ui.notify('Sesión limpiada', type='positive')
+                    flush_log()
+                    scrollback.clear()
+                    log_index.clear()
                     if console: console.clear()
                     
                     # Reset timers
@@ -1178,7 +1566,11 @@ async def do_auto() -> None:
     
     try:
         await do_preparation()
+        if backend.cancelled:
+            raise Exception('cancelado por el usuario')
         await do_generate_iso()
+        if backend.cancelled:
+            raise Exception('cancelado por el usuario')
         
         # Ask for copy options
         if not await ask_copy_options_auto():
@@ -1216,6 +1608,9 @@ async def do_auto() -> None:
 
 async def update_timers() -> None:
     global copy_elapsed, iso_elapsed, auto_elapsed
+    # An active search follows the output as it streams in
+    if search_version is not None and search_version != log_index.version:
+        run_search()
     if copying:
         copy_elapsed += 1
         if copy_time_label:
@@ -1226,13 +1621,27 @@ async def update_timers() -> None:
             pct = copy_state.get('percent', 0)
             p = copy_state.get('progress', 0.0)
             set_progress(p)
-            copy_percent.text = f"{pct}%"
+            text = f"{pct}%"
+            if copy_state.get('rate'):
+                text += f" · {backend.format_size(int(copy_state['rate']))}/s"
+                if copy_state.get('eta') is not None:
+                    text += f" · ETA {time.strftime('%H:%M:%S', time.gmtime(copy_state['eta']))}"
+            copy_percent.text = text
             copy_percent.style('color: red; font-size: 18px; font-weight: bold;')
             copy_percent.update()
+        targets = copy_state.get('targets') or {}
+        if copy_targets_label and len(targets) > 1:
+            copy_targets_label.text = ' · '.join(f"{os.path.basename(os.path.dirname(p)) or p}: {v}%" for p, v in targets.items())
+            copy_targets_label.update()
     if iso_generating:
         iso_elapsed += 1
         if iso_time_label:
-            iso_time_label.text = f"Generación: {time.strftime('%H:%M:%S', time.gmtime(iso_elapsed))}"
+            text = f"Generación: {time.strftime('%H:%M:%S', time.gmtime(iso_elapsed))}"
+            if iso_state['stage']:
+                text += f" · {iso_state['stage']} {iso_state['percent']}%"
+                if iso_state['eta'] is not None:
+                    text += f" · ETA {time.strftime('%H:%M:%S', time.gmtime(iso_state['eta']))}"
+            iso_time_label.text = text
             iso_time_label.update()
     if auto_running:
         auto_elapsed += 1
@@ -1246,10 +1655,10 @@ async def update_timers() -> None:
 def main_page():
     global versions_eggs, versions_calamares
     global phase_status, copy_percent, copy_counter_label, copy_time_label, iso_time_label, Total_time_label
-    global progress, console
-    global prep_manual, calamares_update, replica_switch, edit_config_switch, iso_include_data, iso_max_compression, copy_speed_switch
-    global iso_size_label, dest_dir_input, fase2_btn
-    global btn_phase1, btn_phase2, btn_phase3, btn_copy_iso, btn_auto, btn_clean
+    global progress, console, search_input, search_severity, search_results
+    global prep_manual, calamares_update, replica_switch, edit_config_switch, iso_include_data, iso_max_compression, copy_speed_switch, copy_rate_input, copy_checksum_switch, copy_verify_switch
+    global iso_size_label, dest_dir_input, extra_dest_input, copy_targets_label, fase2_btn
+    global btn_phase1, btn_phase2, btn_phase3, btn_copy_iso, btn_write_usb, btn_auto, btn_clean
 
     ui.add_head_html("<style>{}</style>".format(THEME_CSS))
 
@@ -1270,9 +1679,22 @@ def main_page():
             versions_eggs = ui.label("Penguins' Eggs: N/A")
             versions_calamares = ui.label("Calamares: N/A")
 
+    # Search over the terminal output (backed by log_index)
+    with ui.row().classes('w-full items-center q-pa-none q-ma-none'):
+        search_input = ui.input(placeholder='Buscar en la salida...', on_change=lambda e: run_search()).props('dense dark clearable debounce=150').classes('flex-grow')
+        search_severity = ui.select(SEARCH_SEVERITIES, value='all', on_change=lambda e: run_search()).props('dense dark').classes('w-40')
+    search_results = ui.log(max_lines=SEARCH_RESULTS).classes('w-full h-[120px] egg-terminal p-2')
+    search_results.set_visibility(False)
+
     # Terminal area
     with ui.row().classes('w-full q-pa-none q-ma-none q-mt-none main-top-row'):
-        console = ui.log().classes('w-full h-[300px] egg-terminal p-2 overflow-y-auto')
+        # Pending lines go to the old page; the history below already has them
+        flush_log()
+        console = ui.log(max_lines=logtools.SCROLLBACK_LINES).classes('w-full h-[300px] egg-terminal p-2 overflow-y-auto')
+        # A reloaded page gets the recent history back
+        history = scrollback.text()
+        if history:
+            console.push(history)
 
     # Main controls
     with ui.row().classes('w-full items-stretch q-gutter-sm q-pa-none q-ma-none q-mt-none'):
@@ -1300,11 +1722,21 @@ def main_page():
         # Copiar ISO
         with ui.card().classes('min-w-[240px] egg-panel flex flex-col q-pa-xs'):
             ui.label('Copiar ISO').classes('egg-title')
-            copy_speed_switch = ui.switch('Rápida', value=False).props('dense')
+            with ui.row().classes('w-full items-center'):
+                copy_speed_switch = ui.switch('Rápida', value=False).props('dense')
+                copy_rate_input = ui.number('MB/s', value=copy_engine.SLOW_RATE_MB, min=1, format='%.0f').props('dense dark').classes('w-20').tooltip('Límite de la copia lenta')
+                copy_rate_input.bind_enabled_from(copy_speed_switch, 'value', backward=lambda v: not v)
+            with ui.row().classes('w-full items-center'):
+                copy_checksum_switch = ui.switch('SHA256', value=False).props('dense').tooltip('Calcular la suma durante la copia')
+                copy_verify_switch = ui.switch('Verificar', value=False).props('dense').tooltip('Releer la copia desde el medio y compararla con la ISO')
             with ui.row().classes('w-full items-center'):
                 dest_dir_input = ui.input('', value=os.path.expanduser('~'), placeholder='Destino').props('dense').classes('flex-grow')
                 ui.button(icon='folder', on_click=lambda: open_dir_picker(dest_dir_input)).props('flat dense').classes('ml-1')
+            with ui.row().classes('w-full items-center'):
+                extra_dest_input = ui.input('', placeholder='Destinos extra (separados por ;)').props('dense').classes('flex-grow')
+                ui.button(icon='add', on_click=lambda: open_dir_picker(extra_dest_input, append=True)).props('flat dense').classes('ml-1').tooltip('Agregar destino')
             btn_copy_iso = ui.button('Copiar ISO', on_click=lambda: asyncio.create_task(do_copy_iso())).style('background-color: #091f9e !important; font-weight: bold !important').classes('mt-auto w-full')
+            btn_write_usb = ui.button('Grabar en USB', icon='usb', on_click=open_usb_dialog).style('background-color: #091f9e !important; font-weight: bold !important').classes('w-full mt-1')
             
         # AUTO
         with ui.card().classes('min-w-[240px] egg-panel flex flex-col q-pa-xs'):
@@ -1356,6 +1788,7 @@ def main_page():
                 # Left: Percentage and Copies
                 with ui.row().classes('items-center').style('gap: 16px;'):
                     copy_percent = ui.label("0%").style('color: white; font-size: 18px; font-weight: bold;')
+                    copy_targets_label = ui.label('').style('color: #FD8637; font-size: 14px; font-weight: bold;')
                     copy_counter_label = ui.label("Copias realizadas: 0").style('color: white; font-size: 14px; font-weight: bold;')
                 
                 # Center: ISO Size
@@ -1393,6 +1826,8 @@ def main_page():
         with ui.row().classes('w-full items-center relative-position'):
             # Left: Info button
             ui.button(icon='info', on_click=show_about_dialog).props('flat round dense color=white').tooltip('Acerca de')
+            ui.button(icon='history', on_click=open_job_logs_dialog).props('flat round dense color=white').tooltip('Logs de trabajos')
+            ui.button(icon='stop_circle', on_click=confirm_cancel_jobs).props('flat round dense color=red').tooltip('Cancelar el trabajo en curso')
             
             # Center: Network info
             local_ip = backend.get_local_ip()
@@ -1403,14 +1838,113 @@ def main_page():
     with sudo_dialog, ui.card().classes('egg-panel'):
         ui.label('Autenticación requerida (sudo)').classes('text-white font-bold')
         pwd = ui.input('Contraseña de sudo', password=True, password_toggle_button=True).props('dark input-class="text-white"')
+        async def do_login():
+            # sudo -v checks the password once; wrong passwords are caught here
+            if await backend.login(pwd.value or ''):
+                sudo_dialog.close()
+            else:
+                pwd.value = ''
+                ui.notify('Contraseña incorrecta', type='negative')
+
         with ui.row():
-            ui.button('Aceptar', on_click=lambda: (setattr(backend, 'sudo_password', pwd.value), sudo_dialog.close())).classes('egg-button')
+            ui.button('Aceptar', on_click=do_login).classes('egg-button')
             ui.button('Cancelar', on_click=sudo_dialog.close).classes('bg-red-600 hover:bg-red-700')
 
     ui.timer(1.0, update_timers)
     ui.timer(0.2, lambda: asyncio.create_task(update_versions()), once=True)
     ui.timer(0.05, sudo_dialog.open, once=True)
 
+# ---------------------------------------------------------------------------
+# Headless log API: tail build output from scripts (curl) without the page open.
+# Everything is read from the on-disk job logs (logtools.BuildLog), not the widget.
+# ---------------------------------------------------------------------------
+LOG_CHUNK = 256 * 1024  # bytes read per step when streaming a log
+LOG_POLL_INTERVAL = 0.5  # seconds between checks for new output in follow mode
+
+def job_path_or_404(job_id: str) -> str:
+    # Only ids listed on disk are accepted, so the id can't escape the jobs dir
+    if job_id not in logtools.list_jobs():
+        raise HTTPException(status_code=404, detail='Trabajo no encontrado')
+    return logtools.job_log_path(job_id)
+
+@app.get('/api/jobs')
+def api_jobs() -> list:
+    jobs = []
+    for job_id in logtools.list_jobs():
+        try:
+            size = os.path.getsize(logtools.job_log_path(job_id))
+        except OSError:
+            continue
+        jobs.append({'id': job_id, 'size': size, 'running': job_id in backend.running_jobs})
+    return jobs
+
+async def stream_log(path: str, job_id: str, offset: int, follow: bool, sse: bool, end: int | None = None):
+    """Yield the log from `offset` (up to `end`); in follow mode keep waiting until the job ends"""
+    f = open(path, 'rb')
+    try:
+        while True:
+            size = os.fstat(f.fileno()).st_size if end is None else end
+            if follow and os.path.getsize(path) < offset:
+                # The log rotated: follow the new active file from its start
+                f.close()
+                f = open(path, 'rb')
+                offset = 0
+                continue
+            data = os.pread(f.fileno(), min(LOG_CHUNK, size - offset), offset) if size > offset else b''
+            if sse and data:
+                # Only whole lines become events; a partial line waits for its newline
+                cut = data.rfind(b'\n') + 1
+                if cut:
+                    data = data[:cut]
+                elif len(data) < LOG_CHUNK:
+                    data = b''
+            if data:
+                offset += len(data)
+                if sse:
+                    lines = data.decode('utf-8', 'replace').splitlines()
+                    yield f"id: {offset}\n" + ''.join(f"data: {line}\n" for line in lines) + "\n"
+                else:
+                    yield data
+                continue
+            if not follow or job_id not in backend.running_jobs:
+                if sse:
+                    yield f"event: end\nid: {offset}\ndata: {offset}\n\n"
+                return
+            await asyncio.sleep(LOG_POLL_INTERVAL)
+    finally:
+        f.close()
+
+@app.get('/api/jobs/{job_id}/log')
+async def api_job_log(job_id: str, request: Request, follow: bool = False):
+    """Job output from byte offset `from` (default 0).
+
+    follow=1 keeps the connection open until the job ends: as Server-Sent
+    Events when the client accepts text/event-stream (each event's id is the
+    offset to resume from, also accepted as Last-Event-ID), otherwise as a
+    plain chunked text stream for `curl -N`. X-Log-Offset tells where a
+    non-follow response ends.
+    """
+    path = job_path_or_404(job_id)
+    try:
+        offset = int(request.query_params.get('from') or request.headers.get('last-event-id') or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'from' debe ser un número de byte")
+    offset = max(0, offset)
+    size = os.path.getsize(path)
+    if not follow:
+        if offset == 0:
+            # Served by Starlette straight from the file
+            return FileResponse(path, media_type='text/plain; charset=utf-8', headers={'X-Log-Offset': str(size)})
+        return StreamingResponse(stream_log(path, job_id, min(offset, size), False, False, end=size),
+                                 media_type='text/plain; charset=utf-8', headers={'X-Log-Offset': str(size)})
+    sse = 'text/event-stream' in request.headers.get('accept', '')
+    return StreamingResponse(stream_log(path, job_id, offset, True, sse),
+                             media_type='text/event-stream' if sse else 'text/plain; charset=utf-8',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Stopping the server must not leave eggs running as root in the background
+app.on_shutdown(backend.supervisor.shutdown)
+
 def main():
     """Entry point for the application"""
     global port
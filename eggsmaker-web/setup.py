@@ -14,7 +14,7 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/pieroproietti/penguins-eggs",
     packages=find_packages(),
-    py_modules=["main", "backend", "version"],
+    py_modules=["main", "backend", "copy_engine", "logtools", "privhelper", "supervisor", "version"],
     include_package_data=True,
     install_requires=requirements,
     data_files=[
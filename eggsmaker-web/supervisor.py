@@ -0,0 +1,574 @@
+"""Supervisor de procesos compartido por eggsmaker (Tk) y eggsmaker-web.
+
+Todos los comandos externos (eggs, git, fresh-eggs.sh, dd...) pasan por aquí:
+cada uno se lanza en su propio grupo de procesos, su salida se lee en bloques
+grandes y se reparte por líneas, y al terminar se devuelve un resultado con el
+código de salida traducido y el tiempo consumido.
+
+Un comando puede ser una línea de shell (str) o un argv (lista). Un argv se
+ejecuta directamente, sin /bin/bash ni shell de login, con el entorno limpio
+de exec_env(): es lo que usan las llamadas frecuentes (versión de eggs, du,
+leer la configuración), donde arrancar bash y leer el perfil cuesta más que
+el propio comando.
+
+La interfaz web usa las corrutinas directamente desde el bucle de NiceGUI; la
+de Tk llama a run_sync() desde sus hilos y el supervisor ejecuta el trabajo en
+un bucle asyncio propio.
+
+La contraseña de sudo se valida una vez (authenticate) y la credencial se
+renueva en segundo plano; los comandos de root usan sudo -n y la contraseña
+no aparece nunca en una línea de comandos. Sin terminal, sudo asocia la
+credencial al proceso padre, así que sudo se ejecuta siempre directamente
+desde este proceso (nunca desde un shell intermedio).
+
+Con use_helper, tras validar la contraseña se lanza además el ayudante
+privilegiado (privhelper.py): los comandos de root se lanzan desde él sin un
+sudo por comando, y quien lo tenga disponible puede pedirle operaciones de
+archivo directas (root_helper). Si no arranca, todo sigue yendo por sudo.
+
+Este archivo existe idéntico en src/ y en eggsmaker-web/: cualquier cambio
+debe aplicarse en ambas copias.
+"""
+import asyncio
+import codecs
+import os
+import re
+import resource
+import shlex
+import signal
+import threading
+import time
+
+import logtools
+import privhelper
+
+STREAM_CHUNK = 1024 * 1024  # Bytes que se leen de la salida del hijo por llamada
+TERM_GRACE = 5.0  # Segundos entre SIGTERM y SIGKILL al cancelar
+CLEANUP_TIMEOUT = 300  # Segundos que puede tardar la limpieza de un trabajo cancelado
+SUDO_REFRESH = 60  # Segundos entre renovaciones de la credencial de sudo
+SAFE_PATH = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+# Variables que una AppImage inyecta y que no deben llegar a los comandos de root
+CLEAN_ENV = ('LD_PRELOAD=', 'LD_LIBRARY_PATH=', 'APPIMAGE=', 'APPDIR=', 'PYTHONPATH=', f'PATH={SAFE_PATH}')
+
+# Separadores de línea: los medidores de progreso (dd, mksquashfs) usan \r
+NEWLINE_RE = re.compile(r'\r\n|\r|\n')
+
+
+def strip_sudo(cmd):
+    """Quita el primer "sudo " del comando para no acabar en "sudo sudo" """
+    cmd = cmd.lstrip()
+    return cmd[len('sudo '):] if cmd.startswith('sudo ') else cmd
+
+
+def command_line(cmd):
+    """Texto de cmd para la terminal y el log (un argv se une con comillas)"""
+    return cmd if isinstance(cmd, str) else shlex.join(cmd)
+
+
+def exec_env():
+    """Entorno de los comandos con clean_env: el del proceso con CLEAN_ENV aplicado"""
+    env = dict(os.environ)
+    for item in CLEAN_ENV:
+        key, value = item.split('=', 1)
+        if value:
+            env[key] = value
+        else:
+            env.pop(key, None)
+    return env
+
+
+def sudo_argv(argv, cached, clean_env=False):
+    """argv precedido de sudo.
+
+    Con la credencial en caché se usa sudo -n, que nunca pregunta; si no,
+    sudo -S lee la contraseña de stdin (la escribe el supervisor). Con
+    clean_env el comando recibe un PATH fijo y ninguna de las variables de
+    la AppImage (es lo que hace la interfaz web).
+    """
+    prefix = ['sudo', '-n'] if cached else ['sudo', '-S', '-p', '']
+    if clean_env:
+        prefix += ['-E', 'env', *CLEAN_ENV]
+    return prefix + list(argv)
+
+
+def process_tree(pid):
+    """pid y todos sus descendientes vivos, leyendo /proc.
+
+    Hace falta además del grupo de procesos porque un descendiente puede
+    haber creado su propio grupo o sesión.
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # El nombre del proceso va entre paréntesis y puede contener espacios
+        ppid = int(stat[stat.rindex(b')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    tree, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        tree.append(current)
+        todo.extend(children.get(current, ()))
+    return tree
+
+
+def _alive(pid):
+    """True si el proceso existe y no es un zombi"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return False
+    return stat[stat.rindex(b')') + 2:stat.rindex(b')') + 3] != b'Z'
+
+
+def exit_status(rc, timed_out=False, cancelled=False, shell=True):
+    """Traduce el código de salida de un trabajo a (estado, nombre de la señal).
+
+    Estados: 'ok', 'failed', 'timeout', 'cancelled' y 'killed' (terminado por
+    una señal que no enviamos nosotros). Un shell devuelve 128+N cuando su
+    hijo muere por la señal N, así que con shell ese caso también cuenta como
+    señal; en un argv ejecutado directamente es un código de salida más.
+    """
+    sig = None
+    if rc is not None and rc < 0:
+        sig = -rc
+    elif shell and rc is not None and 128 < rc < 128 + signal.NSIG:
+        sig = rc - 128
+    try:
+        # Las señales de tiempo real (SIGRTMIN..SIGRTMAX) no tienen nombre en Signals
+        name = signal.Signals(sig).name if sig is not None else None
+    except ValueError:
+        name = None
+    if timed_out:
+        return 'timeout', name
+    if cancelled:
+        return 'cancelled', name
+    if rc == 0:
+        return 'ok', None
+    # rc negativo: asyncio ya dice que lo mató una señal, tenga nombre o no
+    return ('killed' if name or (rc is not None and rc < 0) else 'failed'), name
+
+
+class Job:
+    """Un proceso lanzado por el supervisor, con su propio grupo de procesos"""
+
+    def __init__(self, command, process, loop, job_log=None, privileged=False, supervisor=None, shell=True):
+        self.command = command
+        # Línea de shell (pasa por bash) o argv ejecutado directamente
+        self.shell = shell
+        self.process = process
+        self.pid = process.pid
+        self.pgid = process.pid  # start_new_session: el hijo lidera su grupo
+        self.id = job_log.job_id if job_log else str(process.pid)
+        self.job_log = job_log
+        self.started = time.monotonic()
+        self.timed_out = False
+        self.cancelled = False
+        self.lines = 0
+        self.bytes = 0
+        # Corre como root: las señales al árbol tienen que enviarse con sudo
+        self.privileged = privileged
+        # Se activa cuando el trabajo (y su limpieza, si la hubo) terminó
+        self.done = asyncio.Event()
+        self._supervisor = supervisor
+        self._loop = loop
+
+    @property
+    def running(self):
+        return self.process.returncode is None
+
+    def signal_group(self, sig):
+        """Envía sig a todo el grupo de procesos del trabajo"""
+        try:
+            os.killpg(self.pgid, sig)
+            return True
+        except (ProcessLookupError, PermissionError):
+            return False
+
+    async def signal_tree(self, sig, known=()):
+        """Envía sig al grupo y a todos los descendientes del trabajo.
+
+        known son pids vistos en una pasada anterior: si el líder ya murió, sus
+        hijos pasaron a init y no aparecen en el árbol. Los procesos que corren
+        como root (eggs bajo sudo) no aceptan señales del usuario, así que en un
+        trabajo privilegiado se envían con sudo kill.
+        """
+        pids = [pid for pid in dict.fromkeys([*process_tree(self.pid), *known]) if _alive(pid)]
+        self.signal_group(sig)
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+        if self.privileged and self._supervisor:
+            await self._supervisor.signal_as_root(sig, self.pgid, pids)
+        return pids
+
+    async def terminate(self, grace=TERM_GRACE):
+        """SIGTERM a todo el árbol y, si algo sigue vivo tras grace segundos, SIGKILL"""
+        if not self.running:
+            return
+        pids = await self.signal_tree(signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline:
+            if not any(_alive(pid) for pid in pids):
+                return
+            await asyncio.sleep(0.1)
+        await self.signal_tree(signal.SIGKILL, pids)
+
+    def cancel(self, grace=TERM_GRACE):
+        """Cancela el trabajo; se puede llamar desde cualquier hilo"""
+        self.cancelled = True
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self.terminate(grace)))
+
+
+class Supervisor:
+    """Lanza y vigila los procesos externos de la aplicación"""
+
+    def __init__(self):
+        self.sudo_password = None
+        # sudo -n funciona: la credencial validada sigue en caché
+        self.sudo_cached = False
+        self._refresher = None
+        # Ayudante privilegiado residente (opcional, ver privhelper.py)
+        self.use_helper = False
+        self.helper = None
+        # Trabajos en marcha por id (el id de su log en disco)
+        self.jobs = {}
+        # Último trabajo lanzado, aunque ya haya terminado
+        self.last_job = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    # ----------- Credencial de sudo -----------
+    async def _sudo(self, *args, password=None):
+        """Ejecuta sudo con args (sin shell) y devuelve True si terminó bien"""
+        process = await asyncio.create_subprocess_exec(
+            'sudo', *args,
+            stdin=asyncio.subprocess.PIPE if password is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            # Igual que los trabajos: sin terminal, para que la credencial sea la misma
+            start_new_session=True,
+        )
+        await process.communicate(f"{password}\n".encode() if password is not None else None)
+        return process.returncode == 0
+
+    async def authenticate(self, password):
+        """Valida la contraseña con sudo -v; devuelve False si es incorrecta.
+
+        Si la política de sudo conserva la credencial (lo habitual), los
+        comandos siguientes usan sudo -n sin volver a autenticar y una tarea la
+        renueva cada SUDO_REFRESH segundos. Si no la conserva, se sigue pasando
+        la contraseña por stdin en cada comando.
+        """
+        if not await self._sudo('-S', '-v', '-p', '', password=password):
+            return False
+        self.sudo_password = password
+        self.sudo_cached = await self._sudo('-n', 'true')
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._refresh_sudo())
+        if self.use_helper and self.sudo_cached and self.root_helper is None:
+            await self.start_helper()
+        return True
+
+    async def start_helper(self):
+        """Lanza el ayudante privilegiado con la credencial en caché.
+
+        Devuelve False (y se sigue usando sudo por comando) si no está
+        disponible o no responde.
+        """
+        if not privhelper.available():
+            return False
+        helper = privhelper.PrivHelper()
+        try:
+            await helper.start(sudo_argv([], True, clean_env=True))
+        except (OSError, RuntimeError, asyncio.TimeoutError):
+            return False
+        self.helper = helper
+        return True
+
+    @property
+    def root_helper(self):
+        """El ayudante privilegiado si está en marcha; si no, None"""
+        return self.helper if self.helper is not None and self.helper.alive else None
+
+    async def _refresh_sudo(self):
+        """Mantiene viva la credencial de sudo mientras haya contraseña"""
+        while self.sudo_password:
+            await asyncio.sleep(SUDO_REFRESH)
+            if not self.sudo_password:
+                break
+            # sudo -n -v renueva sin autenticar; si la credencial caducó (p. ej.
+            # tras suspender) se valida de nuevo con la contraseña
+            self.sudo_cached = (await self._sudo('-n', '-v')
+                                or (await self._sudo('-S', '-v', '-p', '', password=self.sudo_password)
+                                    and await self._sudo('-n', 'true')))
+
+    @staticmethod
+    def command_argv(cmd, clean_env=False):
+        """argv de cmd sin sudo: un argv tal cual y una línea de shell dentro de bash"""
+        if not isinstance(cmd, str):
+            argv = list(cmd)
+            return argv[1:] if argv[:1] == ['sudo'] else argv
+        shell = ['bash', '-lc'] if clean_env else ['/bin/bash', '-c']
+        return [*shell, strip_sudo(cmd)]
+
+    def argv(self, cmd, sudo=False, clean_env=False):
+        """argv definitivo para cmd; con sudo lo ejecuta como root"""
+        if sudo and self.sudo_password:
+            return sudo_argv(self.command_argv(cmd, clean_env), self.sudo_cached, clean_env)
+        if isinstance(cmd, str):
+            return ['/bin/bash', '-c', cmd]
+        return list(cmd)
+
+    async def _exec(self, argv, privileged, **kwargs):
+        """create_subprocess_exec que, sin credencial en caché, pasa la contraseña a sudo -S por stdin"""
+        feed = privileged and not self.sudo_cached
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.PIPE if feed else asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+            **kwargs,
+        )
+        if feed:
+            process.stdin.write(f"{self.sudo_password}\n".encode())
+            try:
+                await process.stdin.drain()
+            except ConnectionError:
+                pass
+            # El comando ve fin de archivo, igual que con DEVNULL
+            process.stdin.close()
+        return process
+
+    async def signal_as_root(self, sig, pgid, pids):
+        """Envía sig como root al grupo pgid y a pids; los procesos ya muertos se ignoran"""
+        helper = self.root_helper
+        if helper:
+            try:
+                await helper.call('kill', pids=list(pids), pgid=pgid, sig=int(sig))
+                return
+            except (OSError, RuntimeError):
+                pass
+        targets = ['--', f'-{pgid}', *map(str, pids)]
+        argv = sudo_argv(['kill', f'-{signal.Signals(sig).name[3:]}', *targets], self.sudo_cached)
+        process = await self._exec(argv, True, stdout=asyncio.subprocess.DEVNULL,
+                                   stderr=asyncio.subprocess.DEVNULL)
+        await process.wait()
+
+    async def spawn(self, cmd, sudo=False, clean_env=False, split_stderr=False, log=True):
+        """Lanza cmd en una sesión nueva y devuelve su Job"""
+        job_log = logtools.open_build_log(command_line(cmd)) if log else None
+        privileged = bool(sudo and self.sudo_password)
+        helper = self.root_helper if privileged else None
+        try:
+            if helper:
+                # El ayudante ya es root y su entorno ya está limpio: sin sudo
+                process = await helper.spawn(self.command_argv(cmd, clean_env), split_stderr)
+            else:
+                process = await self._exec(
+                    self.argv(cmd, sudo, clean_env),
+                    privileged,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE if split_stderr else asyncio.subprocess.STDOUT,
+                    limit=STREAM_CHUNK,
+                    # Con sudo el entorno lo limpia "sudo env"; sin él, aquí
+                    env=exec_env() if clean_env and not privileged else None,
+                )
+        except BaseException:
+            if job_log:
+                job_log.close()
+            raise
+        job = Job(command_line(cmd), process, asyncio.get_running_loop(), job_log, privileged=privileged,
+                  supervisor=self, shell=isinstance(cmd, str))
+        self.jobs[job.id] = job
+        self.last_job = job
+        return job
+
+    async def _pump(self, job, stream, on_line):
+        """Lee stream en bloques y entrega cada línea (sin el separador) a on_line.
+
+        El decodificador incremental mantiene intactos los caracteres multibyte
+        partidos entre dos bloques, y no hay línea demasiado larga.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        buf = ''
+        while True:
+            chunk = await stream.read(STREAM_CHUNK)
+            if not chunk:
+                break
+            job.bytes += len(chunk)
+            buf += decoder.decode(chunk)
+            # Un \r final se guarda hasta saber si le sigue un \n
+            cut = len(buf) - 1 if buf.endswith('\r') else len(buf)
+            *lines, rest = NEWLINE_RE.split(buf[:cut])
+            buf = rest + buf[cut:]
+            for line in lines:
+                self._deliver(job, line, on_line)
+            if job.job_log:
+                job.job_log.flush()
+            # Un respiro por bloque para que la interfaz tenga su turno
+            await asyncio.sleep(0)
+        buf = (buf + decoder.decode(b'', final=True)).rstrip('\r')
+        if buf:
+            self._deliver(job, buf, on_line)
+
+    @staticmethod
+    def _deliver(job, line, on_line):
+        job.lines += 1
+        if job.job_log:
+            # El log en disco lo guarda todo, también lo que la interfaz oculta
+            job.job_log.write(logtools.strip_ansi(line).rstrip())
+        if on_line:
+            on_line(line)
+
+    async def run(self, cmd, on_line=None, on_error_line=None, sudo=False, clean_env=False,
+                  timeout=None, log=True, on_start=None, cleanup=None):
+        """Ejecuta cmd (línea de shell o argv) hasta el final y devuelve un dict
+        con el resultado.
+
+        on_line recibe cada línea de salida; con on_error_line, stderr se lee
+        aparte y sus líneas van ahí. Al pasar timeout segundos el trabajo se
+        termina. on_start recibe el Job nada más lanzarlo (para cancelarlo).
+        cleanup es un comando que se ejecuta (con los mismos permisos) si el
+        trabajo se cancela o agota el tiempo, para borrar lo que dejó a medias.
+
+        Claves del resultado: rc, status, signal, id, pid, elapsed, cpu
+        (segundos de CPU de usuario+sistema), lines y bytes. El tiempo de CPU se
+        mide con RUSAGE_CHILDREN, así que con varios trabajos a la vez se
+        reparte entre los que terminan en ese intervalo.
+        """
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        job = await self.spawn(cmd, sudo, clean_env, split_stderr=on_error_line is not None, log=log)
+        if on_start:
+            on_start(job)
+
+        async def drive():
+            pumps = [self._pump(job, job.process.stdout, on_line)]
+            if on_error_line is not None:
+                pumps.append(self._pump(job, job.process.stderr, on_error_line))
+            await asyncio.gather(*pumps)
+            return await job.process.wait()
+
+        task = asyncio.ensure_future(drive())
+        try:
+            try:
+                rc = await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                job.timed_out = True
+                await job.terminate()
+                rc = await task
+            except BaseException:
+                # Quien esperaba el resultado se fue (p. ej. se cerró la página) o
+                # falló un callback: el proceso no debe quedarse huérfano
+                await job.terminate()
+                raise
+            finally:
+                self.jobs.pop(job.id, None)
+                if job.job_log:
+                    if job.process.returncode is not None:
+                        job.job_log.write(f"[exit {job.process.returncode}]")
+                    job.job_log.close()
+            if cleanup and (job.cancelled or job.timed_out):
+                if on_line:
+                    on_line(f"$ {command_line(cleanup)}")
+                await self.run(cleanup, on_line, sudo=sudo, clean_env=clean_env, timeout=CLEANUP_TIMEOUT)
+        finally:
+            job.done.set()
+
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        status, sig = exit_status(rc, job.timed_out, job.cancelled, job.shell)
+        return {
+            'rc': rc,
+            'status': status,
+            'signal': sig,
+            'id': job.id,
+            'pid': job.pid,
+            'elapsed': time.monotonic() - job.started,
+            'cpu': (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime),
+            'lines': job.lines,
+            'bytes': job.bytes,
+        }
+
+    async def capture(self, cmd, sudo=False, clean_env=False, timeout=None):
+        """Ejecuta cmd sin log y devuelve (rc, stdout) tal cual; stderr se descarta"""
+        job = await self.spawn(cmd, sudo, clean_env, split_stderr=True, log=False)
+        try:
+            stdout, _ = await asyncio.wait_for(asyncio.shield(job.process.communicate()), timeout)
+        except asyncio.TimeoutError:
+            job.timed_out = True
+            await job.terminate()
+            stdout = b''
+        except BaseException:
+            await job.terminate()
+            raise
+        finally:
+            self.jobs.pop(job.id, None)
+            job.done.set()
+        return await job.process.wait(), stdout.decode(errors='ignore')
+
+    def cancel(self, job_id, grace=TERM_GRACE):
+        """Cancela un trabajo por id; devuelve False si ya no está en marcha"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel(grace)
+        return True
+
+    def cancel_all(self, grace=TERM_GRACE):
+        """Cancela todos los trabajos en marcha"""
+        for job in list(self.jobs.values()):
+            job.cancel(grace)
+
+    async def shutdown(self, grace=TERM_GRACE):
+        """Cancela todo y espera a que los trabajos y sus limpiezas terminen.
+
+        Devuelve los trabajos que siguen sin terminar al agotarse la espera
+        (lista vacía si todo terminó).
+        """
+        jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel(grace)
+        if jobs:
+            await asyncio.wait([asyncio.ensure_future(job.done.wait()) for job in jobs],
+                               timeout=grace + CLEANUP_TIMEOUT)
+        pending = [job for job in jobs if not job.done.is_set()]
+        if self.helper is not None:
+            # Al ver cerrado el socket el ayudante mata lo que quede y termina
+            await self.helper.close()
+            self.helper = None
+        return pending
+
+    # ----------- Puente para código síncrono (hilos de Tk) -----------
+    def _background_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='supervisor', daemon=True).start()
+            return self._loop
+
+    def call(self, coro):
+        """Ejecuta coro en el bucle del supervisor y espera su resultado"""
+        return asyncio.run_coroutine_threadsafe(coro, self._background_loop()).result()
+
+    def run_sync(self, cmd, **kwargs):
+        """run() para hilos sin bucle asyncio; los callbacks se llaman desde el
+        hilo del supervisor."""
+        return self.call(self.run(cmd, **kwargs))
+
+    def capture_sync(self, cmd, **kwargs):
+        return self.call(self.capture(cmd, **kwargs))
+
+    def authenticate_sync(self, password):
+        return self.call(self.authenticate(password))
+
+    def shutdown_sync(self, grace=TERM_GRACE):
+        if self._loop is None:
+            return []
+        return self.call(self.shutdown(grace))
@@ -3,8 +3,8 @@ import subprocess
 import os
 import sys
 import threading
+import queue
 import re  # Added for version string parsing
-import shlex
 
 # Verificar e instalar el módulo distro si es necesario
 try:
@@ -23,6 +23,10 @@ from tkinter import messagebox, simpledialog, filedialog, Toplevel
 
 # Importamos la versión y el nombre de la aplicación
 from version import __version__, __app__
+import copy_engine
+import logtools
+import privhelper
+import supervisor
 
 # Configuración de internacionalización
 def get_base_path():
@@ -153,6 +157,21 @@ def setup_i18n():
 _ = setup_i18n()
 
 BUTTON_WIDTH = 200  # Ancho fijo para los botones
+TERMINAL_FLUSH_MS = 50  # Cada cuánto se vuelca la cola de salida en la terminal
+TERMINAL_BATCH = 10000  # Máximo de fragmentos por volcado, para no bloquear la UI
+
+SEARCH_RESULTS = 200  # Coincidencias que muestra el buscador de la terminal
+SEARCH_REFRESH = 1.0  # Segundos mínimos entre refrescos de una búsqueda activa
+# Opciones del filtro de severidad del buscador: (texto, severidad de logtools.LogIndex)
+SEARCH_SEVERITIES = [(_("Todo"), None), (_("Errores"), 'error'), (_("Advertencias"), 'warning')]
+
+# Colores de la terminal por etiqueta
+TERMINAL_COLORS = {
+    'error': '#ff6b6b',
+    'success': '#6bff6b',
+    'info': '#87CEFA',  # Light blue
+    'warning': '#ffb86c'
+}
 
 class EggsMakerApp:
     def __init__(self, root):
@@ -173,11 +192,15 @@ class EggsMakerApp:
         icon_photo = ImageTk.PhotoImage(icon_image)
         self.root.iconphoto(True, icon_photo)
 
-        self.password = None
+        # Todos los procesos externos pasan por el supervisor, que guarda la clave
+        self.supervisor = supervisor.Supervisor()
         self.eggs_path = self.detect_eggs_path()
 
         # Variables para cronómetros y contadores
         self.copying = False
+        # Lo activa el botón Cancelar; el motor de copia lo revisa entre bloques
+        self.copy_cancel = threading.Event()
+        self.closing = False
         self.iso_generating = False
         self.auto_running = False  # Nueva variable para el proceso AUTO
         self.total_running = False
@@ -186,6 +209,7 @@ class EggsMakerApp:
         self.iso_elapsed = 0
         self.auto_elapsed = 0  # Nueva variable para cronómetro AUTO
         self.copia_contador = 0
+        self.produce_progress = None  # Último evento de logtools.ProduceProgress
 
         # Fuentes y colores personalizados
         self.font_title = ("Segoe UI", 17, "bold")
@@ -213,6 +237,10 @@ class EggsMakerApp:
         self.iso_data_switch_var = ctk.BooleanVar(value=False)
         self.iso_comp_switch_var = ctk.BooleanVar(value=False)
         self.copy_speed_switch_var = ctk.BooleanVar(value=False)
+        self.copy_rate_var = ctk.StringVar(value=str(copy_engine.SLOW_RATE_MB))
+        self.checksum_switch_var = ctk.BooleanVar(value=False)
+        self.multi_dest_switch_var = ctk.BooleanVar(value=False)
+        self.verify_switch_var = ctk.BooleanVar(value=False)
 
         # Estilos para los switches
         self.switch_on_color = "#00FF00"  # Verde fluo
@@ -222,8 +250,16 @@ class EggsMakerApp:
         # Track if we're updating eggs/calamares
         self.updating_eggs = False
 
+        # Salida pendiente de mostrar; la vacía _drain_terminal en el hilo de Tk
+        self.terminal_queue = queue.Queue()
+        # El widget ya es el historial (recortado a max_lines): aquí solo el log en disco
+        self.scrollback = logtools.Scrollback('terminal.log', in_memory=False)
+        self.ansi_tagger = logtools.AnsiTagger()
+        self.log_index = logtools.LogIndex()
+
         self.create_widgets()
         self.create_action_buttons()
+        self.root.after(TERMINAL_FLUSH_MS, self._drain_terminal)
         self.request_password()
         # Si la contraseña fue ingresada correctamente, muestra la ventana principal
         root.deiconify()
@@ -231,12 +267,17 @@ class EggsMakerApp:
         self.update_versions()
         self.adjust_window_size()
 
+    @property
+    def password(self):
+        return self.supervisor.sudo_password
+
+    @password.setter
+    def password(self, value):
+        self.supervisor.sudo_password = value
+
     def detect_eggs_path(self):
-        try:
-            path = subprocess.check_output("which eggs", shell=True, text=True).strip()
-            return path if path else "/usr/bin/eggs"
-        except Exception:
-            return "/usr/bin/eggs"
+        # Búsqueda en el PATH sin lanzar un shell con which
+        return shutil.which('eggs') or "/usr/bin/eggs"
 
     def create_widgets(self):
         # --- Main Frame ---
@@ -248,6 +289,25 @@ class EggsMakerApp:
         # --- Área de Terminal (altura 250) ---
         self.terminal_frame = ctk.CTkFrame(self.main_frame, corner_radius=10, fg_color=self.color_bg, border_width=1, border_color="#444C5E")
         self.terminal_frame.grid(row=0, column=0, sticky="nsew", pady=(0, 10))
+
+        # Búsqueda en la salida: consulta el índice en vivo (logtools.LogIndex)
+        self.search_frame = ctk.CTkFrame(self.terminal_frame, fg_color=self.color_bg)
+        self.search_frame.pack(fill="x", padx=5, pady=(5, 0))
+        self.search_severity_var = ctk.StringVar(value=SEARCH_SEVERITIES[0][0])
+        self.search_entry = ctk.CTkEntry(self.search_frame, placeholder_text=_("Buscar en la salida..."), font=self.font_label)
+        self.search_entry.pack(side="left", fill="x", expand=True)
+        self.search_entry.bind("<KeyRelease>", lambda event: self._schedule_search())
+        self.search_severity = ctk.CTkOptionMenu(self.search_frame, values=[label for label, _sev in SEARCH_SEVERITIES],
+                                                 variable=self.search_severity_var, width=130,
+                                                 command=lambda value: self._schedule_search())
+        self.search_severity.pack(side="left", padx=(5, 0))
+        # Resultados; solo se muestra mientras hay una búsqueda activa
+        self.search_results = ctk.CTkTextbox(self.terminal_frame, fg_color="#0e1010", text_color="#FFD479",
+                                             wrap="none", height=110, font=self.font_terminal)
+        self.search_after_id = None
+        self.search_version = None
+        self.search_refreshed = 0.0
+
         self.terminal_text = ctk.CTkTextbox(
             self.terminal_frame,
             fg_color="#0e1010",
@@ -257,6 +317,10 @@ class EggsMakerApp:
             font=self.font_terminal
         )
         self.terminal_text.pack(fill="both", expand=True, padx=5, pady=5)
+        # Etiquetas de severidad: se configuran una sola vez y _drain_terminal
+        # las asigna al insertar (también a los colores ANSI de la salida)
+        for tag, color in TERMINAL_COLORS.items():
+            self.terminal_text.tag_config(tag, foreground=color)
 
         # --- Panel Superior: 4 paneles en una fila ---
         self.top_controls = ctk.CTkFrame(self.main_frame, corner_radius=10, fg_color=self.color_panel, border_width=1, border_color="#444C5E")
@@ -553,6 +617,46 @@ class EggsMakerApp:
         except Exception:
             pass
 
+        # Límite de caudal de la copia lenta (MB/s)
+        self.copy_rate_frame = ctk.CTkFrame(self.frame_copy_iso, fg_color=self.color_bg)
+        self.copy_rate_frame.pack(pady=2)
+        ctk.CTkLabel(self.copy_rate_frame, text=_("Límite (MB/s):"), text_color="white", font=self.font_label).pack(side="left", padx=(0, 5))
+        self.copy_rate_entry = ctk.CTkEntry(self.copy_rate_frame, textvariable=self.copy_rate_var, width=60, font=self.font_label)
+        self.copy_rate_entry.pack(side="left")
+
+        # Suma SHA256 calculada en la misma pasada que la copia
+        self.checksum_switch = ctk.CTkSwitch(self.frame_copy_iso,
+                                             text=_("Calcular SHA256"),
+                                             variable=self.checksum_switch_var,
+                                             text_color="white",
+                                             fg_color=self.switch_off_color,
+                                             progress_color=self.switch_on_color,
+                                             button_color=self.switch_button_color,
+                                             button_hover_color=self.switch_button_color)
+        self.checksum_switch.pack(pady=2)
+
+        # Releer la copia desde el medio y compararla con la ISO
+        self.verify_switch = ctk.CTkSwitch(self.frame_copy_iso,
+                                           text=_("Verificar copia"),
+                                           variable=self.verify_switch_var,
+                                           text_color="white",
+                                           fg_color=self.switch_off_color,
+                                           progress_color=self.switch_on_color,
+                                           button_color=self.switch_button_color,
+                                           button_hover_color=self.switch_button_color)
+        self.verify_switch.pack(pady=2)
+
+        # Varios destinos: la ISO se lee una vez y se escribe en todos a la vez
+        self.multi_dest_switch = ctk.CTkSwitch(self.frame_copy_iso,
+                                               text=_("Varios destinos"),
+                                               variable=self.multi_dest_switch_var,
+                                               text_color="white",
+                                               fg_color=self.switch_off_color,
+                                               progress_color=self.switch_on_color,
+                                               button_color=self.switch_button_color,
+                                               button_hover_color=self.switch_button_color)
+        self.multi_dest_switch.pack(pady=2)
+
         # Botón Copiar ISO
         self.btn_copiar = ctk.CTkButton(
             self.frame_copy_iso,
@@ -623,19 +727,35 @@ class EggsMakerApp:
         self.main_frame.grid_columnconfigure(0, weight=1)
 
     def create_action_buttons(self):
-        """Crea la fila inferior con los botones: Info y Salir."""
+        """Crea la fila inferior con los botones: Info, Cancelar y Salir."""
         self.action_frame = ctk.CTkFrame(self.main_frame, corner_radius=10, fg_color=self.color_panel, border_width=1, border_color="#444C5E")
         self.action_frame.grid(row=4, column=0, sticky="ew", pady=(10, 0))
-        for i in range(2):
+        for i in range(3):
             self.action_frame.grid_columnconfigure(i, weight=1)
 
         # Botón Info
         self.info_button = ctk.CTkButton(self.action_frame, text=_("Info"), command=self.show_info, width=BUTTON_WIDTH, font=self.font_button, fg_color=self.color_button, hover_color=self.color_button_hover, corner_radius=8)
         self.info_button.grid(row=0, column=0, padx=5, pady=5, sticky="w")
 
+        # Botón Cancelar: detiene el comando o la copia en curso
+        self.cancel_button = ctk.CTkButton(self.action_frame, text=_("Cancelar"), command=self.cancel_jobs, width=BUTTON_WIDTH, font=self.font_button, fg_color=self.color_button, hover_color=self.color_button_hover, corner_radius=8)
+        self.cancel_button.grid(row=0, column=1, padx=5, pady=5)
+
         # Botón Salir
         self.exit_button = ctk.CTkButton(self.action_frame, text=_("Salir"), command=self.on_close, width=BUTTON_WIDTH, font=self.font_button, fg_color="#ff052b", hover_color="#a8001a", corner_radius=8)
-        self.exit_button.grid(row=0, column=1, padx=5, pady=5, sticky="e")
+        self.exit_button.grid(row=0, column=2, padx=5, pady=5, sticky="e")
+
+    def cancel_jobs(self):
+        """Cancela lo que esté en marcha: SIGTERM y luego SIGKILL a todo el árbol
+        de procesos, y la copia elimina el archivo a medio escribir."""
+        if not self.supervisor.jobs and not self.copying:
+            messagebox.showinfo(_("Cancelar"), _("No hay ningún trabajo en ejecución"))
+            return
+        if not messagebox.askyesno(_("Cancelar"), _("¿Cancelar el trabajo en curso?\n\nSe eliminarán los archivos a medio generar.")):
+            return
+        self._write_terminal(f"\n{_('Cancelando...')}\n", 'warning')
+        self.copy_cancel.set()
+        self.supervisor.cancel_all()
 
     def execute_auto(self):
         """Ejecuta el flujo completo de preparación, generación de ISO y copia"""
@@ -650,9 +770,8 @@ class EggsMakerApp:
 
         # Configurar interfaz
         self.btn_auto.configure(state="disabled")
-        self.terminal_text.delete('1.0', 'end')
-        self.terminal_text.insert('end', "=== INICIANDO MODO AUTO ===\n")
-        self.terminal_text.see('end')
+        self._clear_terminal()
+        self._write_terminal("=== INICIANDO MODO AUTO ===\n")
 
         # Configurar barra de progreso oscilante
         self.progress_bar.configure(progress_color=self.color_button, mode="indeterminate")
@@ -669,8 +788,7 @@ class EggsMakerApp:
         try:
             # 1. Preparación
             self.root.after(0, lambda: self.ejecutando_label.configure(text="Ejecutando: Preparación"))
-            self.terminal_text.insert('end', "\n=== PREPARACIÓN ===\n")
-            self.terminal_text.see('end')
+            self._write_terminal("\n=== PREPARACIÓN ===\n")
 
             # Ejecutar comandos de preparación
             prep_cmds = [
@@ -680,29 +798,15 @@ class EggsMakerApp:
             ]
 
             for cmd in prep_cmds:
-                self.terminal_text.insert('end', f"\n$ {cmd}\n")
-                self.terminal_text.see('end')
-
-                process = subprocess.Popen(
-                    f"echo {self.password} | sudo -S {cmd}",
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True
-                )
+                self._write_terminal(f"\n$ {cmd}\n")
 
                 # Mostrar salida en tiempo real
-                for line in process.stdout:
-                    self.terminal_text.insert('end', line)
-                    self.terminal_text.see('end')
-
-                if process.wait() != 0:
+                if self._run_job(cmd)['rc'] != 0:
                     raise Exception(f"Error en el comando: {cmd}")
 
             # 2. Generar ISO
             self.root.after(0, lambda: self.ejecutando_label.configure(text="Ejecutando: Generando ISO"))
-            self.terminal_text.insert('end', "\n=== GENERANDO ISO ===\n")
-            self.terminal_text.see('end')
+            self._write_terminal("\n=== GENERANDO ISO ===\n")
 
             # Determinar opciones de generación de ISO
             iso_cmd = f"sudo {self.eggs_path} produce"
@@ -715,24 +819,13 @@ class EggsMakerApp:
 
             iso_cmd += " -n"  # Modo no interactivo
 
-            self.terminal_text.insert('end', f"\n$ {iso_cmd}\n")
-            self.terminal_text.see('end')
-
-            # Ejecutar generación de ISO
-            process = subprocess.Popen(
-                f"echo {self.password} | sudo -S {iso_cmd}",
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True
-            )
-
-            # Mostrar salida en tiempo real
-            for line in process.stdout:
-                self.terminal_text.insert('end', line)
-                self.terminal_text.see('end')
+            self._write_terminal(f"\n$ {iso_cmd}\n")
 
-            if process.wait() != 0:
+            # Ejecutar generación de ISO mostrando la salida en tiempo real
+            result = self._run_job(iso_cmd, logtools.ProduceProgress(), cleanup=f"sudo {self.eggs_path} kill -n")
+            if result['status'] == 'cancelled':
+                raise Exception("Generación de la ISO cancelada")
+            if result['rc'] != 0:
                 raise Exception("Error al generar la ISO")
 
             # MODIFICACIÓN 2: Mostrar tamaño de la ISO inmediatamente después de la generación
@@ -744,8 +837,7 @@ class EggsMakerApp:
 
         except Exception as e:
             error_msg = f"Error en el flujo AUTO: {str(e)}"
-            self.terminal_text.insert('end', f"\n{error_msg}")
-            self.terminal_text.see('end')
+            self._write_terminal(f"\n{error_msg}")
             self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
             self._finish_auto(False)
 
@@ -762,8 +854,7 @@ class EggsMakerApp:
                 raise Exception("No se seleccionó ningún directorio de destino")
 
             # Iniciar copia
-            self.terminal_text.insert('end', "\n=== COPIANDO ISO ===\n")
-            self.terminal_text.see('end')
+            self._write_terminal("\n=== COPIANDO ISO ===\n")
             self.root.after(0, lambda: self.ejecutando_label.configure(text="Ejecutando: Copiando ISO"))
 
             # Cambiar a barra de progreso determinada para la copia
@@ -780,8 +871,7 @@ class EggsMakerApp:
 
         except Exception as e:
             error_msg = f"Error al configurar la copia: {str(e)}"
-            self.terminal_text.insert('end', f"\n{error_msg}")
-            self.terminal_text.see('end')
+            self._write_terminal(f"\n{error_msg}")
             self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
             self._finish_auto(False)
 
@@ -791,6 +881,7 @@ class EggsMakerApp:
             # Iniciar temporizador de copia
             self.copy_elapsed = 0
             self.copying = True
+            self.copy_cancel.clear()
             threading.Thread(target=self.update_copy_timer, daemon=True).start()
 
             # Buscar archivo ISO
@@ -803,24 +894,8 @@ class EggsMakerApp:
             dest_path = os.path.join(dest_dir, iso_files[0])
 
             # Copiar archivo
-            total_size = os.path.getsize(iso_path)
-            chunk_size = 1024 * 1024  # 1 MB
-            copied = 0
-
-            with open(iso_path, "rb") as src, open(dest_path, "wb") as dst:
-                while chunk := src.read(chunk_size):
-                    dst.write(chunk)
-                    copied += len(chunk)
-                    progress = copied / total_size
-
-                    # Actualizar progreso
-                    self.root.after(0, lambda p=progress: self.progress_bar.set(p))
-                    percent = int(progress * 100)
-                    self.root.after(0, lambda p=percent: self.copy_percentage_label.configure(text=f"{p}%"))
-
-                    # Pequeña pausa si no es copia rápida
-                    if not self.copy_speed_switch_var.get():
-                        time.sleep(0.01)
+            result = self._run_iso_copy(iso_path, dest_path)
+            total_size = result['bytes']
 
             # Actualizar contador de copias
             self.copia_contador += 1
@@ -833,20 +908,21 @@ class EggsMakerApp:
                 f"ISO copiada exitosamente!\n\n"
                 f"Nombre: {os.path.basename(dest_path)}\n"
                 f"Tamaño: {total_size/(1024**2):.2f} MB\n"
-                f"Ubicación: {dest_path}"
+                f"Ubicación: {dest_path}\n"
+                f"Método: {result['method']}"
             )
+            if result.get('digest'):
+                success_msg += f"\n\nSHA256: {result['digest']}\nSuma: {result['checksum_file']}"
 
             self.root.after(0, lambda: messagebox.showinfo("Éxito", success_msg))
-            self.terminal_text.insert('end', "\n=== PROCESO AUTO COMPLETADO ===\n")
-            self.terminal_text.see('end')
+            self._write_terminal("\n=== PROCESO AUTO COMPLETADO ===\n")
 
             # Finalizar con éxito
             self._finish_auto(True)
 
         except Exception as e:
             error_msg = f"Error al copiar la ISO: {str(e)}"
-            self.terminal_text.insert('end', f"\n{error_msg}")
-            self.terminal_text.see('end')
+            self._write_terminal(f"\n{error_msg}")
             self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
             self._finish_auto(False)
 
@@ -880,8 +956,7 @@ class EggsMakerApp:
 
         # Mostrar mensaje final
         if success:
-            self.terminal_text.insert('end', "\n¡Proceso AUTO completado con éxito!\n")
-            self.terminal_text.see('end')
+            self._write_terminal("\n¡Proceso AUTO completado con éxito!\n")
 
     def update_auto_timer(self):
         """Actualiza la etiqueta del cronómetro AUTO mientras se esté ejecutando."""
@@ -989,7 +1064,7 @@ class EggsMakerApp:
 
                 # Si todo falla, intentar con which y ejecutar directamente
                 try:
-                    eggs_path = subprocess.check_output(['which', 'eggs'], timeout=5).decode().strip()
+                    eggs_path = shutil.which('eggs')
                     if eggs_path:
                         result = subprocess.run(
                             [eggs_path, '--version'],
@@ -1080,7 +1155,7 @@ class EggsMakerApp:
 
                 # Si todo falla, intentar con which y ejecutar directamente
                 try:
-                    calamares_path = subprocess.check_output(['which', 'calamares'], timeout=5).decode().strip()
+                    calamares_path = shutil.which('calamares')
                     if calamares_path:
                         result = subprocess.run(
                             [calamares_path, '--version'],
@@ -1155,7 +1230,11 @@ class EggsMakerApp:
             if not pwd:
                 status_label.configure(text=_("La contraseña no puede estar vacía"))
                 return
-            self.password = pwd
+            # sudo -v valida la contraseña una sola vez; después se usa sudo -n
+            if not self.supervisor.authenticate_sync(pwd):
+                status_label.configure(text=_("Contraseña incorrecta"))
+                entry.delete(0, "end")
+                return
             dialog.destroy()
 
         def on_cancel():
@@ -1195,6 +1274,12 @@ class EggsMakerApp:
             time.sleep(1)
             self.iso_elapsed += 1
             elapsed_str = time.strftime("%H:%M:%S", time.gmtime(self.iso_elapsed))
+            event = self.produce_progress
+            if event:
+                # Etapa y tiempo restante estimado a partir de la salida de eggs produce
+                elapsed_str += f" · {event['stage']} {int(event['stage_percent'])}%"
+                if event['eta'] is not None:
+                    elapsed_str += f" · ETA {time.strftime('%H:%M:%S', time.gmtime(event['eta']))}"
             self.root.after(0, lambda: self.iso_chrono_label.configure(text=f"{_('Generación: ')}{elapsed_str}"))
 
     def update_total_timer(self):
@@ -1215,7 +1300,8 @@ class EggsMakerApp:
             threading.Thread(target=self.update_total_timer, daemon=True).start()
 
     # ----------- Ejecución de Comandos -----------
-    def execute_command(self, command, button, progress_color=None, on_complete=None):
+    def execute_command(self, command, button, progress_color=None, on_complete=None, progress_parser=None,
+                        cleanup=None):
         def run_command():
             try:
                 proc_text = button.cget("text") if button is not None else _("Ejecutando")
@@ -1225,58 +1311,36 @@ class EggsMakerApp:
                 if progress_color:
                     self.root.after(0, lambda: self.progress_bar.configure(progress_color=progress_color))
                 self.root.after(0, self.progress_bar.start)
-                self.root.after(0, lambda: self.terminal_text.delete("1.0", "end"))
-
-                # Construir comando evitando "sudo sudo" y escapando la contraseña
-                pwd_esc = shlex.quote(self.password or "")
-                cmd_strip = command.lstrip()
-                if cmd_strip.startswith("sudo "):
-                    # remover solo el primer "sudo " para formar el pipe correcto
-                    cmd_no_sudo = cmd_strip[len("sudo "):]
-                else:
-                    cmd_no_sudo = command
-
-                full_cmd = f"printf '%s\\n' {pwd_esc} | sudo -S {cmd_no_sudo}"
-                process = subprocess.Popen(
-                    full_cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    executable="/bin/bash"
-                )
+                self._clear_terminal()
 
                 # Leer la salida en tiempo real
-                while True:
-                    output = process.stdout.readline()
-                    if not output and process.poll() is not None:
-                        break
-                    if output:
-                        self.root.after(0, lambda o=output: self.terminal_text.insert("end", o))
-                        self.root.after(0, self.terminal_text.see, "end")
+                result = self._run_job(command, progress_parser, cleanup)
 
                 # Verificar el código de salida
-                if process.returncode == 0:
+                if result['rc'] == 0:
                     if button:
                         self.root.after(0, lambda: button.configure(fg_color="#8b8b8b", state="normal"))
                     self.root.after(0, lambda: messagebox.showinfo(_("Éxito"), _("Operación completada")))
+                elif result['status'] == 'cancelled':
+                    self._write_terminal(f"\n{_('Operación cancelada:')} {command}\n", 'warning')
+                    if button:
+                        self.root.after(0, lambda: button.configure(fg_color="#295699", state="normal"))
+                    self.root.after(0, lambda: messagebox.showwarning(_("Cancelado"), _("Operación cancelada")))
                 else:
                     # Mostrar el comando que falló y el código de salida
                     error_output = _("Error en el comando:") + f" {command}\n"
-                    error_output += _("Código de salida:") + f" {process.returncode}\n"
+                    error_output += _("Código de salida:") + f" {result['rc']}\n"
                     error_output += _("Asegúrate de que:")
                     error_output += "\n- Tienes permisos de superusuario"
                     error_output += "\n- El comando 'eggs' está instalado correctamente"
                     error_output += "\n- No hay otros procesos de eggs en ejecución"
 
-                    self.root.after(0, lambda: self.terminal_text.insert("end", f"\n{error_output}\n"))
-                    self.root.after(0, self.terminal_text.see, "end")
-                    raise subprocess.CalledProcessError(process.returncode, command, output=error_output)
+                    self._write_terminal(f"\n{error_output}\n")
+                    raise subprocess.CalledProcessError(result['rc'], command, output=error_output)
 
             except Exception as e:
                 error_msg = str(e)
-                self.root.after(0, lambda: self.terminal_text.insert("end", f"\nError: {error_msg}\n"))
-                self.root.after(0, self.terminal_text.see, "end")
+                self._write_terminal(f"\nError: {error_msg}\n")
                 self.root.after(0, lambda: messagebox.showerror(_("Error"), f"{_('Error:')} {error_msg}"))
                 if button:
                     self.root.after(0, lambda: button.configure(fg_color="#295699", state="normal"))
@@ -1290,123 +1354,98 @@ class EggsMakerApp:
         # Iniciar el hilo para ejecutar el comando
         threading.Thread(target=run_command, daemon=True).start()
 
+    def _run_job(self, command, progress_parser=None, cleanup=None):
+        """Ejecuta el comando como root a través del supervisor y muestra su salida.
+
+        Con progress_parser (logtools.ProduceProgress) los indicadores de avance
+        mueven la barra de progreso en lugar de llenar la terminal. Devuelve el
+        resultado de supervisor.Supervisor.run(); el log del trabajo lo escribe
+        el supervisor. cleanup se ejecuta si el trabajo se cancela.
+        """
+        def on_line(line):
+            if progress_parser:
+                event = progress_parser.feed(line)
+                if event:
+                    if event['changed']:
+                        self.root.after(0, self._show_produce_progress, event)
+                    if event['meter']:
+                        return
+            self._write_terminal(line + "\n")
+
+        return self.supervisor.run_sync(command, on_line=on_line, sudo=True, cleanup=cleanup)
+
+    def _run_root(self, command, timeout=None):
+        """Ejecuta un comando corto como root, sin log; lanza CalledProcessError si falla"""
+        result = self.supervisor.run_sync(command, sudo=True, log=False, timeout=timeout)
+        if result['rc'] != 0:
+            raise subprocess.CalledProcessError(result['rc'], command)
+
+    def _show_produce_progress(self, event):
+        """Pasa la barra a modo determinado con el avance real de eggs produce"""
+        if self.progress_bar.cget('mode') != 'determinate':
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode='determinate')
+        self.progress_bar.set(event['fraction'])
+        self.produce_progress = event
+
     def _clean_ansi_codes(self, text):
         """Elimina códigos ANSI del texto"""
         if not text:
             return ""
-        import re
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        return ansi_escape.sub('', text)
+        return logtools.strip_ansi(text)
 
     def should_show_line(self, line):
         """Filtra líneas de salida para mostrar solo información relevante"""
-        if not line or not line.strip():
-            return False
-
-        # Lista de patrones a filtrar
-        filter_patterns = [
-            'remote: Enumerating objects:', 'remote: Total', 'Receiving objects:',
-            'Resolving deltas:', '\x1b[',  # Códigos ANSI
-            '=====================================', 'UNIVERSAL INSTALLER',
-            'Distro detected:', 'remote: Compressing objects:',
-            'remote: Counting objects:', 'from 2)', 'Looking for conflicting packages',
-            'checking keyring', 'checking package integrity', 'loading package files',
-            'checking for file conflicts', ':: Processing package changes',
-            ':: Running pre-transaction hooks', ':: Running post-transaction hooks',
-            ':: Waiting for running package', ':: Synchronizing package databases'
-        ]
-
-        return not any(pattern in line for pattern in filter_patterns)
+        return bool(line) and logtools.INSTALLER.shows(line)
 
-    def run_command_with_output(self, cmd, description, timeout=300, shell=True):
+    def run_command_with_output(self, cmd, description, timeout=300, line_filter=logtools.INSTALLER):
         """
         Ejecuta un comando mostrando la salida en tiempo real
 
         Args:
-            cmd: Comando a ejecutar
+            cmd: Comando a ejecutar (con "sudo " delante se ejecuta como root)
             description: Descripción del comando
-            timeout: Tiempo máximo de espera
-            shell: Si se debe ejecutar el comando a través del shell
+            timeout: Segundos tras los que el supervisor termina el comando
+            line_filter: logtools.LineFilter que limpia y descarta líneas de este comando
         """
         try:
             print(f"\n=== {description} ===")
             print(f"Hilo actual: {threading.current_thread().name}")
 
-            # Si el comando incluye sudo y tenemos contraseña, usarla
-            if 'sudo' in cmd and hasattr(self, 'password') and self.password:
-                # Crear un comando temporal con la contraseña
-                temp_cmd = f"""
-                #!/bin/bash
-                echo '{self.password}' | sudo -S {cmd.replace('sudo ', '')}
-                """
-                # Guardar el comando temporal
-                temp_script = "/tmp/eggs_install_script.sh"
-                with open(temp_script, 'w') as f:
-                    f.write(temp_cmd)
-                os.chmod(temp_script, 0o700)
-                cmd = f"bash {temp_script}"
-
-            # Ejecutar el comando
-            print(f"Ejecutando comando: {cmd}")
-            process = subprocess.Popen(
-                cmd,
-                shell=shell,
-                executable="/bin/bash",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
-
-            # Leer la salida en tiempo real
-            while True:
-                # Leer tanto de stdout como de stderr
-                stdout_line = process.stdout.readline()
-                stderr_line = process.stderr.readline()
+            def on_stdout(line):
+                cleaned_line = line_filter.filter(line)
+                if cleaned_line is not None:
+                    print(cleaned_line)
+                    self._update_terminal(cleaned_line)
 
-                if not stdout_line and not stderr_line and process.poll() is not None:
-                    break
+            def on_stderr(line):
+                cleaned_line = line_filter.filter(line)
+                if cleaned_line is None:
+                    return
+                # Solo mostrar como error si realmente es un error
+                if any(keyword in cleaned_line.lower() for keyword in ['error', 'failed', 'fallo', 'falló']):
+                    print(f"ERROR: {cleaned_line}", file=sys.stderr)
+                    self._update_terminal(f"ERROR: {cleaned_line}", error=True)
+                else:
+                    print(cleaned_line)
+                    self._update_terminal(cleaned_line)
 
-                # Procesar stdout
-                if stdout_line:
-                    cleaned_line = self._clean_ansi_codes(stdout_line).strip()
-                    if self.should_show_line(cleaned_line):
-                        print(cleaned_line)
-                        self._update_terminal(cleaned_line)
-
-                # Procesar stderr
-                if stderr_line:
-                    cleaned_line = self._clean_ansi_codes(stderr_line).strip()
-                    if self.should_show_line(cleaned_line):
-                        # Solo mostrar como error si realmente es un error
-                        if any(keyword in cleaned_line.lower() for keyword in ['error', 'failed', 'fallo', 'falló']):
-                            print(f"ERROR: {cleaned_line}", file=sys.stderr)
-                            self._update_terminal(f"ERROR: {cleaned_line}", error=True)
-                        else:
-                            print(cleaned_line)
-                            self._update_terminal(cleaned_line)
+            # Ejecutar el comando; el supervisor guarda toda la salida en el log del trabajo
+            print(f"Ejecutando comando: {cmd}")
+            result = self.supervisor.run_sync(cmd, on_line=on_stdout, on_error_line=on_stderr,
+                                              sudo=cmd.lstrip().startswith('sudo '), timeout=timeout)
 
             # Obtener el código de salida
-            return_code = process.returncode
-            print(f"Comando terminado con código: {return_code}")
-
-            # Limpiar el script temporal si existe
-            if 'temp_script' in locals() and os.path.exists(temp_script):
-                try:
-                    os.remove(temp_script)
-                except Exception as e:
-                    print(f"No se pudo eliminar el script temporal: {e}")
-
+            return_code = result['rc']
+            print(f"Comando terminado con código: {return_code} ({result['status']})")
+            if result['status'] == 'timeout':
+                self._update_terminal(f"Tiempo de espera agotado ({timeout} s): {description}", error=True)
             return return_code
 
         except Exception as e:
             error_msg = f"Error ejecutando comando: {str(e)}"
             print(f"ERROR: {error_msg}")
-            self.terminal_text.configure(state='normal')
-            self.terminal_text.insert("end", f"\n{error_msg}\n")
-            self.terminal_text.see("end")
-            self.terminal_text.configure(state='disabled')
+            self._write_terminal(f"\n{error_msg}\n")
             return -1
 
     def update_eggs_and_calamares(self):
@@ -1454,12 +1493,8 @@ class EggsMakerApp:
         """Proceso de actualización en segundo plano"""
         try:
             # 1. Configurar terminal
-            self.root.after(0, lambda: [
-                self.terminal_text.configure(state='normal'),
-                self.terminal_text.delete('1.0', 'end'),
-                self.terminal_text.insert('end', "=== INICIANDO ACTUALIZACIÓN ===\n"),
-                self.terminal_text.see('end')
-            ])
+            self._clear_terminal()
+            self._write_terminal("=== INICIANDO ACTUALIZACIÓN ===\n")
             print("Terminal configurada")
 
             # 2. Obtener directorios
@@ -1515,39 +1550,15 @@ class EggsMakerApp:
             # Hacer el script ejecutable
             os.chmod("./fresh-eggs.sh", 0o755)
 
-            # Filtrar mensajes específicos del instalador
-            def filter_output(line):
-                line = line.strip()
-                filters = [
-                    'ERROR:', '::', 'cargando', 'buscando', 'Tamaño', 'Paquete',
-                    'reinstalando', 'resolviendo', 'comprobando', 'verificando',
-                    'Downloading', 'Downloaded', 'Running:', 'Installing', 'Updating',
-                    'Arming', 'Refreshing', 'Installation completed', 'UNIVERSAL INSTALLER',
-                    'advertencia:', '--:--:--', 'Dload', 'Upload', 'Total', 'Spent', 'Left',
-                    'Speed', 'From', 'will download', 'All packages downloaded',
-                    'The following commands', 'penguins-eggs-', 'MiB', 'kB', 'kB/s',
-                    '--noconfirm', '/tmp/penguins-eggs-', '--:--:--', '0:00:0',
-                    'looking for conflicting packages', 'checking keyring',
-                    'checking package integrity', 'loading package files',
-                    'checking for file conflicts', ':: Processing package changes',
-                    ':: Running pre-transaction hooks', ':: Running post-transaction hooks',
-                    ':: Waiting for running package', ':: Synchronizing package databases'
-                ]
-                if any(filtro in line for filtro in filters):
-                    return False
-                if not line or line.isspace():
-                    return False
-                return True
-
-            # Crear un comando temporal para ejecutar con la contraseña
-            cmd = f'sudo -S ./fresh-eggs.sh <<EOF\n{self.password}\nEOF'
+            # El supervisor pasa la contraseña a sudo
+            cmd = "sudo ./fresh-eggs.sh"
 
             # Ejecutar con un tiempo de espera más largo (30 minutos)
             return_code = self.run_command_with_output(
                 cmd,
                 "Instalando Eggs",
                 timeout=1800,  # 30 minutos de tiempo de espera
-                shell=True
+                line_filter=logtools.INSTALLER  # Los errores y avisos de pacman/apt siempre se ven
             )
 
             if return_code != 0:
@@ -1604,34 +1615,8 @@ class EggsMakerApp:
         if not message or message.isspace():
             return
 
-        # Configurar colores
-        colors = {
-            'error': '#ff6b6b',
-            'success': '#6bff6b',
-            'info': '#87CEFA',  # Light blue
-            'warning': '#ffb86c'
-        }
-
-        # Determinar el color basado en el tipo de mensaje
-        color = colors['error'] if error else colors['info']
-
-        # Aplicar formato al mensaje
-        formatted_message = f"{message}\n"
-
-        # Actualizar la interfaz
-        def update_gui():
-            self.terminal_text.configure(state='normal')
-            # Insertar con el color apropiado
-            self.terminal_text.insert('end', formatted_message)
-            # Aplicar formato al texto recién insertado
-            start = self.terminal_text.index('end-1c')
-            self.terminal_text.tag_add('colored', start, 'end')
-            self.terminal_text.tag_config('colored', foreground=color)
-            self.terminal_text.see('end')
-            self.terminal_text.configure(state='disabled')
-
-        # Ejecutar en el hilo principal
-        self.root.after(0, update_gui)
+        # El color lo da la etiqueta, configurada una sola vez en create_widgets
+        self._write_terminal(f"{message}\n", 'error' if error else 'info')
 
         # Mostrar en consola
         if error:
@@ -1639,6 +1624,104 @@ class EggsMakerApp:
         else:
             print(f"INFO: {message}")
 
+    def _write_terminal(self, text, tag=None):
+        """Encola texto para la terminal; se puede llamar desde cualquier hilo.
+
+        El índice de búsqueda se alimenta aquí, en el hilo que escribe (el del
+        supervisor para la salida de los trabajos), y no en el de Tk.
+        """
+        if text:
+            self.log_index.write(logtools.strip_ansi(text))
+            self.terminal_queue.put((text, tag))
+
+    def _clear_terminal(self):
+        """Vacía la terminal respetando el orden de lo ya encolado"""
+        self.log_index.clear()
+        self.terminal_queue.put(None)
+
+    def _drain_terminal(self):
+        """Vuelca lo encolado en la terminal con un insert y un see por tanda.
+
+        Corre en el hilo de Tk cada TERMINAL_FLUSH_MS: por rápido que escriba
+        el proceso hijo, la cola de eventos recibe una sola actualización.
+        """
+        chunks = []
+        clear = False
+        try:
+            for _n in range(TERMINAL_BATCH):
+                item = self.terminal_queue.get_nowait()
+                if item is None:
+                    chunks.clear()
+                    clear = True
+                else:
+                    chunks.append(item)
+        except queue.Empty:
+            pass
+
+        if chunks or clear:
+            state = self.terminal_text.cget('state')
+            self.terminal_text.configure(state='normal')
+            if clear:
+                self.terminal_text.delete('1.0', 'end')
+                self.scrollback.clear()
+                self.ansi_tagger.tag = None
+            # Los colores ANSI de eggs se traducen a las etiquetas de severidad
+            segments = []
+            for text, tag in chunks:
+                segments.extend(self.ansi_tagger.split(text, tag))
+            plain = ''.join(text for text, _tag in segments)
+            self.scrollback.write(plain)
+            # Un insert por tramo con la misma etiqueta (normalmente uno solo)
+            run, run_tag = [], None
+            for text, tag in segments:
+                if run and tag != run_tag:
+                    self.terminal_text.insert('end', ''.join(run), run_tag)
+                    run = []
+                run.append(text)
+                run_tag = tag
+            if run:
+                self.terminal_text.insert('end', ''.join(run), run_tag)
+            # Recortar lo más viejo para que el costo de la terminal sea constante
+            lines = int(self.terminal_text.index('end-1c').split('.')[0])
+            if lines > self.scrollback.max_lines:
+                self.terminal_text.delete('1.0', f"{lines - self.scrollback.max_lines + 1}.0")
+            self.terminal_text.see('end')
+            self.terminal_text.configure(state=state)
+
+        # Con una búsqueda activa, los resultados siguen a la salida (como mucho
+        # una vez por SEARCH_REFRESH, aunque la salida llegue sin pausa)
+        if (self.search_version is not None and self.search_version != self.log_index.version
+                and time.monotonic() - self.search_refreshed >= SEARCH_REFRESH):
+            self._run_search()
+
+        self.root.after(TERMINAL_FLUSH_MS, self._drain_terminal)
+
+    def _schedule_search(self):
+        """Busca cuando el usuario deja de escribir (150 ms)"""
+        if self.search_after_id:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(150, self._run_search)
+
+    def _run_search(self):
+        self.search_after_id = None
+        query = self.search_entry.get()
+        severity = dict(SEARCH_SEVERITIES).get(self.search_severity_var.get())
+        if not query.strip() and not severity:
+            self.search_version = None
+            self.search_results.pack_forget()
+            return
+        self.search_version = self.log_index.version
+        self.search_refreshed = time.monotonic()
+        results = self.log_index.search(query, severity, limit=SEARCH_RESULTS)
+        text = "\n".join(f"{number + 1}: {line}" for number, line in results) or _("Sin resultados")
+        self.search_results.configure(state='normal')
+        self.search_results.delete('1.0', 'end')
+        self.search_results.insert('end', text)
+        self.search_results.see('end')
+        self.search_results.configure(state='disabled')
+        if not self.search_results.winfo_ismapped():
+            self.search_results.pack(fill="x", padx=5, pady=(5, 0), before=self.terminal_text)
+
     def _restore_ui(self):
         """Restaura la interfaz de usuario"""
         self.progress_bar.stop()
@@ -1657,16 +1740,14 @@ class EggsMakerApp:
             self.prep_switch.configure(state="disabled")
             self.calamares_switch.configure(state="disabled")
             self.btn_pre.configure(state="disabled")
-            self.terminal_text.delete('1.0', 'end')  # Limpiar terminal
+            self._clear_terminal()  # Limpiar terminal
 
             # Mostrar mensaje de inicio
-            self.terminal_text.insert('end', "=== Iniciando preparación ===\n")
-            self.terminal_text.see('end')
+            self._write_terminal("=== Iniciando preparación ===\n")
 
             # Si solo está activado Calamares, actualizar y salir
             if self.calamares_switch_var.get() and not self.prep_switch_var.get():
-                self.terminal_text.insert('end', "Actualizando Eggs y Calamares...\n")
-                self.terminal_text.see('end')
+                self._write_terminal("Actualizando Eggs y Calamares...\n")
                 self.update_eggs_and_calamares()
                 return
 
@@ -1685,16 +1766,14 @@ class EggsMakerApp:
             def run_next_command(index=0):
                 if index < len(comandos):
                     comando = comandos[index]
-                    self.terminal_text.insert('end', f"\n=== Ejecutando comando {index+1}/{len(comandos)} ===\n{comando}\n")
-                    self.terminal_text.see('end')
+                    self._write_terminal(f"\n=== Ejecutando comando {index+1}/{len(comandos)} ===\n{comando}\n")
 
                     def on_command_complete():
                         if index + 1 < len(comandos):
                             run_next_command(index + 1)
                         else:
                             # Mostrar mensaje de finalización solo una vez al terminar todos los comandos
-                            self.terminal_text.insert('end', "\n¡Operación completada con éxito!\n")
-                            self.terminal_text.see('end')
+                            self._write_terminal("\n¡Operación completada con éxito!\n")
                             self.enable_additional_options()
 
                     self.execute_command(
@@ -1707,18 +1786,15 @@ class EggsMakerApp:
                     self.enable_additional_options()
 
             if comandos:
-                self.terminal_text.insert('end', f"\n=== Iniciando secuencia de comandos ===\n")
-                self.terminal_text.see('end')
+                self._write_terminal(f"\n=== Iniciando secuencia de comandos ===\n")
                 run_next_command()
             else:
-                self.terminal_text.insert('end', "No hay comandos para ejecutar.\n")
-                self.terminal_text.see('end')
+                self._write_terminal("No hay comandos para ejecutar.\n")
                 self.enable_additional_options()
 
         except Exception as e:
             error_msg = f"Error en apply_pre_actions: {str(e)}"
-            self.terminal_text.insert('end', f"\n{error_msg}\n")
-            self.terminal_text.see('end')
+            self._write_terminal(f"\n{error_msg}\n")
             messagebox.showerror("Error", error_msg)
             self.enable_additional_options()
 
@@ -1763,7 +1839,10 @@ class EggsMakerApp:
                 cmd = f"sudo {self.eggs_path} produce --clone -n"
             else:
                 cmd = f"sudo {self.eggs_path} produce --noicon -n"
-        self.execute_command(cmd, self.btn_generar, progress_color="#2065F7", on_complete=self.on_iso_generation_complete)
+        self.produce_progress = None
+        # Si se cancela, eggs kill desmonta y elimina el nido a medio generar
+        self.execute_command(cmd, self.btn_generar, progress_color="#2065F7", on_complete=self.on_iso_generation_complete,
+                             progress_parser=logtools.ProduceProgress(), cleanup=f"sudo {self.eggs_path} kill -n")
 
     def on_iso_generation_complete(self):
         self.iso_generating = False
@@ -1820,6 +1899,97 @@ class EggsMakerApp:
         self.btn_copiar.configure(state="normal")
 
     # ----------- Copiar ISO -----------
+    def _copy_limits(self):
+        """Límite de caudal y prioridad de E/S de la copia lenta"""
+        if self.copy_speed_switch_var.get():
+            return {}
+        try:
+            rate_mb = float(self.copy_rate_var.get())
+        except (TypeError, ValueError):
+            rate_mb = copy_engine.SLOW_RATE_MB
+        if rate_mb <= 0:
+            rate_mb = copy_engine.SLOW_RATE_MB
+        return {'rate_limit': rate_mb * 1024 * 1024, 'ionice': ('best-effort', 7)}
+
+    def _run_iso_copy(self, iso_path, dest_path):
+        """Copia la ISO con el motor compartido actualizando la barra de progreso"""
+        def on_progress(copied, total):
+            progress = copied / total if total else 1.0
+            self.root.after(0, lambda p=progress: self.progress_bar.set(p))
+            percent = int(progress * 100)
+            self.root.after(0, lambda p=percent: self.copy_percentage_label.configure(text=f"{p}%"))
+
+        checksum = "sha256" if self.checksum_switch_var.get() else None
+        # Con checkpoint: si la copia se corta, el reintento sigue donde quedó
+        result = copy_engine.copy_file(iso_path, dest_path, progress=on_progress, checksum=checksum,
+                                       resume=True, cancel=self.copy_cancel, **self._copy_limits())
+        self._write_terminal(f"Método de copia: {result['method']}\n")
+        if result.get('resumed_from'):
+            self._update_terminal(f"Copia reanudada desde {self.format_size(result['resumed_from'])}")
+        if self.verify_switch_var.get():
+            verify = self._verify_iso_copy(iso_path, dest_path)
+            if not verify['ok']:
+                raise IOError(f"La copia difiere del original a partir del byte {verify['mismatch']}")
+        return result
+
+    def _verify_iso_copy(self, iso_path, dest_path):
+        """Relee la copia desde el medio y la compara con la ISO (bloqueante)"""
+        self._update_terminal(f"Verificando {dest_path}...")
+
+        def on_progress(checked, total):
+            progress = checked / total if total else 1.0
+            self.root.after(0, lambda p=progress: self.progress_bar.set(p))
+            self.root.after(0, lambda p=int(progress * 100): self.copy_percentage_label.configure(text=f"{p}%"))
+
+        result = copy_engine.verify_copy(iso_path, dest_path, progress=on_progress, cancel=self.copy_cancel)
+        if result['ok']:
+            self._update_terminal(f"Verificación correcta: {dest_path}")
+        return result
+
+    def _copy_iso_multi(self, iso_path, dest_paths):
+        """Copia la ISO a varios destinos leyendo la fuente una sola vez"""
+        percents = [0] * len(dest_paths)
+        names = [os.path.basename(os.path.dirname(p)) or p for p in dest_paths]
+
+        def on_progress(index, written, total):
+            percents[index] = int(written / total * 100) if total else 100
+            # El trabajo avanza al ritmo del escritor más lento
+            slowest = min(percents)
+            detail = " | ".join(f"{n}: {p}%" for n, p in zip(names, percents))
+            self.root.after(0, lambda p=slowest: self.progress_bar.set(p / 100))
+            self.root.after(0, lambda p=slowest: self.copy_percentage_label.configure(text=f"{p}%"))
+            self.root.after(0, lambda d=detail: self.ejecutando_label.configure(text=d))
+
+        checksum = "sha256" if self.checksum_switch_var.get() else None
+        results = copy_engine.copy_file_multi(iso_path, dest_paths, progress=on_progress, checksum=checksum,
+                                              cancel=self.copy_cancel, **self._copy_limits())
+        if self.verify_switch_var.get():
+            for r in results:
+                if r['error'] is None:
+                    verify = self._verify_iso_copy(iso_path, r['path'])
+                    if not verify['ok']:
+                        r['error'] = f"difiere del original a partir del byte {verify['mismatch']}"
+        ok = [r for r in results if r['error'] is None]
+        self.copying = False
+        self.copia_contador += len(ok)
+        self.root.after(0, lambda: self.contador_label.configure(
+            text=f"Copias realizadas: {self.copia_contador}"
+        ))
+
+        lines = [f"{'OK' if r['error'] is None else 'ERROR'}: {r['path']}"
+                 + (f" ({r['error']})" if r['error'] is not None else "") for r in results]
+        summary = f"ISO copiada a {len(ok)} de {len(results)} destinos\n\n" + "\n".join(lines)
+        if ok and ok[0].get('digest'):
+            summary += f"\n\nSHA256: {ok[0]['digest']}"
+        for line in lines:
+            self._update_terminal(line, error=line.startswith("ERROR"))
+        if ok:
+            self.root.after(0, lambda: messagebox.showinfo("Éxito", summary))
+        else:
+            self.root.after(0, lambda: messagebox.showerror("Error", summary))
+        self.root.after(0, lambda: self.ejecutando_label.configure(text=""))
+        self._finish_auto(bool(ok))
+
     def copy_iso(self, button):
         try:
             if self.copia_contador > 0:
@@ -1836,12 +2006,20 @@ class EggsMakerApp:
                 self._update_terminal(f"Error al seleccionar directorio: {str(e)}", error=True)
                 return
 
+            dest_dirs = [dest_dir]
+            if self.multi_dest_switch_var.get():
+                # Pedir destinos adicionales hasta que el usuario cancele
+                while extra := filedialog.askdirectory(title="Agregar otro destino (Cancelar para terminar)"):
+                    if extra not in dest_dirs:
+                        dest_dirs.append(extra)
+
             self.copy_elapsed = 0
             self.copying = True
+            self.copy_cancel.clear()
             threading.Thread(target=self.update_copy_timer, daemon=True).start()
             self.start_total_timer()
             self.ejecutando_label.configure(text="Ejecutando: Copiar ISO")
-            self._update_terminal(f"Iniciando copia de la ISO a: {dest_dir}")
+            self._update_terminal(f"Iniciando copia de la ISO a: {', '.join(dest_dirs)}")
 
         except Exception as e:
             self._update_terminal(f"Error al preparar la copia: {str(e)}", error=True)
@@ -1851,7 +2029,7 @@ class EggsMakerApp:
             success = False
             try:
                 proc_text = button.cget("text")
-                self.root.after(0, lambda: self.terminal_text.insert("end", f"Ejecutando: {proc_text}\n"))
+                self._write_terminal(f"Ejecutando: {proc_text}\n")
                 # Desactivar el botón solo durante la copia
                 self.root.after(0, lambda: button.configure(fg_color="#ff0000", state="disabled"))
                 self.root.after(0, lambda: self.progress_bar.configure(progress_color="red"))
@@ -1860,21 +2038,13 @@ class EggsMakerApp:
                 if not iso_files:
                     raise FileNotFoundError("No se encontraron archivos ISO")
                 iso_path = os.path.join(iso_source_dir, iso_files[0])
+                if len(dest_dirs) > 1:
+                    self._copy_iso_multi(iso_path, [os.path.join(d, iso_files[0]) for d in dest_dirs])
+                    success = True
+                    return
                 dest_path = os.path.join(dest_dir, iso_files[0])
-                total_size = os.path.getsize(iso_path)
-                chunk_size = 1024 * 1024  # 1 MB
-                copied = 0
-
-                with open(iso_path, "rb") as src, open(dest_path, "wb") as dst:
-                    while chunk := src.read(chunk_size):
-                        dst.write(chunk)
-                        copied += len(chunk)
-                        progress = copied / total_size
-                        self.root.after(0, lambda p=progress: self.progress_bar.set(p))
-                        percent = int(progress * 100)
-                        self.root.after(0, lambda p=percent: self.copy_percentage_label.configure(text=f"{p}%"))
-                        if not self.copy_speed_switch_var.get():
-                            time.sleep(0.01)
+                result = self._run_iso_copy(iso_path, dest_path)
+                total_size = result['bytes']
                 self.copying = False
                 self.copia_contador += 1
                 self.root.after(0, lambda: self.contador_label.configure(
@@ -1886,12 +2056,14 @@ class EggsMakerApp:
                     f"ISO copiada exitosamente!\n\n"
                     f"Nombre: {os.path.basename(dest_path)}\n"
                     f"Tamaño: {total_size/(1024**2):.2f} MB\n"
-                    f"Ubicación: {dest_path}"
+                    f"Ubicación: {dest_path}\n"
+                    f"Método: {result['method']}"
                 )
+                if result.get('digest'):
+                    success_msg += f"\n\nSHA256: {result['digest']}\nSuma: {result['checksum_file']}"
 
                 self.root.after(0, lambda: messagebox.showinfo("Éxito", success_msg))
-                self.terminal_text.insert('end', "\n=== PROCESO AUTO COMPLETADO ===\n")
-                self.terminal_text.see('end')
+                self._write_terminal("\n=== PROCESO AUTO COMPLETADO ===\n")
 
                 # Finalizar con éxito
                 self._finish_auto(True)
@@ -1899,8 +2071,7 @@ class EggsMakerApp:
 
             except Exception as e:
                 error_msg = f"Error al copiar la ISO: {str(e)}"
-                self.terminal_text.insert('end', f"\n{error_msg}")
-                self.terminal_text.see('end')
+                self._write_terminal(f"\n{error_msg}")
                 self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
                 self._finish_auto(False)
             finally:
@@ -1921,7 +2092,7 @@ class EggsMakerApp:
     # ----------- Editar Configuración -----------
     def edit_configuration_file(self, button):
         try:
-            self.terminal_text.insert("end", "Cargando configuración...\n")
+            self._write_terminal("Cargando configuración...\n")
             button.configure(fg_color="#ff0000", state="disabled")
             self.root.update()
             config_file = "/etc/penguins-eggs.d/eggs.yaml"
@@ -1929,7 +2100,7 @@ class EggsMakerApp:
                 messagebox.showerror("Error", f"Archivo no encontrado: {config_file}")
                 button.configure(fg_color="#83f6a0", state="normal")
                 return
-            subprocess.run(f'echo {self.password} | sudo -S chmod 666 {config_file}', shell=True, check=True)
+            self._run_root(['chmod', '666', config_file])
             with open(config_file, "r") as file:
                 lines = file.readlines()
             current_values = {"root_passwd": "", "snapshot_basename": "", "snapshot_prefix": "", "user_opt_passwd": ""}
@@ -1998,16 +2169,16 @@ class EggsMakerApp:
             btn_cancel.grid(row=row+1, column=1, padx=10, pady=10)
 
             def on_close_edit():
-                subprocess.run(f'echo {self.password} | sudo -S chmod 644 {config_file}', shell=True, check=True)
+                self._run_root(['chmod', '644', config_file])
                 edit_window.destroy()
 
             edit_window.protocol("WM_DELETE_WINDOW", on_close_edit)
         except Exception as e:
             messagebox.showerror("Error", f"Error: {str(e)}")
-            subprocess.run(f'echo {self.password} | sudo -S chmod 644 {config_file}', shell=True, check=True)
+            self._run_root(['chmod', '644', config_file])
         finally:
             button.configure(fg_color="#8b8b8b", state="normal")
-            self.terminal_text.insert("end", "\n")
+            self._write_terminal("\n")
 
     # ----------- Opciones Adicionales -----------
     def apply_additional_options(self):
@@ -2021,17 +2192,57 @@ class EggsMakerApp:
 
     # ----------- Cierre de la aplicación -----------
     def on_close(self):
+        """Cancela los trabajos y borra /home/eggs en un hilo aparte.
+
+        El hilo principal no se bloquea: los callbacks de los trabajos que se
+        están cancelando siguen usando root.after, y esperar aquí al
+        supervisor congelaría la ventana.
+        """
+        if self.closing:
+            return
+        self.closing = True
+        busy = bool(self.supervisor.jobs or self.copying)
+        remove = os.path.exists("/home/eggs")
+        if busy:
+            # Nada debe seguir escribiendo en /home/eggs mientras se borra
+            self._write_terminal(f"{_('Cancelando...')}\n", 'warning')
+            self.copy_cancel.set()
+        if remove:
+            self._write_terminal("Eliminando archivos temporales...\n")
+        outcome = {}
+
+        def cleanup():
+            try:
+                pending = self.supervisor.shutdown_sync() if busy else []
+                if not remove:
+                    return
+                # Con un produce vivo o el sistema aún montado en el nido, rm
+                # borraría archivos del sistema real a través de los bind mounts
+                mounts = privhelper.mounts_under("/home/eggs")
+                if pending or mounts:
+                    outcome['error'] = _("/home/eggs sigue en uso, no se eliminó: {}").format(
+                        ', '.join(mounts) or ', '.join(job.command for job in pending))
+                    return
+                self._run_root(['rm', '-rf', '--one-file-system', '/home/eggs'],
+                               timeout=supervisor.CLEANUP_TIMEOUT)
+            except Exception as e:
+                outcome['error'] = e
+
+        worker = threading.Thread(target=cleanup, daemon=True)
+        worker.start()
+        self._finish_close(worker, remove, outcome)
+
+    def _finish_close(self, worker, removed, outcome):
+        if worker.is_alive():
+            self.root.after(100, self._finish_close, worker, removed, outcome)
+            return
         try:
-            if os.path.exists("/home/eggs"):
-                self.terminal_text.insert("end", "Eliminando archivos temporales...\n")
-                self.terminal_text.see("end")
-                self.root.update()
-                cmd = f"echo {self.password} | sudo -S rm -rf /home/eggs"
-                subprocess.run(cmd, shell=True, check=True)
+            if 'error' in outcome:
+                messagebox.showerror(_("Error"), f"Error al eliminar archivos temporales: {outcome['error']}")
+            elif removed:
                 messagebox.showinfo(_("Limpieza"), _("Se eliminaron los archivos temporales"))
-        except Exception as e:
-            messagebox.showerror(_("Error"), f"Error al eliminar archivos temporales: {str(e)}")
         finally:
+            self.scrollback.close()
             self.root.destroy()
 
     # ----------- Mostrar Info -----------
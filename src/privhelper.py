@@ -0,0 +1,432 @@
+"""Ayudante privilegiado opcional de eggsmaker.
+
+Se lanza una sola vez con sudo y queda residente como root, atendiendo
+peticiones por un socketpair que recibe como stdin/stdout. Así las consultas
+frecuentes (tamaño de /home/eggs, leer o guardar eggs.yaml, borrar el nido)
+no pagan cada vez un fork de bash, sudo y un shell de login, y los comandos
+largos (eggs produce) se lanzan desde aquí con su salida en streaming.
+
+Protocolo: cada mensaje es un objeto JSON precedido de su longitud (4 bytes,
+big-endian). Petición: {"id": n, "op": "...", ...argumentos}. Respuesta:
+{"id": n, "ok": true, "result": ...} o {"id": n, "ok": false, "error": "...",
+"errno": n}. Un spawn envía además eventos {"id": n, "event": "started" |
+"out" | "err", ...} antes de su respuesta final con el código de salida.
+
+El ayudante solo usa la biblioteca estándar y se ejecuta con python -I (sin
+el directorio del script ni site-packages del usuario en sys.path). Cuando el
+cliente cierra el socket termina, y antes mata los procesos que lanzó.
+
+Este archivo existe idéntico en src/ y en eggsmaker-web/: cualquier cambio
+debe aplicarse en ambas copias.
+"""
+import asyncio
+import base64
+import errno
+import itertools
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import sys
+
+MAX_MESSAGE = 16 * 1024 * 1024  # Tamaño máximo de un mensaje
+READ_LIMIT = 1024 * 1024  # Bytes que devuelve como mucho una lectura de archivo
+OUTPUT_CHUNK = 256 * 1024  # Bytes de salida por evento de un spawn
+START_TIMEOUT = 10  # Segundos que se espera el primer ping del ayudante
+
+HELPER_PATH = os.path.abspath(__file__)
+OCTAL_ESCAPE_RE = re.compile(rb'\\([0-7]{3})')
+
+
+def available():
+    """True si el ayudante se puede lanzar (hay un intérprete y el archivo .py)"""
+    return os.path.isfile(HELPER_PATH) and bool(helper_python())
+
+
+def helper_python():
+    # En una compilación (Nuitka/PyInstaller) sys.executable es la aplicación
+    if not getattr(sys, 'frozen', False) and '__compiled__' not in globals():
+        return sys.executable
+    return shutil.which('python3')
+
+
+def helper_argv():
+    """argv del ayudante; quien lo lanza le antepone sudo"""
+    return [helper_python(), '-I', HELPER_PATH]
+
+
+async def read_message(reader):
+    header = await reader.readexactly(4)
+    size = int.from_bytes(header, 'big')
+    if size > MAX_MESSAGE:
+        raise ValueError(f"Mensaje demasiado grande: {size} bytes")
+    return json.loads(await reader.readexactly(size))
+
+
+def write_message(writer, message):
+    data = json.dumps(message, separators=(',', ':')).encode()
+    writer.write(len(data).to_bytes(4, 'big') + data)
+
+
+# ----------- Lado root -----------
+
+def mounts_under(path):
+    """Puntos de montaje dentro de path (eggs monta el sistema en el nido)"""
+    prefix = os.path.join(os.path.realpath(path), '')
+    found = []
+    with open('/proc/self/mounts', 'rb') as f:
+        for line in f:
+            # Los espacios del punto de montaje vienen como \040
+            point = os.fsdecode(OCTAL_ESCAPE_RE.sub(lambda m: bytes([int(m[1], 8)]), line.split()[1]))
+            if point.startswith(prefix):
+                found.append(point)
+    return found
+
+
+def _disk_usage(path):
+    """Bytes ocupados (como du) y tamaño aparente, sin salir del sistema de archivos"""
+    top = os.lstat(path)
+    used, apparent = top.st_blocks * 512, top.st_size
+    todo = [path] if os.path.isdir(path) and not os.path.islink(path) else []
+    while todo:
+        try:
+            it = os.scandir(todo.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if st.st_dev != top.st_dev:
+                    continue
+                used += st.st_blocks * 512
+                apparent += st.st_size
+                if entry.is_dir(follow_symlinks=False):
+                    todo.append(entry.path)
+    return {'bytes': used, 'apparent': apparent}
+
+
+def _atomic_write(path, data, mode=None):
+    """Escribe en un temporal del mismo directorio y lo renombra sobre path"""
+    try:
+        old = os.stat(path)
+    except FileNotFoundError:
+        old = None
+    tmp = f"{path}.eggsmaker-tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if old is not None:
+            os.chown(tmp, old.st_uid, old.st_gid)
+        os.chmod(tmp, mode if mode is not None else (old.st_mode & 0o7777 if old else 0o644))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    dir_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class _Server:
+    def __init__(self, writer):
+        self.writer = writer
+        self.processes = {}
+
+    def send(self, message):
+        write_message(self.writer, message)
+
+    async def handle(self, message):
+        request_id = message.get('id')
+        handler = getattr(self, f"op_{message.get('op')}", None)
+        try:
+            if handler is None:
+                raise ValueError(f"Operación desconocida: {message.get('op')}")
+            result = await handler(request_id, **message.get('args', {}))
+            self.send({'id': request_id, 'ok': True, 'result': result})
+        except OSError as e:
+            self.send({'id': request_id, 'ok': False, 'error': e.strerror or str(e), 'errno': e.errno,
+                       'filename': e.filename})
+        except Exception as e:
+            self.send({'id': request_id, 'ok': False, 'error': f"{type(e).__name__}: {e}", 'errno': None})
+        await self.writer.drain()
+
+    async def op_ping(self, request_id):
+        return {'pid': os.getpid(), 'uid': os.geteuid()}
+
+    async def op_stat(self, request_id, path):
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return None
+        return {'size': st.st_size, 'mode': st.st_mode, 'uid': st.st_uid, 'gid': st.st_gid,
+                'mtime': st.st_mtime, 'is_dir': os.path.isdir(path)}
+
+    async def op_du(self, request_id, path):
+        if not os.path.lexists(path):
+            return None
+        return await asyncio.to_thread(_disk_usage, path)
+
+    async def op_read(self, request_id, path, limit=READ_LIMIT):
+        with open(path, 'rb') as f:
+            data = f.read(limit)
+        return data.decode('utf-8', 'replace')
+
+    async def op_write(self, request_id, path, data, mode=None):
+        await asyncio.to_thread(_atomic_write, path, data.encode('utf-8'), mode)
+        return True
+
+    async def op_rmtree(self, request_id, path):
+        if not os.path.lexists(path):
+            return False
+        mounts = mounts_under(path)
+        if mounts:
+            # Borrar a través de un bind mount borraría el sistema real
+            raise OSError(errno.EBUSY, f"Hay sistemas montados dentro de {path}: {', '.join(mounts)}")
+        if os.path.isdir(path) and not os.path.islink(path):
+            await asyncio.to_thread(shutil.rmtree, path)
+        else:
+            os.remove(path)
+        return True
+
+    async def op_kill(self, request_id, pids=(), pgid=None, sig=signal.SIGTERM):
+        if pgid:
+            try:
+                os.killpg(pgid, sig)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+        return True
+
+    async def op_spawn(self, request_id, argv, split_stderr=False):
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE if split_stderr else asyncio.subprocess.STDOUT,
+            start_new_session=True,
+        )
+        self.processes[request_id] = process
+        self.send({'id': request_id, 'event': 'started', 'pid': process.pid})
+
+        async def forward(stream, kind):
+            while chunk := await stream.read(OUTPUT_CHUNK):
+                self.send({'id': request_id, 'event': kind, 'data': base64.b64encode(chunk).decode()})
+                await self.writer.drain()
+
+        try:
+            streams = [forward(process.stdout, 'out')]
+            if split_stderr:
+                streams.append(forward(process.stderr, 'err'))
+            await asyncio.gather(*streams)
+            return {'rc': await process.wait()}
+        finally:
+            self.processes.pop(request_id, None)
+
+    def kill_all(self):
+        for process in self.processes.values():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+async def _serve(sock):
+    reader, writer = await asyncio.open_unix_connection(sock=sock)
+    server = _Server(writer)
+    tasks = set()
+    try:
+        while True:
+            try:
+                message = await read_message(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            task = asyncio.ensure_future(server.handle(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        # El cliente se fue: nada de lo lanzado debe seguir como root
+        server.kill_all()
+
+
+def serve():
+    """Atiende peticiones por el socket recibido como stdin hasta que se cierre"""
+    sock = socket.socket(fileno=os.dup(0))
+    # stdout es el mismo socket: que ningún print accidental corrompa el protocolo
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    asyncio.run(_serve(sock))
+
+
+# ----------- Lado cliente -----------
+
+class RemoteProcess:
+    """Proceso lanzado por el ayudante, con la parte de asyncio.subprocess.Process
+    que usa el supervisor (pid, returncode, stdout, stderr, wait, communicate)"""
+
+    def __init__(self, split_stderr):
+        loop = asyncio.get_running_loop()
+        self.pid = None
+        self.returncode = None
+        self.stdout = asyncio.StreamReader(limit=OUTPUT_CHUNK * 4, loop=loop)
+        self.stderr = asyncio.StreamReader(limit=OUTPUT_CHUNK * 4, loop=loop) if split_stderr else None
+        self.started = loop.create_future()
+        self._exited = asyncio.Event()
+
+    def _event(self, message):
+        kind = message['event']
+        if kind == 'started':
+            self.pid = message['pid']
+            if not self.started.done():
+                self.started.set_result(self.pid)
+        elif kind in ('out', 'err'):
+            stream = self.stderr if kind == 'err' and self.stderr else self.stdout
+            stream.feed_data(base64.b64decode(message['data']))
+
+    def _finish(self, message):
+        result = message.get('result') if message.get('ok') else None
+        self.returncode = result['rc'] if result else -signal.SIGKILL
+        for stream in (self.stdout, self.stderr):
+            if stream is not None:
+                stream.feed_eof()
+        if not self.started.done():
+            self.started.set_exception(_error(message))
+        self._exited.set()
+
+    async def wait(self):
+        await self._exited.wait()
+        return self.returncode
+
+    async def communicate(self, input=None):
+        out = await self.stdout.read()
+        err = await self.stderr.read() if self.stderr else b''
+        await self.wait()
+        return out, err
+
+
+def _error(message):
+    if message.get('errno') is not None:
+        if message.get('filename') is not None:
+            return OSError(message['errno'], message.get('error'), message['filename'])
+        return OSError(message['errno'], message.get('error'))
+    return RuntimeError(message.get('error') or 'El ayudante privilegiado terminó')
+
+
+class PrivHelper:
+    """Cliente del ayudante: una conexión, muchas peticiones concurrentes"""
+
+    def __init__(self):
+        self.process = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._spawns = {}
+        self._writer = None
+        self._reader_task = None
+
+    @property
+    def alive(self):
+        return self._reader_task is not None and not self._reader_task.done()
+
+    async def start(self, sudo_prefix):
+        """Lanza el ayudante anteponiendo sudo_prefix y espera su primer ping"""
+        parent, child = socket.socketpair()
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *sudo_prefix, *helper_argv(),
+                stdin=child,
+                stdout=child,
+                stderr=asyncio.subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        finally:
+            child.close()
+        reader, self._writer = await asyncio.open_unix_connection(sock=parent)
+        self._reader_task = asyncio.ensure_future(self._read_loop(reader))
+        try:
+            return await asyncio.wait_for(self.call('ping'), START_TIMEOUT)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _read_loop(self, reader):
+        try:
+            while True:
+                message = await read_message(reader)
+                request_id = message.get('id')
+                if 'event' in message:
+                    remote = self._spawns.get(request_id)
+                    if remote:
+                        remote._event(message)
+                elif request_id in self._spawns:
+                    self._spawns.pop(request_id)._finish(message)
+                elif request_id in self._pending:
+                    future = self._pending.pop(request_id)
+                    if not future.done():
+                        if message.get('ok'):
+                            future.set_result(message.get('result'))
+                        else:
+                            future.set_exception(_error(message))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            # El ayudante terminó: fallan las peticiones y los procesos pendientes
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("El ayudante privilegiado terminó"))
+            self._pending.clear()
+            for remote in self._spawns.values():
+                remote._finish({'ok': False, 'error': 'El ayudante privilegiado terminó'})
+            self._spawns.clear()
+
+    def _send(self, op, args):
+        if not self.alive:
+            raise ConnectionError("El ayudante privilegiado no está en marcha")
+        request_id = next(self._ids)
+        write_message(self._writer, {'id': request_id, 'op': op, 'args': args})
+        return request_id
+
+    async def call(self, op, **args):
+        """Petición simple: devuelve el resultado o lanza OSError/RuntimeError"""
+        future = asyncio.get_running_loop().create_future()
+        request_id = self._send(op, args)
+        self._pending[request_id] = future
+        await self._writer.drain()
+        return await future
+
+    async def spawn(self, argv, split_stderr=False):
+        """Lanza argv como root y devuelve un RemoteProcess ya arrancado"""
+        remote = RemoteProcess(split_stderr)
+        request_id = self._send('spawn', {'argv': list(argv), 'split_stderr': split_stderr})
+        self._spawns[request_id] = remote
+        await self._writer.drain()
+        await remote.started
+        return remote
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+        if self.process is not None and self.process.returncode is None:
+            await self.process.wait()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,159 @@
+"""Pruebas del motor de copia: checkpoints de reanudación, fan-out y límite de caudal.
+
+Uso: python -m pytest tests
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import copy_engine  # noqa: E402
+
+REGION = 64 * 1024  # CHECKPOINT_CHUNK reducido para no escribir cientos de MB
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def small_regions(monkeypatch):
+    monkeypatch.setattr(copy_engine, 'CHECKPOINT_CHUNK', REGION)
+    # Sin reflink, para que la copia pase siempre por el bucle con checkpoint
+    monkeypatch.setattr(copy_engine, '_try_reflink', lambda src_fd, dst_fd: False)
+
+
+def make_source(path, size):
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return data
+
+
+def interrupt_after(limit):
+    def progress(copied, total):
+        if copied >= limit:
+            raise Interrupted()
+    return progress
+
+
+def test_resume_after_partial_copy(tmp_path, small_regions):
+    src, dst = tmp_path / 'src.iso', tmp_path / 'dst.iso'
+    data = make_source(src, 5 * REGION + 1234)
+    with pytest.raises(Interrupted):
+        copy_engine.copy_file(str(src), str(dst), progress=interrupt_after(3 * REGION + 100),
+                              chunk_size=16 * 1024, resume=True)
+    # El corte deja el destino parcial y el checkpoint de las regiones completas
+    assert os.path.exists(copy_engine.checkpoint_path(str(dst)))
+
+    seen = []
+    result = copy_engine.copy_file(str(src), str(dst), progress=lambda c, t: seen.append(c),
+                                   chunk_size=16 * 1024, resume=True)
+    assert result['resumed_from'] == 3 * REGION
+    assert seen[0] == 3 * REGION
+    assert dst.read_bytes() == data
+    assert not os.path.exists(copy_engine.checkpoint_path(str(dst)))
+
+
+def test_resume_recopies_from_first_corrupt_region(tmp_path, small_regions):
+    src, dst = tmp_path / 'src.iso', tmp_path / 'dst.iso'
+    data = make_source(src, 4 * REGION)
+    with pytest.raises(Interrupted):
+        copy_engine.copy_file(str(src), str(dst), progress=interrupt_after(3 * REGION + 1),
+                              chunk_size=16 * 1024, resume=True)
+    with open(dst, 'r+b') as f:
+        f.seek(REGION + 10)
+        f.write(b'\0' if data[REGION + 10] else b'\1')
+
+    result = copy_engine.copy_file(str(src), str(dst), chunk_size=16 * 1024, resume=True,
+                                   checksum='sha256')
+    assert result['resumed_from'] == REGION
+    assert dst.read_bytes() == data
+    # El hash cubre el archivo entero aunque parte se verificó y no se copió
+    assert result['digest'] == hashlib.sha256(data).hexdigest()
+
+
+def test_checkpoint_of_another_source_is_ignored(tmp_path, small_regions):
+    src, dst = tmp_path / 'src.iso', tmp_path / 'dst.iso'
+    make_source(src, 3 * REGION)
+    with pytest.raises(Interrupted):
+        copy_engine.copy_file(str(src), str(dst), progress=interrupt_after(2 * REGION + 1),
+                              chunk_size=16 * 1024, resume=True)
+    data = make_source(src, 3 * REGION + 7)
+    result = copy_engine.copy_file(str(src), str(dst), chunk_size=16 * 1024, resume=True)
+    assert result['resumed_from'] == 0
+    assert dst.read_bytes() == data
+
+
+def test_cancel_discards_destination_and_checkpoint(tmp_path, small_regions):
+    src, dst = tmp_path / 'src.iso', tmp_path / 'dst.iso'
+    make_source(src, 4 * REGION)
+    cancel = threading.Event()
+
+    def progress(copied, total):
+        if copied >= 2 * REGION:
+            cancel.set()
+
+    with pytest.raises(copy_engine.CopyCancelled):
+        copy_engine.copy_file(str(src), str(dst), progress=progress, chunk_size=16 * 1024,
+                              resume=True, cancel=cancel)
+    assert not dst.exists()
+    assert not os.path.exists(copy_engine.checkpoint_path(str(dst)))
+
+
+def test_fanout_writes_every_destination(tmp_path):
+    src = tmp_path / 'src.iso'
+    data = make_source(src, 300 * 1024 + 5)
+    dsts = [str(tmp_path / f'dst{i}.iso') for i in range(3)]
+    seen = {}
+    results = copy_engine.copy_file_multi(str(src), dsts, chunk_size=64 * 1024, checksum='sha256',
+                                          progress=lambda i, w, t: seen.__setitem__(i, w))
+    assert [r['error'] for r in results] == [None, None, None]
+    assert seen == {0: len(data), 1: len(data), 2: len(data)}
+    digest = hashlib.sha256(data).hexdigest()
+    for dst, result in zip(dsts, results):
+        assert open(dst, 'rb').read() == data
+        assert result['digest'] == digest
+        assert open(result['checksum_file']).read().startswith(digest)
+
+
+def test_fanout_reports_a_failed_destination(tmp_path):
+    src = tmp_path / 'src.iso'
+    data = make_source(src, 200 * 1024)
+    good, bad = str(tmp_path / 'ok.iso'), str(tmp_path / 'missing' / 'x.iso')
+    results = copy_engine.copy_file_multi(str(src), [good, bad], chunk_size=64 * 1024)
+    assert results[0]['error'] is None and open(good, 'rb').read() == data
+    assert isinstance(results[1]['error'], OSError)
+
+
+def test_rate_limiter_allows_burst_then_waits(monkeypatch):
+    sleeps = []
+    now = [100.0]
+    monkeypatch.setattr(copy_engine.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(copy_engine.time, 'sleep', sleeps.append)
+    limiter = copy_engine.RateLimiter(1_000_000, burst=100_000)
+    limiter.consume(100_000)
+    assert sleeps == []
+    limiter.consume(200_000)
+    assert sleeps == [pytest.approx(0.2)]
+    # Tras un segundo sin copiar vuelve a haber una ráfaga completa, no más
+    now[0] += 1.0
+    sleeps.clear()
+    limiter.consume(100_000)
+    assert sleeps == []
+    limiter.consume(100_000)
+    assert sleeps == [pytest.approx(0.1)]
+
+
+def test_rate_limited_copy_is_slowed(tmp_path):
+    src, dst = tmp_path / 'src.iso', tmp_path / 'dst.iso'
+    data = make_source(src, 512 * 1024)
+    start = time.monotonic()
+    copy_engine.copy_file(str(src), str(dst), rate_limit=1024 * 1024)
+    # 256 KiB de ráfaga inicial y el resto a 1 MiB/s
+    assert time.monotonic() - start >= 0.2
+    assert dst.read_bytes() == data
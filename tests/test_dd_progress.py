@@ -0,0 +1,45 @@
+"""Pruebas del parser de progreso de dd de eggsmaker-web.
+
+Uso: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'eggsmaker-web'))
+
+from backend import parse_dd_progress  # noqa: E402
+
+
+def test_c_locale_below_1gb():
+    line = "123456789 bytes (123 MB, 118 MiB) copied, 2 s, 61.7 MB/s"
+    assert parse_dd_progress(line) == (123456789, 2.0)
+
+
+def test_c_locale_above_1gb():
+    line = "1234567890 bytes (1.2 GB, 1.1 GiB) copied, 20.0023 s, 61.7 MB/s"
+    assert parse_dd_progress(line) == (1234567890, 20.0023)
+
+
+def test_es_locale_below_1gb():
+    line = "123456789 bytes (123 MB, 118 MiB) copiados, 2,00123 s, 61,7 MB/s"
+    assert parse_dd_progress(line) == (123456789, 2.00123)
+
+
+def test_es_locale_above_1gb():
+    line = "1234567890 bytes (1,2 GB, 1,1 GiB) copiados, 20,0023 s, 61,7 MB/s"
+    assert parse_dd_progress(line) == (1234567890, 20.0023)
+
+
+def test_small_copy_without_parentheses():
+    assert parse_dd_progress("512 bytes copied, 0,000123 s, 4,2 MB/s") == (512, 0.000123)
+
+
+def test_progress_line_with_carriage_return_padding():
+    assert parse_dd_progress("  4194304 bytes (4,2 MB, 4,0 MiB) copiados, 1 s, 4,2 MB/s\r") == (4194304, 1.0)
+
+
+def test_non_progress_lines():
+    for line in ("", "1+0 records in", "1+0 registros leídos",
+                 "dd: error writing '/dev/sdb': No space left on device",
+                 "bytes (1,2 GB) copiados, 20 s"):
+        assert parse_dd_progress(line) is None
@@ -0,0 +1,177 @@
+"""Pruebas de logtools: índice de búsqueda, filtros y progreso de eggs produce.
+
+Uso: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import logtools  # noqa: E402
+
+
+def test_log_index_numbers_lines_across_writes():
+    index = logtools.LogIndex()
+    index.write('uno\ndos ')
+    index.write('error tres\n')
+    assert index.search('dos') == [(1, 'dos error tres')]
+    assert index.search('', severity='error') == [(1, 'dos error tres')]
+
+
+def test_log_index_evicts_oldest_lines():
+    index = logtools.LogIndex(max_lines=10)
+    for i in range(25):
+        index.write(f'linea {i} palabra{i % 3}\n')
+    assert index.first == 15
+    assert len(index.lines) == 10
+    # Las palabras de las líneas descartadas ya no están en el índice
+    assert 'linea' in index.tokens and '0' not in index.tokens and '14' not in index.tokens
+    assert all(numbers[0] >= 15 for numbers in index.tokens.values())
+
+
+def test_log_index_line_numbers_after_eviction():
+    index = logtools.LogIndex(max_lines=100)
+    for i in range(1000):
+        kind = 'error' if i % 7 == 0 else 'ok'
+        index.write(f'paso {i} {kind} archivo{i % 10}\n')
+    results = index.search('archivo3')
+    assert results == [(n, f'paso {n} {"error" if n % 7 == 0 else "ok"} archivo3')
+                       for n in range(903, 1000, 10)]
+    errors = index.search('', severity='error')
+    assert [n for n, _line in errors] == [n for n in range(900, 1000) if n % 7 == 0]
+    assert all(line.startswith(f'paso {n} ') for n, line in errors)
+    # Consulta sin palabras indexables: recorre las líneas conservadas
+    index.write('100% hecho\n')
+    assert index.search('%') == [(1000, '100% hecho')]
+
+
+def test_log_index_clear_restarts_numbering():
+    index = logtools.LogIndex(max_lines=5)
+    for i in range(12):
+        index.write(f'x{i}\n')
+    index.clear()
+    index.write('nueva\n')
+    assert index.search('nueva') == [(0, 'nueva')]
+
+
+# Extracto de `eggs produce` (Debian, xz) con líneas que mencionan las
+# herramientas sin ser su banner
+PRODUCE_OUTPUT = [
+    "\x1b[36meggs >>> \x1b[0mrsync -aq --filter='dir-merge /.gitignore' /etc/ /home/eggs/.mnt/filesystem.squashfs/etc",
+    "          4,096   0%    0.00kB/s    0:00:00",
+    "  1,234,567,890  45%   48.21MB/s    0:00:24 (xfr#1200, ir-chk=1000/2600)",
+    "usr/share/doc/xorriso/changelog.Debian.gz",
+    "usr/bin/mksquashfs",
+    "eggs >>> squashfs compression: xz -Xbcj x86",
+    "update-initramfs: Generating /home/eggs/.mnt/iso/live/initrd.img-6.1.0-18-amd64",
+    "I: The initramfs will attempt to resume from /dev/sda2",
+    "Parallel mksquashfs: Using 8 processors",
+    "Creating 4.0 filesystem on /home/eggs/.mnt/iso/live/filesystem.squashfs, block size 1048576.",
+    "\x1b[1;32m[=========/                          ]\x1b[0m 12345/45678  27%",
+    "Unrecognised xattr prefix system.posix_acl_access (xorriso handles it later)",
+    "[==================================|] 45678/45678 100%",
+    "xorriso 1.5.4 : RockRidge filesystem manipulator, libburnia project.",
+    "xorriso : UPDATE :  12.34% done",
+    "xorriso : UPDATE :  99.80% done, estimate finish Thu Mar 07 10:00:00 2024",
+]
+
+
+def test_produce_progress_follows_real_banners():
+    produce = logtools.ProduceProgress()
+    events = [(line, produce.feed(line)) for line in PRODUCE_OUTPUT]
+    stages = [(event['stage'], event['stage_percent']) for _line, event in events if event and event['changed']]
+    assert stages == [
+        ('rsync', 0.0), ('rsync', 45.0), ('initrd', 0.0), ('mksquashfs', 0.0),
+        ('mksquashfs', 27.0), ('mksquashfs', 100.0), ('xorriso', 0.0),
+        ('xorriso', 12.34), ('xorriso', 99.8),
+    ]
+    assert produce.fraction == pytest.approx(0.85 + 0.15 * 0.998)
+
+
+def test_produce_progress_ignores_decoys():
+    produce = logtools.ProduceProgress()
+    for line in ("usr/share/doc/xorriso/changelog.Debian.gz",
+                 "removing /usr/bin/mksquashfs from the snapshot",
+                 "eggs >>> squashfs compression: zstd",
+                 "copying squashfs-tools and xorriso configuration",
+                 "error: see /var/log/dracut.log"):
+        assert produce.feed(line) is None
+    assert produce.stage == 0 and produce.fraction == 0.0
+
+
+def test_produce_progress_meters_are_hidden():
+    produce = logtools.ProduceProgress()
+    produce.feed("mksquashfs /home/eggs/.mnt/filesystem.squashfs /home/eggs/.mnt/iso/live/filesystem.squashfs")
+    event = produce.feed("[====/      ] 100/400  25%")
+    assert event['meter'] and event['changed']
+    # El mismo avance otra vez: se oculta pero no cambia nada
+    event = produce.feed("[====/      ] 100/400  25%")
+    assert event['meter'] and not event['changed']
+
+
+def test_line_filter_hides_patterns_and_blank_lines():
+    line_filter = logtools.LineFilter(['remote: Total', 'Receiving objects:'])
+    assert line_filter.filter('\x1b[1;31mERROR: fallo\x1b[0m   ') == 'ERROR: fallo'
+    assert line_filter.filter('remote: Total 42 (delta 3)') is None
+    assert line_filter.filter('Receiving objects:  50% (21/42)') is None
+    assert line_filter.filter(' \x1b[0m ') is None
+    assert line_filter.shows(':: Proceed with installation? [Y/n]')
+
+
+def test_line_filter_without_patterns_only_cleans():
+    assert logtools.PLAIN.filter('\x1b[32mok\x1b[0m') == 'ok'
+    assert logtools.LineFilter(strip=False).filter('\x1b[32mok\x1b[0m') == '\x1b[32mok\x1b[0m'
+
+
+def test_installer_filter_keeps_errors():
+    for line in ('error: failed to commit transaction (conflicting files)',
+                 'ERROR: no se pudo instalar penguins-eggs',
+                 ':: Proceed with installation? [Y/n]'):
+        assert logtools.INSTALLER.shows(line)
+    assert not logtools.INSTALLER.shows('remote: Enumerating objects: 120, done.')
+
+
+@pytest.fixture
+def build_log(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    # Un índice cada pocas líneas para ejercitar varios tramos con un log chico
+    monkeypatch.setattr(logtools, 'INDEX_STRIDE', 8)
+    with logtools.BuildLog('sudo eggs produce --clone -n') as log:
+        for i in range(100):
+            log.write(f'linea {i} ñandú' if i % 10 else f'etapa {i // 10} ERROR')
+    return log.path
+
+
+def test_log_reader_lines_and_count(build_log):
+    with logtools.LogReader(build_log) as reader:
+        assert reader.line_count == 100
+        assert len(reader.offsets) == 100 // 8 + 1
+        lines = reader.lines(41, 3)
+        assert [line.split('] ', 1)[1] for line in lines] == ['linea 41 ñandú', 'linea 42 ñandú', 'linea 43 ñandú']
+        assert '[eggs produce]' in lines[0]
+        assert reader.lines(99, 10)[0].endswith('linea 99 ñandú')
+        assert reader.lines(100, 5) == []
+
+
+def test_log_reader_search_returns_line_numbers(build_log):
+    with logtools.LogReader(build_log) as reader:
+        results = reader.search('error', limit=20)
+        assert [number for number, _line in results] == list(range(0, 100, 10))
+        assert results[3][1].endswith('etapa 3 ERROR')
+        assert reader.search('error', start=55, limit=2) == results[6:8]
+        assert reader.search('ERROR', ignore_case=False, limit=1) == results[:1]
+
+
+def test_log_reader_rebuilds_missing_index(build_log):
+    with logtools.LogReader(build_log) as reader:
+        offsets = list(reader.offsets)
+    os.remove(build_log + '.idx')
+    with open(build_log, 'ab') as f:
+        f.write(b'cola sin salto final')
+    with logtools.LogReader(build_log) as reader:
+        assert list(reader.offsets) == offsets
+        assert reader.line_count == 101
+        assert reader.lines(100, 1) == ['cola sin salto final']
+        assert reader.line_at(reader.line_offset(77)) == 77
@@ -0,0 +1,38 @@
+"""Pruebas de la traducción de códigos de salida del supervisor.
+
+Uso: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import supervisor  # noqa: E402
+
+
+def test_exit_status_realtime_signal_range():
+    # 170 = 128 + 42, una señal de tiempo real sin nombre en signal.Signals
+    assert supervisor.exit_status(170) == ('failed', None)
+
+
+def test_exit_status_shell_signal():
+    assert supervisor.exit_status(137) == ('killed', 'SIGKILL')
+
+
+def test_exit_status_argv_is_plain_exit_code():
+    assert supervisor.exit_status(130, shell=False) == ('failed', None)
+    assert supervisor.exit_status(137, shell=False) == ('failed', None)
+
+
+def test_exit_status_negative_rc_is_signal():
+    assert supervisor.exit_status(-9, shell=False) == ('killed', 'SIGKILL')
+    assert supervisor.exit_status(-42) == ('killed', None)
+
+
+def test_run_exit_170(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    sup = supervisor.Supervisor()
+    result = sup.run_sync('exit 170')
+    assert (result['rc'], result['status']) == (170, 'failed')
+    result = sup.run_sync(['sh', '-c', 'exit 137'])
+    assert (result['rc'], result['status'], result['signal']) == (137, 'failed', None)